@@ -13,6 +13,10 @@
                        [--min_divergence <number>]
                        [--ovlp_resolution 'higher_score'|
                           'longer_element'|'lower_divergence']
+                       [--threads <number>]
+                       [--bgzip]
+                       [--metrics <path>|-]
+                       [--metrics-interval <seconds>]
 
                        <*.align> or <*.out>
 
@@ -32,6 +36,20 @@
         --out_prefix: prefix for all output filenames.
                         Default=input file prefix
         --log_level : verbosity of log messages.
+        --threads   : worker processes used to resolve overlap
+                        clusters.  Default=1
+        --bgzip     : write coordinate-sorted, block-gzipped
+                        *_rm.bed.gz files with a tabix index
+                        ( *_rm.bed.gz.tbi ) for region queries.
+                        Cannot be combined with --sort_criterion.
+        --metrics   : append JSON-lines throughput metrics
+                        ( per-stage timers, lines/sec,
+                        elements/sec, peak RSS and largest
+                        overlap cluster ) to this file, or
+                        to stderr for '-'.
+        --metrics-interval
+                    : seconds between progress lines in
+                        the metrics output.  Default=10
 
     Overlap Resolution:
       RepeatMasker uses a variety of methods to resolve
@@ -163,12 +181,34 @@ import time
 import datetime
 import logging
 import argparse
-import gzip
+import csv
+from collections import OrderedDict
 from operator import itemgetter, attrgetter
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from bed_index import IndexedBedWriter
+from repeatmasker_records import open_gzip
+from run_metrics import RunMetrics, add_metrics_arguments
 
 LOGGER = logging.getLogger(__name__)
 
+# Target number of annotations per batch of clusters sent to a worker
+CLUSTER_BATCH_SIZE = 20000
+
+# BED output columns ( see main() ) and the --split choices
+BED_COLUMNS = { 'chrom': 0, 'start': 1, 'stop': 2, 'family': 3, 'size': 4,
+                'strand': 5, 'class': 6, 'subclass': 7, 'diverge': 8,
+                'linkage_id': 9 }
+SPLIT_COLUMNS = { 'name': BED_COLUMNS['family'],
+                  'family': BED_COLUMNS['family'],
+                  'class': BED_COLUMNS['class'],
+                  'subclass': BED_COLUMNS['subclass'] }
+
+# Split files kept open at once, and annotations buffered across all
+# split files before they are flushed to disk
+SPLIT_MAX_OPEN = 64
+SPLIT_BUFFER_SIZE = 100000
+
 
 def _usage():
     """
@@ -199,13 +239,14 @@ def openOptGzipFile(filename, modes='r'):
         modes   :  File open modes 'r', 'rw', or 'w'
 
     Returns:
-        A file object
+        A file object.  Gzip'd files are decompressed by an
+        external igzip/pigz process when one is available.
     """
     f = open(filename, 'b'+modes)
     # First two byte signature of a gzip'd file
     if (f.read(2) == b'\x1f\x8b'):
-        f.seek(0)
-        return io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding='utf-8')
+        f.close()
+        return open_gzip(filename, 'rt')
     else:
         f.seek(0)
         return io.TextIOWrapper(f, encoding='utf-8')
@@ -378,6 +419,242 @@ def resolve_using_higher_score( cluster ):
                        cluster[j][6] -= overlap
 
 
+OVLP_RESOLVERS = { 'higher_score': resolve_using_higher_score,
+                   'longer_element': resolve_using_longer_element,
+                   'lower_divergence': resolve_using_lower_divergence }
+
+
+def find_overlap_clusters( results ):
+    """
+    find_overlap_clusters( results )
+
+    Sweep the query start sorted annotations and group
+    runs of overlapping annotations on the same sequence.
+
+    Args:
+        results :  Annotation lists sorted by query start
+
+    Returns:
+        A list of clusters, each a list of indices into
+        results.  Only clusters with more than one
+        annotation are returned.
+    """
+    clusters = []
+    last_query_seq = None
+    max_query_end = 0
+    cluster = []
+    for result_idx, result in enumerate(results):
+        query_seq = result[4]
+        query_start = result[5]
+        query_end = result[6]
+        # Overlap detection
+        if ( query_seq != last_query_seq or
+             query_start > max_query_end ):
+            if ( len(cluster) > 1 ):
+                clusters.append(cluster)
+            max_query_end = 0
+            cluster = []
+        cluster.append(result_idx)
+        if ( query_end > max_query_end ):
+            max_query_end = query_end
+        last_query_seq = query_seq
+    # Trailing case
+    if ( len(cluster) > 1 ):
+        clusters.append(cluster)
+    return clusters
+
+
+def resolve_cluster_batch( method, batch ):
+    """
+    resolve_cluster_batch( method, batch )
+
+    Resolve a batch of independent overlap clusters.
+    Runs in a worker process when --threads > 1.
+
+    Args:
+        method  :  An OVLP_RESOLVERS keyword
+        batch   :  A list of clusters of annotation lists
+
+    Returns:
+        For each cluster, the resolved ( start, end ) of
+        each annotation in the original cluster order.
+        Deleted annotations are ( 0, 0 ).
+    """
+    resolver = OVLP_RESOLVERS[method]
+    resolved = []
+    for cluster in batch:
+        resolver( cluster )
+        resolved.append([ ( annot[5], annot[6] ) for annot in cluster ])
+    return resolved
+
+
+def resolve_overlaps( results, method, threads=1, stats=None ):
+    """
+    resolve_overlaps( results, method, threads=1, stats=None )
+
+    Find the overlap clusters in the query start sorted
+    annotations and resolve each one with the given
+    method.  Clusters are independent, so with threads > 1
+    they are sent in batches to a pool of worker processes
+    and the trimmed/deleted coordinates are written back
+    into results.
+
+    Args:
+        results :  Annotation lists sorted by query start
+        method  :  An OVLP_RESOLVERS keyword
+        threads :  Number of worker processes
+        stats   :  Optional dict; 'largest_cluster' is set to
+                   the size of the largest cluster
+
+    Returns:
+        The number of clusters resolved
+    """
+    if ( method not in OVLP_RESOLVERS ):
+        raise Exception("Unknown overlap resolution keyword: " + method )
+    clusters = find_overlap_clusters( results )
+    if ( stats is not None ):
+        stats['largest_cluster'] = max([ len(cluster) for cluster in clusters ],
+                                       default=0)
+    if ( threads <= 1 or len(clusters) < 2 ):
+        resolver = OVLP_RESOLVERS[method]
+        for cluster in clusters:
+            resolver( [ results[idx] for idx in cluster ] )
+        return len(clusters)
+
+    # Batch clusters so each task carries a reasonable amount of work
+    batches = []
+    batch = []
+    batch_size = 0
+    for cluster in clusters:
+        batch.append(cluster)
+        batch_size += len(cluster)
+        if ( batch_size >= CLUSTER_BATCH_SIZE ):
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+    if ( batch ):
+        batches.append(batch)
+
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        resolved_batches = executor.map(resolve_cluster_batch,
+                                        [ method ] * len(batches),
+                                        [ [ [ results[idx] for idx in cluster ]
+                                            for cluster in batch ]
+                                          for batch in batches ])
+        for batch, resolved_batch in zip(batches, resolved_batches):
+            for cluster, resolved in zip(batch, resolved_batch):
+                for idx, ( start, end ) in zip(cluster, resolved):
+                    results[idx][5] = start
+                    results[idx][6] = end
+    return len(clusters)
+
+
+def bed_record( result ):
+    """
+    bed_record( result )
+
+    Convert a parsed RepeatMasker annotation to a BED
+    record ( see BED_COLUMNS ).  BED coordinates are
+    zero-based, half-open while RepeatMasker output is
+    1-based, fully-closed.
+
+    Args:
+        result  :  A parsed *.out/*.align annotation list
+
+    Returns:
+        A list of BED field values
+    """
+    start = result[5] - 1
+    return [ result[4], start, result[6], result[9], result[6] - start,
+             result[8], result[10], result[11], result[16], result[15] ]
+
+
+def split_bed_path( file_prefix, split_value=None, bgzip=False ):
+    """
+    split_bed_path( file_prefix, split_value=None, bgzip=False )
+
+    Args:
+        file_prefix :  Output path prefix
+        split_value :  --split value, or None for the
+                       monolithic file
+        bgzip       :  True for the indexed *.bed.gz name
+
+    Returns:
+        The BED output path
+    """
+    path = file_prefix
+    if ( split_value is not None ):
+        path += '_' + split_value
+    return path + ( '_rm.bed.gz' if bgzip else '_rm.bed' )
+
+
+class SplitBedWriter:
+    """
+    SplitBedWriter( file_prefix, max_open=SPLIT_MAX_OPEN,
+                    buffer_size=SPLIT_BUFFER_SIZE, bgzip=False )
+
+    Write BED records to one <file_prefix>_<value>_rm.bed
+    file per split value.  Records are buffered per value
+    and flushed when buffer_size records are pending in
+    total, so thousands of split values never need
+    thousands of open file descriptors: at most max_open
+    files are open at once and the least recently used
+    one is closed to make room.  With bgzip, indexed
+    *_rm.bed.gz files are written instead; these only
+    open their file while appending a compressed block
+    so they are never closed early.
+    """
+    def __init__(self, file_prefix, max_open=SPLIT_MAX_OPEN,
+                 buffer_size=SPLIT_BUFFER_SIZE, bgzip=False):
+        self.file_prefix = file_prefix
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.bgzip = bgzip
+        self.buffers = {}
+        self.buffered = 0
+        self.handles = OrderedDict()
+        self.created = set()
+
+    def write(self, split_value, record):
+        self.buffers.setdefault(split_value, []).append(record)
+        self.buffered += 1
+        if ( self.buffered >= self.buffer_size ):
+            self.flush()
+
+    def _handle(self, split_value):
+        handle = self.handles.get(split_value)
+        if ( handle is not None ):
+            self.handles.move_to_end(split_value)
+            return handle
+        if ( self.bgzip ):
+            handle = IndexedBedWriter(split_bed_path(self.file_prefix,
+                                                     split_value, True))
+            self.handles[split_value] = handle
+            return handle
+        if ( len(self.handles) >= self.max_open ):
+            self.handles.popitem(last=False)[1].close()
+        # Truncate on first use, append when reopened
+        mode = 'a' if split_value in self.created else 'w'
+        self.created.add(split_value)
+        handle = open(split_bed_path(self.file_prefix, split_value), mode,
+                      newline='')
+        self.handles[split_value] = handle
+        return handle
+
+    def flush(self):
+        for split_value, records in self.buffers.items():
+            csv.writer(self._handle(split_value), delimiter='\t',
+                       lineterminator='\n').writerows(records)
+        self.buffers = {}
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        for handle in self.handles.values():
+            handle.close()
+        self.handles.clear()
+
+
 #
 # main subroutine ( protected from import execution )
 #
@@ -415,12 +692,15 @@ def main(*args):
     parser.add_argument('-d', '--out_dir')
     parser.add_argument('-r', '--split')
     parser.add_argument('-p', '--out_prefix')
-    parser.add_argument('-m', '--min_length')
-    parser.add_argument('-t', '--min_hit_num')
-    parser.add_argument('-c', '--max_divergence')
-    parser.add_argument('-e', '--min_divergence')
+    parser.add_argument('-m', '--min_length', type=int)
+    parser.add_argument('-t', '--min_hit_num', type=int)
+    parser.add_argument('-c', '--max_divergence', type=float)
+    parser.add_argument('-e', '--min_divergence', type=float)
     parser.add_argument('-s', '--sort_criterion')
     parser.add_argument("-o", "--ovlp_resolution")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--bgzip", action='store_true')
+    add_metrics_arguments(parser)
     # Examples:
     #   e.g. -f 3
     #     parser.add_argument('-f','--foo', type=int, default=42, help='FOO!')
@@ -441,345 +721,321 @@ def main(*args):
     logging.basicConfig(format='')
     logging.getLogger().setLevel(getattr(logging, args.log_level.upper()))
     start_time = time.time()
+    metrics = RunMetrics('RM2bed_hubley', args.metrics, args.metrics_interval,
+                         input=args.rm_file, overlap_resolution=args.ovlp_resolution,
+                         threads=args.threads)
 
-    LOGGER.info("#\n# RM2Bed.py\n#")
+    # Failed runs still get their metrics summary line ( status 'error' )
+    with metrics:
+        LOGGER.info("#\n# RM2Bed.py\n#")
 
-    if ( not os.path.exists(args.rm_file) ):
-        raise Exception("File " + args.rm_file + " is missing.")
-    LOGGER.info("Data File: " + args.rm_file)
+        if ( not os.path.exists(args.rm_file) ):
+            raise Exception("File " + args.rm_file + " is missing.")
+        LOGGER.info("Data File: " + args.rm_file)
 
-    file_prefix = ""
-    if ( args.out_prefix ):
-        file_prefix = args.out_prefix
-    else:
-        fpath, fname = os.path.split(args.rm_file)
-        fname = re.sub('\.out$', '', fname, flags=re.IGNORECASE)
-        fname = re.sub('\.align$', '', fname, flags=re.IGNORECASE)
-        file_prefix = fname
-
-    if ( args.out_dir ):
-        if ( not os.path.exists(args.out_dir) ):
-            raise Exception("Directory " + args.out_dir + " does not exist.")
-        LOGGER.info("Output Directory: " + args.out_dir)
-        file_prefix = os.path.join(args.out_dir,file_prefix)
-    else:
-        LOGGER.info("Output Directory: .")
-
-    # Check ovlp_resolution keywords
-    if ( args.ovlp_resolution and args.ovlp_resolution != 'higher_score' and
-         args.ovlp_resolution != 'longer_element' and
-         args.ovlp_resolution != 'lower_divergence' ):
-        raise Exception("--ovlp_resolution keyword '" + args.ovlp_resolution + \
-                        "' not recognized.  Must be either 'higher_score', " + \
-                        "'longer_element', or 'lower_divergence'")
-
-    ##
-    ## Read in file and correct identifiers
-    ##   RepeatMasker uses the ID field to join fragments related
-    ##   to the same intregration event. In some cases ( notably
-    ##   in cluster environments ) it is easier to breakup a genome
-    ##   into pieces and run them through RepeatMasker individually
-    ##   than it is to run them all at once.  The problem with this
-    ##   is that each run restarts ID numbering at 1, making the
-    ##   combined *.out, *.align contain redundant IDs.  The code
-    ##   below detects changes in the ID number and corrects them.
-    ##
-    o_rm_file = openOptGzipFile(args.rm_file, modes='r')
-    summary_line_RE = re.compile('^\s*\d+\s+\d+\.\d+\s+\d+\.\d+')
-    results = []
-    cmax_id = 0
-    last_rm_id = 0
-    new_ids = {}
-    last_query_seq = None
-    flds = []
-    concat_results_detected = 0
-    for line in o_rm_file:
-        line = line.rstrip()
-        # Is this a *.align or *.out alignment summary line?
-        if ( summary_line_RE.match(line) ):
-            if ( flds ):
-                results.append(flds)
-            flds = line.split()
-            # Out File  :  Always 15 or 16 fields.  The 8th fields is either "C" or "+"
-            # Align File:  Forward strand has an empty 8th field while reverse strand
-            #              hits have "C" in the eighth field.  The "*" overlap
-            #              flag adds the 16th field when it exists.
-            if ( len(flds) == 15 or ( len(flds) == 16 and flds[15] == '*' )):
-              if ( len(flds) == 16 ):
-                del flds[15]
-              if ( flds[8] == 'C' ):
-                  flds[8] = '-'
-              elif ( flds[8] == '+' ):
-                  flds[8] = '+'
-              else:
-                raise Exception("Orientation of RepeatMasker line is unexpected: " + flds[8] )
-            elif ( len(flds) == 14 ):
-              flds.insert(8,'+')
-            else:
-              raise Exception("Field count of RepeatMasker line is unexpected: " + str(len(flds)) )
-            #
-            # Alignment files do not breakup RM identifiers name#type/class
-            # into two fields like the *.out files do.  Here we throw out the
-            # *.align RM stage identifer column ('m_b#s#i#' or 'c_b#s#i#' )
-            # and replace it with the type/class broken out from the combined
-            # id.  In this way the datastructure should be the same for both
-            # *.out and *.align files.
-            if ( 'm_b' in flds[13] or 'c_b' in flds[13] ):
-                del flds[13]
-                # Alignment file
-                if ( '#' in flds[9] ):
-                    # name#class/subclass form
-                    name, classification = flds[9].split("#")
-                    flds[9] = name
-                    flds.insert(10,classification)
-                else:
-                    # class/subclass are not defined
-                    flds.insert(10,'unknown')
-
-            # Now breakup the class/subclass into their own columns
-            if ( '/' in flds[10] ):
-                rmclass, rmsubclass = flds[10].split("/")
-                flds[10] = rmclass
-                flds.insert(11,rmsubclass)
-            else:
-                flds.insert(11,'unknown')
-
-            # Fix ID numbers
-            #  Two ways this can renumber IDs.  First if the sequence changes
-            #  it cannot join fragments between sequences so this can be used
-            #  as a natural ID boundary.  The second way we keep the IDs unique
-            #  is to detect a fall of over 50 in the ID value coinciding with
-            #  a startover of the ID magnitude.
-            query_seq = flds[4]
-            if ( len(flds) < 16 ):
-                print (line)
-            rm_id = int(flds[15])
-            if ( query_seq != last_query_seq or
-                ( rm_id < last_rm_id - 50 and rm_id < 3 ) ):
-                if ( query_seq == last_query_seq ):
-                    concat_results_detected = 1
-                new_ids = {}
-            last_rm_id = rm_id
-            last_query_seq = query_seq
-            if ( rm_id in new_ids ):
-                flds[15] = new_ids[rm_id]
-            else:
-               cmax_id += 1
-               new_ids[rm_id] = cmax_id
-               flds[15] = cmax_id
-
-            # Convert integer/float fields to native types
-            #   -- Do not convert family coordinates as they are not used
-            flds[0] = int(flds[0])   # score
-            flds[1] = float(flds[1]) # pct mismatch
-            flds[2] = float(flds[2]) # pct deletions
-            flds[3] = float(flds[3]) # pct insertions
-            flds[5] = int(flds[5])   # query start
-            flds[6] = int(flds[6])   # query end
-            # query remaininig
-            flds[7] = int(flds[7].replace('(','').replace(')',''))
-
-            # Finally, create a default divergence column col16
-            flds.append(-1.0);
-
-        elif( line.startswith("Kimura") ):
-            kDiv = float(line.split('= ')[1])
-            flds[16] = kDiv
-    if ( flds ):
-        results.append(flds)
-    o_rm_file.close()
-    results = sorted(results, key=itemgetter(5))
-    LOGGER.info("Data File Stats:")
-    LOGGER.info("   Annotation Lines: " + str(len(results)))
-    LOGGER.info("   Insertions (joined frags): " + str(cmax_id))
-    if ( concat_results_detected ):
-      LOGGER.info("   Info: Concatenated result file detected")
-
-    # Overlap Resolution
-    #  - Idea here is that it's faster to use the sorted (by query start)
-    #    list produced above to identify clusters of potentially overlapping
-    #    annotations first.  Then take that cluster and send it off to a
-    #    one of several routines that implement various resolution rules.
-    if ( args.ovlp_resolution ):
-        LOGGER.info("Overlap Resolution:")
-        LOGGER.info("   Method: " + args.ovlp_resolution)
+        file_prefix = ""
+        if ( args.out_prefix ):
+            file_prefix = args.out_prefix
+        else:
+            fpath, fname = os.path.split(args.rm_file)
+            fname = re.sub('\.out$', '', fname, flags=re.IGNORECASE)
+            fname = re.sub('\.align$', '', fname, flags=re.IGNORECASE)
+            file_prefix = fname
+
+        if ( args.out_dir ):
+            if ( not os.path.exists(args.out_dir) ):
+                raise Exception("Directory " + args.out_dir + " does not exist.")
+            LOGGER.info("Output Directory: " + args.out_dir)
+            file_prefix = os.path.join(args.out_dir,file_prefix)
+        else:
+            LOGGER.info("Output Directory: .")
+
+        # Check ovlp_resolution keywords
+        if ( args.ovlp_resolution and args.ovlp_resolution != 'higher_score' and
+             args.ovlp_resolution != 'longer_element' and
+             args.ovlp_resolution != 'lower_divergence' ):
+            raise Exception("--ovlp_resolution keyword '" + args.ovlp_resolution + \
+                            "' not recognized.  Must be either 'higher_score', " + \
+                            "'longer_element', or 'lower_divergence'")
+
+        ##
+        ## Read in file and correct identifiers
+        ##   RepeatMasker uses the ID field to join fragments related
+        ##   to the same intregration event. In some cases ( notably
+        ##   in cluster environments ) it is easier to breakup a genome
+        ##   into pieces and run them through RepeatMasker individually
+        ##   than it is to run them all at once.  The problem with this
+        ##   is that each run restarts ID numbering at 1, making the
+        ##   combined *.out, *.align contain redundant IDs.  The code
+        ##   below detects changes in the ID number and corrects them.
+        ##
+        metrics.begin('parse')
+        o_rm_file = openOptGzipFile(args.rm_file, modes='r')
+        summary_line_RE = re.compile('^\s*\d+\s+\d+\.\d+\s+\d+\.\d+')
+        results = []
+        cmax_id = 0
+        last_rm_id = 0
+        new_ids = {}
         last_query_seq = None
-        max_query_end = 0
-        cluster = []
-        result_idx = -1
-        for result in results:
-            result_idx += 1
-            query_seq = result[4]
-            query_start = result[5]
-            query_end = result[6]
-            # Overlap detection
-            if ( query_seq != last_query_seq or
-                 query_start > max_query_end ):
-                if ( len(cluster) > 1 ):
-                    if ( args.ovlp_resolution == 'higher_score' ):
-                        resolve_using_higher_score( cluster )
-                    elif ( args.ovlp_resolution == 'longer_element' ):
-                        resolve_using_longer_element( cluster )
-                    elif ( args.ovlp_resolution == 'lower_divergence' ):
-                        resolve_using_lower_divergence( cluster )
+        flds = []
+        concat_results_detected = 0
+        line_num = 0
+        for line_num, line in enumerate(o_rm_file, 1):
+            if ( line_num % 100000 == 0 ):
+                metrics.update(lines=line_num, elements=len(results))
+            line = line.rstrip()
+            # Is this a *.align or *.out alignment summary line?
+            if ( summary_line_RE.match(line) ):
+                if ( flds ):
+                    results.append(flds)
+                flds = line.split()
+                # Out File  :  Always 15 or 16 fields.  The 8th fields is either "C" or "+"
+                # Align File:  Forward strand has an empty 8th field while reverse strand
+                #              hits have "C" in the eighth field.  The "*" overlap
+                #              flag adds the 16th field when it exists.
+                if ( len(flds) == 15 or ( len(flds) == 16 and flds[15] == '*' )):
+                  if ( len(flds) == 16 ):
+                    del flds[15]
+                  if ( flds[8] == 'C' ):
+                      flds[8] = '-'
+                  elif ( flds[8] == '+' ):
+                      flds[8] = '+'
+                  else:
+                    raise Exception("Orientation of RepeatMasker line is unexpected: " + flds[8] )
+                elif ( len(flds) == 14 ):
+                  flds.insert(8,'+')
+                else:
+                  raise Exception("Field count of RepeatMasker line is unexpected: " + str(len(flds)) )
+                #
+                # Alignment files do not breakup RM identifiers name#type/class
+                # into two fields like the *.out files do.  Here we throw out the
+                # *.align RM stage identifer column ('m_b#s#i#' or 'c_b#s#i#' )
+                # and replace it with the type/class broken out from the combined
+                # id.  In this way the datastructure should be the same for both
+                # *.out and *.align files.
+                if ( 'm_b' in flds[13] or 'c_b' in flds[13] ):
+                    del flds[13]
+                    # Alignment file
+                    if ( '#' in flds[9] ):
+                        # name#class/subclass form
+                        name, classification = flds[9].split("#")
+                        flds[9] = name
+                        flds.insert(10,classification)
                     else:
-                        raise Exception("Unknown overlap resolution keyword: " \
-                                        + args.ovlp_resolution )
-                max_query_end = 0
-                cluster = []
-            cluster.append(result)
-            if ( query_end > max_query_end ):
-                max_query_end = query_end
-            last_query_seq = query_seq
-        # Trailing case
-        if ( cluster and len(cluster) > 1 ):
-               if ( args.ovlp_resolution == 'higher_score' ):
-                   resolve_using_higher_score( cluster )
-               elif ( args.ovlp_resolution == 'longer_element' ):
-                   resolve_using_longer_element( cluster )
-               elif ( args.ovlp_resolution == 'lower_divergence' ):
-                   resolve_using_lower_divergence( cluster )
-               elif ( args.ovlp_resolution == 'first_element' ):
-                   resolve_using_first_element( cluster )
-               elif ( args.ovlp_resolution == 'split_between' ):
-                   resolve_using_split_between( cluster )
-               else:
-                   raise Exception("Unknown overlap resolution keyword: " \
-                                   + args.ovlp_resolution )
-    else:
-        LOGGER.info("Overlap Resolution: Keep overlapping annotations")
-
-    # Create a pandas dataframe ... probably not necessary, but it does
-    # provide some useful filtering functionality
-    annot_dataframe = pd.DataFrame(results, columns=['score',
-        'pct_mismatches', 'pct_deletions', 'pct_insertions', 'chrom', 'start',
-        'stop', 'score', 'strand', 'family', 'class', 'subclass', 'unused1',
-        'unused2', 'unused3', 'linkage_id', 'diverge'])
-
-    if ( args.ovlp_resolution ):
-        # Filter out deleted overlapping annotations.  They are currently
-        # marked with query_start = 0 and query_end = 0
-        annot_dataframe = annot_dataframe[(annot_dataframe['start'] != 0) & \
-                                          (annot_dataframe['stop'] != 0)]
-        LOGGER.info("   Remaining annotations: " + str(len(annot_dataframe.index)))
-
-    # BED File coordinates are zero-based, half-open.  RepeatMasker
-    # output is 1-based, fully-closed.  Convert to BED coordinates
-    annot_dataframe['start'] = annot_dataframe['start'].subtract(1)
-
-    # Size calculated from BED style coordinates
-    annot_dataframe['size'] = annot_dataframe['stop'].subtract(annot_dataframe['start'])
-
-    # Columns used for BED output
-    #  Field         Desc
-    #  ----------    -----------------------------------
-    #  sequence      Input sequence
-    #  start         Start position 0-based
-    #  end           End position 0-based, half-open
-    #  family        TE Family Name
-    #  score         Raw score from RepeatMasker
-    #  orientation   "+"/"-" for forward/reverse strand
-    #  class         RepeatMasker Class
-    #  subclass      RepeatMasker subclass or "undefined"
-    #  divergence    Kimura divergence from *.align file
-    #  linkage_id    ID column from RepeatMasker output
-    # Simple repeats do not have a divergence calculated
-    # for them.  Currently this is marked with the sentinel
-    # '-1.0'.
-    annot_dataframe = annot_dataframe[['chrom', 'start', 'stop', 'family', 'size', \
-                           'strand', 'class', 'subclass', 'diverge', \
-                           'linkage_id']]
-
-    # Filter by minimum length
-    if ( args.min_length ):
-        annot_dataframe = annot_dataframe[annot_dataframe['size'] >= args.min_length]
-
-    # Sort main output if asked.
-    if ( args.sort_criterion ):
-        LOGGER.info("Sorting By:" + args.sort_criterion)
-        if args.sort_criterion in ['family', 'class', 'subclass']:
-            annot_dataframe = annot_dataframe.sort_values([args.sort_criterion])
-        elif args.sort_criterion in ['size']:
-            annot_dataframe = annot_dataframe.sort_values([args.sort_criterion], ascending = [0])
-        elif args.sort_criterion in ['diverge']:
-            annot_dataframe = annot_dataframe.sort_values([args.sort_criterion], ascending = [1])
-        else:
-            raise Exception("Invalid sort criterion: " + args.sort_criterion + \
-                  ".  Choices are size, family, class, subclass, or " + \
-                  "diverge.")
-        #log
-
-    # Announce max hits limit
-    #if HITS is not None:
-    #    print('Will only output files with at least ' + str(HITS) + ' hits.')
-
-    if ( args.min_length or args.max_divergence
-         or args.min_divergence ):
-        LOGGER.info("Filtering By:")
-
-    # Apply min length filter if requested
-    if ( args.min_length ):
-        before_cnt = len(annot_dataframe.index)
-        annot_dataframe = annot_dataframe[annot_dataframe['size'] >= args.min_length]
-        cnt_removed = before_cnt - len(annot_dataframe.index)
-        LOGGER.info("   Min Length " + str(args.min_length) + \
-                    ": Removed " + str(cnt_removed) + " annotations")
-
-    # Apply max divergence if requested
-    if ( args.max_divergence):
-        before_cnt = len(annot_dataframe.index)
-        annot_dataframe = annot_dataframe[annot_dataframe['diverge'] <= float(args.max_divergence)]
-        cnt_removed = before_cnt - len(annot_dataframe.index)
-        LOGGER.info("   Max Divergence " + str(args.max_divergence) + \
-                    ": Removed " + str(cnt_removed) + " annotations")
-
-    # Apply min divergence if requested
-    if ( args.min_divergence ):
-        before_cnt = len(annot_dataframe.index)
-        annot_dataframe = annot_dataframe[annot_dataframe['diverge'] >= args.min_divergence]
-        cnt_removed = before_cnt - len(annot_dataframe.index)
-        LOGGER.info("   Min Divergence " + str(args.min_divergence) + \
-                    ": Removed " + str(cnt_removed) + " annotations")
-
-    if ( args.min_length or args.max_divergence
-         or args.min_divergence ):
-        LOGGER.info("   Remaining Annotations: " + str(len(annot_dataframe.index)))
-
-    # Split into files if asked. Also check to see if there is a minumum
-    # hit number and act accordingly.
-    if ( args.split ):
-        LOGGER.info("Split files by: " + args.split)
-        if ( args.split in ['name', 'family', 'class'] ):
-            clustered = annot_dataframe.sort_values([args.split])
-            for split_value in clustered[args.split].unique():
-                if args.min_hit_num is not None:
-                    clustered_W = clustered[clustered[args.split]==split_value]
-                    count_row = clustered_W.shape[0]
-                    if count_row >= args.min_hit_num:
-                        LOGGER.info("  Creating: " + file_prefix + '_' + \
-                                    split_value + '_rm.bed' )
-                        clustered_W.to_csv(file_prefix + '_' + split_value + '_rm.bed',
-                                           sep='\t', header=False, index=False)
+                        # class/subclass are not defined
+                        flds.insert(10,'unknown')
+
+                # Now breakup the class/subclass into their own columns
+                if ( '/' in flds[10] ):
+                    rmclass, rmsubclass = flds[10].split("/")
+                    flds[10] = rmclass
+                    flds.insert(11,rmsubclass)
+                else:
+                    flds.insert(11,'unknown')
+
+                # Fix ID numbers
+                #  Two ways this can renumber IDs.  First if the sequence changes
+                #  it cannot join fragments between sequences so this can be used
+                #  as a natural ID boundary.  The second way we keep the IDs unique
+                #  is to detect a fall of over 50 in the ID value coinciding with
+                #  a startover of the ID magnitude.
+                query_seq = flds[4]
+                if ( len(flds) < 16 ):
+                    print (line)
+                rm_id = int(flds[15])
+                if ( query_seq != last_query_seq or
+                    ( rm_id < last_rm_id - 50 and rm_id < 3 ) ):
+                    if ( query_seq == last_query_seq ):
+                        concat_results_detected = 1
+                    new_ids = {}
+                last_rm_id = rm_id
+                last_query_seq = query_seq
+                if ( rm_id in new_ids ):
+                    flds[15] = new_ids[rm_id]
                 else:
-                    clustered_W = clustered[clustered[args.split]==split_value]
-                    LOGGER.info("  Creating: " + file_prefix + '_' + \
-                                split_value + '_rm.bed' )
-                    clustered_W.to_csv(file_prefix + '_' + split_value + '_rm.bed',
-                                       sep='\t', header=False, index=False)
+                   cmax_id += 1
+                   new_ids[rm_id] = cmax_id
+                   flds[15] = cmax_id
+
+                # Convert integer/float fields to native types
+                #   -- Do not convert family coordinates as they are not used
+                flds[0] = int(flds[0])   # score
+                flds[1] = float(flds[1]) # pct mismatch
+                flds[2] = float(flds[2]) # pct deletions
+                flds[3] = float(flds[3]) # pct insertions
+                flds[5] = int(flds[5])   # query start
+                flds[6] = int(flds[6])   # query end
+                # query remaininig
+                flds[7] = int(flds[7].replace('(','').replace(')',''))
+
+                # Finally, create a default divergence column col16
+                flds.append(-1.0);
+
+            elif( line.startswith("Kimura") ):
+                kDiv = float(line.split('= ')[1])
+                flds[16] = kDiv
+        if ( flds ):
+            results.append(flds)
+        o_rm_file.close()
+        results = sorted(results, key=itemgetter(5))
+        metrics.update(lines=line_num, elements=len(results))
+        metrics.end()
+        LOGGER.info("Data File Stats:")
+        LOGGER.info("   Annotation Lines: " + str(len(results)))
+        LOGGER.info("   Insertions (joined frags): " + str(cmax_id))
+        if ( concat_results_detected ):
+          LOGGER.info("   Info: Concatenated result file detected")
+
+        # Overlap Resolution
+        #  - Idea here is that it's faster to use the sorted (by query start)
+        #    list produced above to identify clusters of potentially overlapping
+        #    annotations first.  Then take that cluster and send it off to a
+        #    one of several routines that implement various resolution rules.
+        metrics.begin('resolve')
+        if ( args.ovlp_resolution ):
+            LOGGER.info("Overlap Resolution:")
+            LOGGER.info("   Method: " + args.ovlp_resolution)
+            LOGGER.info("   Threads: " + str(args.threads))
+            stats = {}
+            num_clusters = resolve_overlaps( results, args.ovlp_resolution,
+                                             args.threads, stats )
+            metrics.cluster(stats['largest_cluster'])
+            LOGGER.info("   Overlap Clusters: " + str(num_clusters))
         else:
-            print('Splitting options are by name, family, and class.')
-
-    # Write as monolithic file
-    LOGGER.info("Creating: " + file_prefix + '_rm.bed' )
-    annot_dataframe.to_csv(file_prefix + '_rm.bed', sep='\t', header=False, index=False)
-
+            LOGGER.info("Overlap Resolution: Keep overlapping annotations")
+
+        if ( args.ovlp_resolution ):
+            # Filter out deleted overlapping annotations.  They are currently
+            # marked with query_start = 0 and query_end = 0
+            results = [ result for result in results
+                        if result[5] != 0 and result[6] != 0 ]
+            LOGGER.info("   Remaining annotations: " + str(len(results)))
+        metrics.count(resolved=len(results))
+        metrics.end()
+
+        # Columns used for BED output
+        #  Field         Desc
+        #  ----------    -----------------------------------
+        #  sequence      Input sequence
+        #  start         Start position 0-based
+        #  end           End position 0-based, half-open
+        #  family        TE Family Name
+        #  size          Size of the annotation ( end - start )
+        #  orientation   "+"/"-" for forward/reverse strand
+        #  class         RepeatMasker Class
+        #  subclass      RepeatMasker subclass or "undefined"
+        #  divergence    Kimura divergence from *.align file
+        #  linkage_id    ID column from RepeatMasker output
+        # Simple repeats do not have a divergence calculated
+        # for them.  Currently this is marked with the sentinel
+        # '-1.0'.
+        metrics.begin('filter')
+        annots = [ bed_record(result) for result in results ]
+        results = None
+
+        # Sort main output if asked.
+        if ( args.bgzip and args.sort_criterion ):
+            raise Exception("--sort_criterion cannot be combined with --bgzip; " + \
+                            "indexed output is always sorted by sequence and start.")
+        if ( args.bgzip ):
+            annots.sort(key=itemgetter(BED_COLUMNS['chrom'], BED_COLUMNS['start']))
+        elif ( args.sort_criterion ):
+            LOGGER.info("Sorting By:" + args.sort_criterion)
+            if args.sort_criterion in ['family', 'class', 'subclass']:
+                annots.sort(key=itemgetter(BED_COLUMNS[args.sort_criterion]))
+            elif args.sort_criterion in ['size']:
+                annots.sort(key=itemgetter(BED_COLUMNS['size']), reverse=True)
+            elif args.sort_criterion in ['diverge']:
+                annots.sort(key=itemgetter(BED_COLUMNS['diverge']))
+            else:
+                raise Exception("Invalid sort criterion: " + args.sort_criterion + \
+                      ".  Choices are size, family, class, subclass, or " + \
+                      "diverge.")
+
+        if ( args.min_length or args.max_divergence
+             or args.min_divergence ):
+            LOGGER.info("Filtering By:")
+
+        # Apply min length filter if requested
+        if ( args.min_length ):
+            before_cnt = len(annots)
+            annots = [ annot for annot in annots
+                       if annot[BED_COLUMNS['size']] >= args.min_length ]
+            cnt_removed = before_cnt - len(annots)
+            LOGGER.info("   Min Length " + str(args.min_length) + \
+                        ": Removed " + str(cnt_removed) + " annotations")
+
+        # Apply max divergence if requested
+        if ( args.max_divergence):
+            before_cnt = len(annots)
+            annots = [ annot for annot in annots
+                       if annot[BED_COLUMNS['diverge']] <= args.max_divergence ]
+            cnt_removed = before_cnt - len(annots)
+            LOGGER.info("   Max Divergence " + str(args.max_divergence) + \
+                        ": Removed " + str(cnt_removed) + " annotations")
+
+        # Apply min divergence if requested
+        if ( args.min_divergence ):
+            before_cnt = len(annots)
+            annots = [ annot for annot in annots
+                       if annot[BED_COLUMNS['diverge']] >= args.min_divergence ]
+            cnt_removed = before_cnt - len(annots)
+            LOGGER.info("   Min Divergence " + str(args.min_divergence) + \
+                        ": Removed " + str(cnt_removed) + " annotations")
+
+        if ( args.min_length or args.max_divergence
+             or args.min_divergence ):
+            LOGGER.info("   Remaining Annotations: " + str(len(annots)))
+
+        # Split into files if asked. Also check to see if there is a minumum
+        # hit number and act accordingly.  Every annotation is routed to its
+        # split file and to the monolithic file in a single pass.
+        split_col = None
+        split_values = set()
+        if ( args.split ):
+            LOGGER.info("Split files by: " + args.split)
+            if ( args.split in SPLIT_COLUMNS ):
+                split_col = SPLIT_COLUMNS[args.split]
+                split_counts = {}
+                for annot in annots:
+                    split_value = annot[split_col]
+                    split_counts[split_value] = split_counts.get(split_value, 0) + 1
+                for split_value in sorted(split_counts):
+                    if ( args.min_hit_num is None or
+                         split_counts[split_value] >= args.min_hit_num ):
+                        LOGGER.info("  Creating: " + \
+                                    split_bed_path(file_prefix, split_value, args.bgzip) )
+                        split_values.add(split_value)
+            else:
+                print('Splitting options are by name, family, class, and subclass.')
 
-    #
-    # Remaining main() code
-    #
+        metrics.count(kept=len(annots))
+        metrics.end()
 
-    end_time = time.time()
-    LOGGER.info("Run time: " + str(datetime.timedelta(seconds=end_time-start_time)))
+        # Write as monolithic file
+        metrics.begin('write')
+        LOGGER.info("Creating: " + split_bed_path(file_prefix, bgzip=args.bgzip) )
+        split_writer = SplitBedWriter(file_prefix, bgzip=args.bgzip)
+        if ( args.bgzip ):
+            bed_file = IndexedBedWriter(split_bed_path(file_prefix, bgzip=True))
+        else:
+            bed_file = open(split_bed_path(file_prefix), 'w', newline='')
+        with bed_file:
+            bed_writer = csv.writer(bed_file, delimiter='\t', lineterminator='\n')
+            for annot in annots:
+                bed_writer.writerow(annot)
+                if ( split_col is not None and annot[split_col] in split_values ):
+                    split_writer.write(annot[split_col], annot)
+        split_writer.close()
+        metrics.end()
+
+
+        #
+        # Remaining main() code
+        #
+
+        end_time = time.time()
+        LOGGER.info("Run time: " + str(datetime.timedelta(seconds=end_time-start_time)))
 
 
 #
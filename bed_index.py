@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Block-gzipped (BGZF) BED output with a tabix-compatible coordinate index.
+
+IndexedBedWriter writes coordinate-sorted BED lines to a .bed.gz file made of
+independent BGZF blocks and builds the matching .tbi index (the binning and
+linear index used by tabix/htslib) as it goes, so downstream tools can seek to
+one scaffold or region instead of decompressing the whole file. The output is
+valid gzip, so zcat and pandas still read it in full, and tabix, pysam and
+query_bed() can fetch regions from it.
+
+Coordinates follow BED: 0-based, half-open. The index uses the standard
+14-bit minimum bin size and depth 5, which limits scaffolds to 2^29 bp.
+"""
+
+import gzip
+import struct
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Uncompressed bytes per BGZF block (as in htslib) and the empty end-of-file block
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+BGZF_HEADER = struct.Struct('<4BI2BH2BHH')
+BGZF_COMPRESS_LEVEL = 6
+
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+TBI_MAX_END = 1 << (TBI_MIN_SHIFT + 3 * TBI_DEPTH)
+# tabix preset for BED: sequence, begin and end in columns 1-3, 0-based
+# half-open coordinates (the UCSC flag), '#' comment lines
+TBX_UCSC = 0x10000
+TBI_BED_CONF = (TBX_UCSC, 1, 2, 3, ord('#'), 0)
+
+
+def index_path(bed_path: str) -> str:
+    """Path of the .tbi index of a .bed.gz file"""
+    return bed_path + '.tbi'
+
+
+def reg2bin(beg: int, end: int) -> int:
+    """Smallest bin that contains [beg, end)"""
+    end -= 1
+    for level in range(TBI_DEPTH, 0, -1):
+        shift = TBI_MIN_SHIFT + 3 * (TBI_DEPTH - level)
+        if beg >> shift == end >> shift:
+            return ((1 << 3 * level) - 1) // 7 + (beg >> shift)
+    return 0
+
+
+def reg2bins(beg: int, end: int) -> List[int]:
+    """All bins that may hold records overlapping [beg, end)"""
+    bins = [0]
+    end -= 1
+    for level in range(1, TBI_DEPTH + 1):
+        shift = TBI_MIN_SHIFT + 3 * (TBI_DEPTH - level)
+        offset = ((1 << 3 * level) - 1) // 7
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+class BgzfWriter:
+    """
+    Writes bytes as BGZF blocks. The file is only opened while a finished block
+    is appended, so many writers can be active without holding descriptors.
+    """
+    def __init__(self, path: str, level: int = BGZF_COMPRESS_LEVEL):
+        self.path = path
+        self.level = level
+        self.buffer = bytearray()
+        self.block_offset = 0
+        with open(path, 'wb'):
+            pass
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= BGZF_BLOCK_SIZE:
+            blocks = []
+            while len(self.buffer) >= BGZF_BLOCK_SIZE:
+                blocks.append(self._block(self.buffer[:BGZF_BLOCK_SIZE]))
+                del self.buffer[:BGZF_BLOCK_SIZE]
+            self._append(b''.join(blocks))
+
+    def tell(self) -> int:
+        """Virtual offset of the next byte: compressed block offset << 16 | offset within the block"""
+        return self.block_offset << 16 | len(self.buffer)
+
+    def _block(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        payload = compressor.compress(bytes(data)) + compressor.flush()
+        block = b''.join((
+            BGZF_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(payload) + 25),
+            payload,
+            struct.pack('<II', zlib.crc32(data), len(data)),
+        ))
+        self.block_offset += len(block)
+        return block
+
+    def _append(self, data: bytes):
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def close(self):
+        """Write the remaining data and the end-of-file marker block"""
+        data = self._block(self.buffer) if self.buffer else b''
+        self.buffer = bytearray()
+        self._append(data + BGZF_EOF)
+
+
+class TabixIndexBuilder:
+    """Builds a tabix index from records added in coordinate-sorted order"""
+    def __init__(self):
+        self.names = []
+        self.bins = []
+        self.linear = []
+        self.current = None
+        self.last_beg = 0
+
+    def add(self, chrom: str, beg: int, end: int, voffset_beg: int, voffset_end: int):
+        """Index one record. Raises ValueError if records are not sorted by scaffold and start."""
+        if chrom != self.current:
+            if chrom in self.names:
+                raise ValueError(f"scaffold {chrom} is not contiguous; BED must be sorted by scaffold and start")
+            self.names.append(chrom)
+            self.bins.append({})
+            self.linear.append([])
+            self.current = chrom
+            self.last_beg = 0
+        if beg < self.last_beg:
+            raise ValueError(f"{chrom}:{beg} follows {chrom}:{self.last_beg}; BED must be sorted by start")
+        if end > TBI_MAX_END:
+            raise ValueError(f"{chrom}:{end} is beyond the {TBI_MAX_END} bp limit of a tabix index")
+        self.last_beg = beg
+        end = max(end, beg + 1)
+
+        chunks = self.bins[-1].setdefault(reg2bin(beg, end), [])
+        if chunks and chunks[-1][1] == voffset_beg:
+            chunks[-1][1] = voffset_end
+        else:
+            chunks.append([voffset_beg, voffset_end])
+
+        linear = self.linear[-1]
+        last_window = (end - 1) >> TBI_MIN_SHIFT
+        if len(linear) <= last_window:
+            linear.extend([None] * (last_window + 1 - len(linear)))
+        for window in range(beg >> TBI_MIN_SHIFT, last_window + 1):
+            if linear[window] is None:
+                linear[window] = voffset_beg
+
+    def write(self, path: str):
+        """Write the BGZF-compressed .tbi file"""
+        names = b''.join(name.encode() + b'\0' for name in self.names)
+        parts = [b'TBI\1', struct.pack('<i', len(self.names)),
+                 struct.pack('<6i', *TBI_BED_CONF), struct.pack('<i', len(names)), names]
+        for bins, linear in zip(self.bins, self.linear):
+            parts.append(struct.pack('<i', len(bins)))
+            for bin_id in sorted(bins):
+                chunks = bins[bin_id]
+                parts.append(struct.pack('<Ii', bin_id, len(chunks)))
+                parts.extend(struct.pack('<QQ', beg, end) for beg, end in chunks)
+            # Windows without a record start take the previous window's offset
+            offsets = []
+            previous = 0
+            for offset in linear:
+                previous = previous if offset is None else offset
+                offsets.append(previous)
+            parts.append(struct.pack(f'<i{len(offsets)}Q', len(offsets), *offsets))
+        writer = BgzfWriter(path)
+        writer.write(b''.join(parts))
+        writer.close()
+
+
+class IndexedBedWriter:
+    """
+    Text-mode writer for a coordinate-sorted .bed.gz and its .tbi index. Lines
+    may be written whole or in pieces (e.g. by csv.writer); the index is
+    written on close().
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.bgzf = BgzfWriter(path)
+        self.index = TabixIndexBuilder()
+        self.pending = ''
+
+    def write(self, text: str) -> int:
+        lines = (self.pending + text).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self._write_line(line)
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _write_line(self, line: str):
+        voffset_beg = self.bgzf.tell()
+        self.bgzf.write(line.encode() + b'\n')
+        if not line or line.startswith('#'):
+            return
+        fields = line.split('\t', 3)
+        try:
+            chrom, beg, end = fields[0], int(fields[1]), int(fields[2])
+        except (IndexError, ValueError):
+            raise ValueError(f"{self.path}: not a BED line: {line!r}")
+        self.index.add(chrom, beg, end, voffset_beg, self.bgzf.tell())
+
+    def close(self):
+        if self.pending:
+            self._write_line(self.pending)
+            self.pending = ''
+        self.bgzf.close()
+        self.index.write(index_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BgzfReader:
+    """Random access to the decompressed bytes of a BGZF file by virtual offset"""
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        self.block_offset = -1
+        self.next_block_offset = 0
+        self.data = b''
+        self.within = 0
+
+    def _load(self, block_offset: int):
+        if block_offset == self.block_offset:
+            return
+        self.file.seek(block_offset)
+        header = self.file.read(BGZF_HEADER.size)
+        if not header:
+            self.block_offset, self.next_block_offset, self.data = block_offset, block_offset, b''
+            return
+        fields = BGZF_HEADER.unpack(header)
+        if fields[:2] != (0x1f, 0x8b) or fields[8:10] != (66, 67):
+            raise ValueError(f"{self.file.name} is not a BGZF file")
+        block_size = fields[11] + 1
+        payload = self.file.read(block_size - BGZF_HEADER.size)
+        self.data = zlib.decompress(payload[:-8], -15)
+        self.block_offset = block_offset
+        self.next_block_offset = block_offset + block_size
+
+    def seek(self, voffset: int):
+        self._load(voffset >> 16)
+        self.within = voffset & 0xffff
+
+    def tell(self) -> int:
+        return self.block_offset << 16 | self.within
+
+    def readline(self) -> bytes:
+        """Next line including its newline, or b'' at end of file"""
+        parts = []
+        while True:
+            if self.within >= len(self.data):
+                if self.next_block_offset == self.block_offset:
+                    break
+                self._load(self.next_block_offset)
+                self.within = 0
+                if not self.data:
+                    if self.next_block_offset == self.block_offset:
+                        break
+                    continue
+            newline = self.data.find(b'\n', self.within)
+            if newline < 0:
+                parts.append(self.data[self.within:])
+                self.within = len(self.data)
+                continue
+            parts.append(self.data[self.within:newline + 1])
+            self.within = newline + 1
+            break
+        return b''.join(parts)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TabixIndex:
+    """A loaded .tbi index"""
+    def __init__(self, path: str):
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        if data[:4] != b'TBI\1':
+            raise ValueError(f"{path} is not a tabix index")
+        n_ref, fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack_from('<8i', data, 4)
+        self.columns = (col_seq - 1, col_beg - 1, col_end - 1)
+        self.zero_based = bool(fmt & TBX_UCSC)
+        pos = 36
+        self.names = data[pos:pos + l_nm].split(b'\0')[:n_ref]
+        self.names = [name.decode() for name in self.names]
+        pos += l_nm
+        self.bins: List[Dict[int, List[Tuple[int, int]]]] = []
+        self.linear: List[Tuple[int, ...]] = []
+        for _ in range(n_ref):
+            bins = {}
+            (n_bin,) = struct.unpack_from('<i', data, pos)
+            pos += 4
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from('<Ii', data, pos)
+                pos += 8
+                chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, pos)
+                pos += 16 * n_chunk
+                bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            (n_intv,) = struct.unpack_from('<i', data, pos)
+            pos += 4
+            self.linear.append(struct.unpack_from(f'<{n_intv}Q', data, pos))
+            pos += 8 * n_intv
+            self.bins.append(bins)
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+
+    def chunks(self, chrom: str, beg: int, end: int) -> List[Tuple[int, int]]:
+        """Merged (start, end) virtual offset ranges that may hold records overlapping [beg, end)"""
+        ref = self.name_ids.get(chrom)
+        if ref is None or end <= beg:
+            return []
+        linear = self.linear[ref]
+        window = beg >> TBI_MIN_SHIFT
+        min_offset = linear[min(window, len(linear) - 1)] if linear else 0
+        bins = self.bins[ref]
+        chunks = sorted(chunk for bin_id in reg2bins(beg, min(end, TBI_MAX_END)) if bin_id in bins
+                        for chunk in bins[bin_id] if chunk[1] > min_offset)
+        merged = []
+        for chunk_beg, chunk_end in chunks:
+            if merged and chunk_beg <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], chunk_end)
+            else:
+                merged.append([chunk_beg, chunk_end])
+        return [tuple(chunk) for chunk in merged]
+
+
+def query_bed(path: str, chrom: str, start: int = 0, end: Optional[int] = None,
+              index: Optional[TabixIndex] = None) -> Iterator[str]:
+    """
+    Yield the lines (without newline) of an indexed .bed.gz whose
+    [start, end) interval overlaps the 0-based half-open region; the whole
+    scaffold if end is None. Pass a loaded TabixIndex to reuse it across queries.
+    """
+    if index is None:
+        index = TabixIndex(index_path(path))
+    if end is None:
+        end = TBI_MAX_END
+    seq_col, beg_col, end_col = index.columns
+    shift = 0 if index.zero_based else 1
+    with BgzfReader(path) as reader:
+        for chunk_beg, chunk_end in index.chunks(chrom, start, end):
+            reader.seek(chunk_beg)
+            while reader.tell() < chunk_end:
+                line = reader.readline()
+                if not line:
+                    break
+                fields = line.rstrip(b'\n').decode().split('\t')
+                if fields[seq_col] != chrom:
+                    continue
+                rec_beg = int(fields[beg_col]) - shift
+                if rec_beg >= end:
+                    break
+                if int(fields[end_col]) > start:
+                    yield '\t'.join(fields)
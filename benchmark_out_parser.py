@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the batch .out tokenizer in repeatmasker_records against the
+pd.read_csv(engine='python') path used by the plotting scripts.
+"""
+
+import argparse
+import gzip
+import time
+import warnings
+
+import pandas as pd
+
+from repeatmasker_records import OUT_COLUMNS, read_out_table
+
+PLOT_COLUMNS = ('perc_div', 'begin', 'end', 'repeat_class')
+
+
+def read_csv_python(out_file):
+    """The plotting scripts' original parser"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        if out_file.endswith('.gz'):
+            with gzip.open(out_file, 'rt') as f:
+                return pd.read_csv(f, delim_whitespace=True, skiprows=3,
+                                   names=list(OUT_COLUMNS), engine='python')
+        return pd.read_csv(out_file, delim_whitespace=True, skiprows=3,
+                           names=list(OUT_COLUMNS), engine='python')
+
+
+def best_time(func, repeats):
+    """Fastest of `repeats` runs, plus the result of the last run"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RepeatMasker .out parsers')
+    parser.add_argument('out_file', help='RepeatMasker .out or .out.gz file')
+    parser.add_argument('-r', '--repeats', type=int, default=3,
+                        help='Runs per parser; the fastest is reported (default: 3)')
+    args = parser.parse_args()
+
+    parsers = [
+        ("read_csv(engine='python')", lambda: read_csv_python(args.out_file)),
+        ('read_out_table, all columns', lambda: read_out_table(args.out_file)),
+        ('read_out_table, plot columns', lambda: read_out_table(args.out_file, PLOT_COLUMNS)),
+    ]
+
+    baseline = None
+    for i, (name, func) in enumerate(parsers):
+        try:
+            elapsed, df = best_time(func, args.repeats)
+        except pd.errors.ParserError as e:
+            print(f"{name:<30} failed: {e}")
+            continue
+        if i == 0:
+            baseline = elapsed
+        speedup = f"{baseline / elapsed:6.1f}x" if baseline else '     -'
+        print(f"{name:<30} {elapsed:8.3f}s  {len(df):>10} rows  {speedup}")
+
+
+if __name__ == "__main__":
+    main()
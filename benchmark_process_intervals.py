@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark process_repeatmasker_v5.process_intervals on synthetic hits of
+increasing size, to check that overlap resolution scales near-linearly.
+
+Hits are laid out along a fixed number of scaffolds with the requested
+average depth (how many hits cover a base), in the scaffold/start order
+RepeatMasker writes them, or shuffled with --shuffle.
+"""
+
+import argparse
+import random
+import time
+
+from process_repeatmasker_v5 import Element, process_intervals
+
+MODES = ('higher_score', 'longer_element', 'lower_divergence')
+
+
+def synthetic_elements(n, scaffolds, depth, seed):
+    """n Elements spread over `scaffolds` scaffolds, covering each base `depth` times on average"""
+    rng = random.Random(seed)
+    mean_length = 300
+    step = max(1, round(mean_length / depth))
+    per_scaffold = -(-n // scaffolds)
+    elements = []
+    for i in range(n):
+        seqname = f"scaffold_{i // per_scaffold + 1}"
+        start = (i % per_scaffold) * step + rng.randint(1, step)
+        end = start + rng.randint(20, 2 * mean_length - 20)
+        elements.append(Element(
+            idx=i, raw_line='', score=float(rng.randint(200, 5000)),
+            div=round(rng.uniform(0, 35), 1), seqname=seqname, start=start, end=end,
+            strand=rng.choice('+C'), repeat_name=f"rnd-1_family-{rng.randint(1, 500)}",
+            class_family=rng.choice(('LINE/L1', 'SINE/Alu', 'LTR/ERV1', 'DNA/hAT')),
+            source_order=i))
+    return elements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark process_repeatmasker_v5 overlap resolution')
+    parser.add_argument('-n', '--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000],
+                        help='Numbers of hits to resolve (default: 10000 100000 1000000)')
+    parser.add_argument('-s', '--scaffolds', type=int, default=20,
+                        help='Number of scaffolds the hits are spread over (default: 20)')
+    parser.add_argument('-d', '--depth', type=float, default=1.5,
+                        help='Average number of hits covering a base (default: 1.5)')
+    parser.add_argument('-ov', '--ovlp_resolution', choices=MODES, default='lower_divergence',
+                        help='Overlap resolution mode (default: lower_divergence)')
+    parser.add_argument('--shuffle', action='store_true',
+                        help='Resolve hits in random order instead of scaffold/start order')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'hits':>10} {'resolved':>10} {'seconds':>9} {'us/hit':>8} {'scaling':>8}")
+    for n in args.sizes:
+        elements = synthetic_elements(n, args.scaffolds, args.depth, args.seed)
+        if args.shuffle:
+            random.Random(args.seed).shuffle(elements)
+        start = time.perf_counter()
+        resolved = process_intervals(elements, mode=args.ovlp_resolution)
+        elapsed = time.perf_counter() - start
+        per_hit = elapsed / n * 1e6
+        # per-hit cost relative to the smallest size; stays near 1.0 for linear scaling
+        baseline = baseline or per_hit
+        print(f"{n:>10} {len(resolved):>10} {elapsed:>9.2f} {per_hit:>8.2f} {per_hit / baseline:>7.2f}x")
+        del elements, resolved
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Benchmark the overlap resolvers (process_repeatmasker_v1..v8 and
+RM2bed_hubley) on synthetic RepeatMasker .out files of increasing size and
+overlap density.
+
+Inputs are written once with synthetic_repeatmasker and reused by later
+runs. Every resolver runs as its own process on every input and overlap
+resolution mode; the report records wall time, peak RSS, the number of BED
+lines written and how the output differs from the reference resolver's on
+the same input and mode (intervals only in one output, compared on scaffold,
+start and end, since the resolvers name and score their BED lines
+differently). A resolver that fails or times out on an input is not run on
+larger inputs of the same overlap density and mode.
+
+Results are written as <report>.json and a <report>.md table.
+
+Usage:
+    benchmark_resolvers.py -n 1000 10000 100000 --overlaps 0.05 0.3 -r bench
+    benchmark_resolvers.py -n 1000000 --resolvers v5 v8 rm2bed --timeout 3600
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ('higher_score', 'longer_element', 'lower_divergence')
+RESOLVERS = ('v1', 'v2', 'v3', 'v4', 'v5', 'v6', 'v7', 'v8', 'rm2bed')
+
+
+def resolver_command(resolver, input_path, run_dir, mode):
+    """(argv, BED output path) of one resolver run writing into run_dir"""
+    if resolver == 'rm2bed':
+        argv = [os.path.join(SCRIPT_DIR, 'RM2bed_hubley.py'), input_path,
+                '-d', run_dir, '-p', 'out', '-o', mode]
+        return argv, os.path.join(run_dir, 'out_rm.bed')
+    prefix = os.path.join(run_dir, 'out')
+    argv = [os.path.join(SCRIPT_DIR, f'process_repeatmasker_{resolver}.py'),
+            '-i', input_path, '-ot', 'bed', '-p', prefix, '-ov', mode]
+    return argv, prefix + '.bed'
+
+
+def synthetic_input(work_dir, hits, overlap, scaffolds, seed):
+    """Path of a generated .out file, writing it first if it does not exist yet"""
+    path = os.path.join(work_dir, 'inputs', f"synthetic_n{hits}_ov{overlap}_s{scaffolds}_seed{seed}.out")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"Generating {path}", file=sys.stderr)
+        # imported here so the benchmark stays small until the launcher is running
+        from synthetic_repeatmasker import SyntheticConfig, write_out
+        config = SyntheticConfig(scaffolds=min(scaffolds, hits), hits=hits,
+                                 overlap_fraction=overlap, seed=seed)
+        with open(path + '.tmp', 'w') as f:
+            write_out(f, config)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run_measured(argv, log_path, timeout):
+    """
+    Run a command with stdout/stderr to log_path; returns (exit status,
+    wall seconds, peak RSS in MB, timed out). Peak RSS is the child's own,
+    read from wait4.
+    """
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable] + argv, stdout=log, stderr=subprocess.STDOUT)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            if timer:
+                timer.cancel()
+        elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KB on Linux
+    return proc.returncode, elapsed, usage.ru_maxrss / 1024, timed_out.is_set()
+
+
+def serve_runs():
+    """
+    Launcher loop: read one JSON [argv, log path, timeout] per stdin line,
+    run it and answer with a JSON result line. Linux carries a process's
+    peak RSS across exec, so children forked from the benchmark itself
+    would report at least the benchmark's own footprint; the launcher is
+    started before anything large is loaded and stays small.
+    """
+    for line in sys.stdin:
+        print(json.dumps(run_measured(*json.loads(line))), flush=True)
+
+
+class Launcher:
+    """Handle on a serve_runs process"""
+    def __init__(self):
+        self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-runs'],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    def run(self, argv, log_path, timeout):
+        """run_measured in the launcher"""
+        self.proc.stdin.write(json.dumps([argv, log_path, timeout]) + '\n')
+        self.proc.stdin.flush()
+        return tuple(json.loads(self.proc.stdout.readline()))
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def bed_intervals(path):
+    """(set of (scaffold, start, end), number of lines) of a BED file"""
+    intervals = set()
+    count = 0
+    with open(path) as f:
+        for line in f:
+            count += 1
+            fields = line.split('\t', 3)
+            if len(fields) >= 3 and not line.startswith(('#', 'track')):
+                intervals.add((fields[0], fields[1], fields[2].rstrip('\n')))
+    return intervals, count
+
+
+def format_markdown(report):
+    lines = [
+        '# Overlap resolver benchmark',
+        '',
+        f"Reference for output differences: {report['reference']}. "
+        f"+N/-N: intervals only in / missing from the resolver's output.",
+        '',
+        '| resolver | mode | hits | overlap | status | wall (s) | peak RSS (MB) | BED lines | vs reference |',
+        '|---|---|---:|---:|---|---:|---:|---:|---|',
+    ]
+    for run in sorted(report['runs'], key=lambda r: (r['mode'], r['overlap'], r['hits'],
+                                                      RESOLVERS.index(r['resolver']))):
+        if run['status'] == 'ok':
+            wall, rss, count = f"{run['seconds']:.2f}", f"{run['peak_rss_mb']:.0f}", str(run['bed_lines'])
+        else:
+            wall = rss = count = '-'
+        if run.get('only_in_run') is None:
+            diff = '-'
+        elif run['only_in_run'] == run['only_in_reference'] == 0:
+            diff = 'identical'
+        else:
+            diff = f"+{run['only_in_run']}/-{run['only_in_reference']}"
+        lines.append(f"| {run['resolver']} | {run['mode']} | {run['hits']} | {run['overlap']} | "
+                     f"{run['status']} | {wall} | {rss} | {count} | {diff} |")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the RepeatMasker overlap resolvers')
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of hits in the generated inputs (default: 1000 10000 100000)')
+    parser.add_argument('--overlaps', type=float, nargs='+', default=[0.15],
+                        help='Fractions of hits overlapping the previous hit (default: 0.15)')
+    parser.add_argument('--resolvers', nargs='+', choices=RESOLVERS, default=list(RESOLVERS),
+                        help='Resolvers to run (default: all)')
+    parser.add_argument('-ov', '--modes', nargs='+', choices=MODES, default=list(MODES),
+                        help='Overlap resolution modes (default: all)')
+    parser.add_argument('--reference', choices=RESOLVERS, default='v8',
+                        help='Resolver whose output the others are compared with (default: v8)')
+    parser.add_argument('--scaffolds', type=int, default=20,
+                        help='Scaffolds per generated input (default: 20)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the generated inputs (default: 1)')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Seconds before a run is killed; 0 for no limit (default: 600)')
+    parser.add_argument('-w', '--work-dir', default='resolver_benchmark',
+                        help='Directory for generated inputs and run outputs (default: resolver_benchmark)')
+    parser.add_argument('-r', '--report', default='resolver_benchmark',
+                        help='Report path prefix for .json and .md (default: resolver_benchmark)')
+    parser.add_argument('--keep', action='store_true', help='Keep the BED outputs and logs of every run')
+    parser.add_argument('--serve-runs', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_runs:
+        serve_runs()
+        return
+    launcher = Launcher()
+
+    # The reference runs first so every other run can be compared as it finishes
+    resolvers = [args.reference] + [r for r in args.resolvers if r != args.reference]
+    runs = []
+    given_up = set()
+    for overlap in args.overlaps:
+        for hits in sorted(args.sizes):
+            input_path = synthetic_input(args.work_dir, hits, overlap, args.scaffolds, args.seed)
+            for mode in args.modes:
+                reference = None
+                for resolver in resolvers:
+                    run = {'resolver': resolver, 'mode': mode, 'hits': hits, 'overlap': overlap,
+                           'input': input_path}
+                    runs.append(run)
+                    if (resolver, mode, overlap) in given_up:
+                        run['status'] = 'skipped'
+                        continue
+                    run_dir = os.path.join(args.work_dir, 'runs', os.path.basename(input_path)[:-4],
+                                           f"{resolver}_{mode}")
+                    os.makedirs(run_dir, exist_ok=True)
+                    argv, bed_path = resolver_command(resolver, os.path.abspath(input_path), run_dir, mode)
+                    status, seconds, rss, timed_out = launcher.run(
+                        argv, os.path.join(run_dir, 'log.txt'), args.timeout)
+                    run.update(seconds=round(seconds, 3), peak_rss_mb=round(rss, 1), exit_status=status)
+                    if timed_out or status != 0 or not os.path.exists(bed_path):
+                        run['status'] = 'timeout' if timed_out else 'failed'
+                        given_up.add((resolver, mode, overlap))
+                    else:
+                        run['status'] = 'ok'
+                        intervals, run['bed_lines'] = bed_intervals(bed_path)
+                        if resolver == args.reference:
+                            reference = intervals
+                        if reference is not None:
+                            run['only_in_run'] = len(intervals - reference)
+                            run['only_in_reference'] = len(reference - intervals)
+                    print(f"{resolver:<7} {mode:<17} n={hits:<9} ov={overlap:<5} {run['status']:<8} "
+                          f"{seconds:9.2f}s {rss:9.1f} MB", file=sys.stderr)
+                    if not args.keep:
+                        shutil.rmtree(run_dir, ignore_errors=True)
+
+    launcher.close()
+
+    report = {'reference': args.reference, 'seed': args.seed, 'scaffolds': args.scaffolds,
+              'timeout': args.timeout, 'python': sys.version.split()[0], 'runs': runs}
+    with open(args.report + '.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(args.report + '.md', 'w') as f:
+        f.write(format_markdown(report))
+    print(f"Wrote {args.report}.json and {args.report}.md", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,20 @@
 import argparse
 import csv
 
+from fasta_index import FastaIndex
+
+def header_id(header_line):
+    """Part of a header line before the first '#'"""
+    header, _ = header_line.split('#', 1)
+    return header
+
 def parse_fasta(fasta_file):
-    """Parse the headers and sequences of a FASTA file into a dictionary."""
+    """Index a FASTA file and map header IDs to header info and (lazily read) sequences."""
+    sequences = FastaIndex(fasta_file, persist=False, key=header_id)
     headers = {}
-    sequences = {}
-    with open(fasta_file, 'r') as f:
-        header = None
-        sequence_lines = []
-        for line in f:
-            line = line.strip()
-            if line.startswith('>'):
-                if header:
-                    headers[header] = header_info
-                    sequences[header] = ''.join(sequence_lines)
-                header_full = line[1:]  # Remove '>'
-                header, header_info = header_full.split('#', 1)
-                sequence_lines = []
-            else:
-                sequence_lines.append(line)
-        # Add last sequence
-        if header:
-            headers[header] = header_info
-            sequences[header] = ''.join(sequence_lines)
+    for entry in sequences.entries:
+        header, header_info = entry.description.split('#', 1)
+        headers[header] = header_info
     return headers, sequences
 
 def compare_headers(deepte_headers, teclass2_headers, deepte_sequences, mismatch_file, match_file, output_fasta):
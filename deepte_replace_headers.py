@@ -7,9 +7,8 @@ This script modifies FASTA headers based on DeepTE classifications and a key fil
 
 import argparse
 import sys
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+
+from fasta_index import FastaIndex, write_fasta as write_record
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -133,8 +132,9 @@ def modify_header(original_header, deepte_call, classification_key):
 
 def process_sequences(input_fasta, deepte_calls, classification_key):
     """
-    Process all sequences and categorize them
-    Returns: (modified_records, unmodified_records, all_records)
+    Process all sequences and categorize them by header only; records are
+    (header, entry) pairs whose sequences stay in the indexed FASTA file
+    Returns: (fasta_index, modified_records, unmodified_records, all_records)
     """
     modified_records = []
     unmodified_records = []
@@ -147,9 +147,10 @@ def process_sequences(input_fasta, deepte_calls, classification_key):
     not_in_tsv = 0
     
     try:
-        for record in SeqIO.parse(input_fasta, "fasta"):
-            original_id = record.id
-            original_description = record.description
+        fasta = FastaIndex(input_fasta, persist=False)
+        for entry in fasta.entries:
+            original_id = entry.name
+            record = (entry.description, entry)
             
             # Check if this sequence is in the DeepTE calls
             if original_id in deepte_calls:
@@ -159,12 +160,8 @@ def process_sequences(input_fasta, deepte_calls, classification_key):
                 new_id, was_modified = modify_header(original_id, deepte_call, classification_key)
                 
                 if was_modified:
-                    # Create new record with modified header
-                    new_record = SeqRecord(
-                        record.seq,
-                        id=new_id,
-                        description=""
-                    )
+                    # Same sequence under the modified header
+                    new_record = (new_id, entry)
                     modified_records.append(new_record)
                     all_records.append(new_record)
                     modified_count += 1
@@ -194,12 +191,15 @@ def process_sequences(input_fasta, deepte_calls, classification_key):
     print(f"  Unmodified: {unmodified_count}")
     print(f"  Not in TSV: {not_in_tsv}")
     
-    return modified_records, unmodified_records, all_records
+    return fasta, modified_records, unmodified_records, all_records
 
-def write_fasta(output_file, records):
-    """Write sequences to FASTA file using BioPython"""
+def write_fasta(output_file, fasta, records):
+    """Write (header, entry) records to a FASTA file, reading each sequence from the index"""
     try:
-        count = SeqIO.write(records, output_file, "fasta")
+        with open(output_file, 'w', buffering=1 << 20) as handle:
+            for header, entry in records:
+                write_record(handle, header, fasta.sequence(entry))
+        count = len(records)
         print(f"  Wrote {count} sequences to {output_file}")
     except Exception as e:
         print(f"Error writing FASTA file {output_file}: {e}")
@@ -214,7 +214,7 @@ def main():
     classification_key = load_key(args.key)
     
     # Process sequences
-    modified_records, unmodified_records, all_records = process_sequences(
+    fasta, modified_records, unmodified_records, all_records = process_sequences(
         args.input_fasta,
         deepte_calls,
         classification_key
@@ -222,9 +222,10 @@ def main():
     
     # Write output files
     print("\nWriting output files:")
-    write_fasta(args.modified_fasta, modified_records)
-    write_fasta(args.unmodified_fasta, unmodified_records)
-    write_fasta(args.all_fasta, all_records)
+    with fasta:
+        write_fasta(args.modified_fasta, fasta, modified_records)
+        write_fasta(args.unmodified_fasta, fasta, unmodified_records)
+        write_fasta(args.all_fasta, fasta, all_records)
     
     print("\nProcessing complete!")
 
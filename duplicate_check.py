@@ -1,28 +1,156 @@
 import argparse
+import hashlib
 from Bio import SeqIO
 from collections import defaultdict
 import os
+import numpy as np
+
+# Same complement as Bio.Seq.reverse_complement (IUPAC codes, both cases, U -> A)
+COMPLEMENT = str.maketrans('ACGTUMRWSYKVHDBNacgtumrwsykvhdbn', 'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn')
+DIGEST_SIZE = 16
+
+# MinHash sketch bins and locality-sensitive hashing bands (MINHASH_SIZE /
+# MINHASH_BANDS bins per band) for the near-duplicate mode
+MINHASH_SIZE = 128
+MINHASH_BANDS = 32
+MINHASH_EMPTY = np.iinfo(np.uint64).max
+BASE_CODES = np.full(256, 4, dtype=np.uint64)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'Tt')):
+    for _base in _bases:
+        BASE_CODES[ord(_base)] = _code
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Process genome library files.')
     parser.add_argument('-i', '--input', required=True, help='Path to ${GENOME}_preliminary_library.fa')
+    parser.add_argument('-n', '--near-threshold', type=float,
+                        help='Also report near-duplicates whose estimated k-mer Jaccard similarity '
+                             'to an earlier sequence is at least this value (e.g. 0.9)')
+    parser.add_argument('-k', '--kmer', type=int, default=15,
+                        help='k-mer size for the near-duplicate sketches (max 31, default: 15)')
     return parser.parse_args()
 
-def find_duplicates_and_rename(input_file, genome_name):
-    seq_dict = defaultdict(list)
+def reverse_complement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+def canonical_digest(seq):
+    """128-bit digest of the lexicographically smaller of seq and its reverse complement"""
+    canonical = min(seq, reverse_complement(seq))
+    return hashlib.blake2b(canonical.encode(), digest_size=DIGEST_SIZE).digest()
+
+def mix64(values):
+    """splitmix64 finalizer, used as the k-mer hash"""
+    values = values + np.uint64(0x9e3779b97f4a7c15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+def canonical_kmers(seq, k, return_strand=False):
+    """
+    2-bit encoded canonical k-mers of seq, skipping k-mers with non-ACGT
+    bases. With return_strand, also return a boolean array that is True
+    where the canonical k-mer is the reverse complement of the one in seq.
+    """
+    codes = BASE_CODES[np.frombuffer(seq.encode(), dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        empty = np.array([], dtype=np.uint64)
+        return (empty, np.array([], dtype=bool)) if return_strand else empty
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        window = codes[j:j + n] & np.uint64(3)
+        forward = (forward << np.uint64(2)) | window
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = invalid[k:] == invalid[:-k]
+    if return_strand:
+        return np.minimum(forward, reverse)[valid], (reverse < forward)[valid]
+    return np.minimum(forward, reverse)[valid]
+
+def minhash_sketch(seq, k, size=MINHASH_SIZE):
+    """
+    One-permutation MinHash sketch: the smallest k-mer hash in each of size
+    bins (MINHASH_EMPTY for empty bins). Strand-independent, since the
+    k-mers are canonical.
+    """
+    hashes = mix64(canonical_kmers(seq, k))
+    sketch = np.full(size, MINHASH_EMPTY, dtype=np.uint64)
+    np.minimum.at(sketch, (hashes % np.uint64(size)).astype(np.intp), hashes)
+    return sketch
+
+def sketch_similarity(a, b):
+    """Estimated Jaccard similarity of two sketches, over the bins filled in either"""
+    filled = (a != MINHASH_EMPTY) | (b != MINHASH_EMPTY)
+    if not filled.any():
+        return 0.0
+    return float(np.mean(a[filled] == b[filled]))
+
+class DuplicateIndex:
+    """
+    Strand-aware duplicate lookup over the sequences kept so far. Exact
+    duplicates are found with one canonical digest lookup per record. With
+    near_threshold set, kept sequences are also MinHash-sketched and
+    bucketed per band, and a new sequence is a near-duplicate if a kept
+    sequence sharing a band bucket has an estimated Jaccard similarity of at
+    least near_threshold.
+    """
+    def __init__(self, near_threshold=None, k=15, size=MINHASH_SIZE, bands=MINHASH_BANDS):
+        if not 1 <= k <= 31:
+            raise ValueError("k-mer size must be between 1 and 31")
+        self.digests = set()
+        self.near_threshold = near_threshold
+        self.k = k
+        self.size = size
+        self.band_width = size // bands
+        self.sketches = []
+        self.buckets = defaultdict(list)
+
+    def _band_keys(self, sketch):
+        for band in range(0, self.size, self.band_width):
+            values = sketch[band:band + self.band_width]
+            if not (values == MINHASH_EMPTY).all():
+                yield band, values.tobytes()
+
+    def check(self, seq):
+        """
+        Return 'exact' or 'near' if seq duplicates a kept sequence, otherwise
+        keep seq and return None.
+        """
+        digest = canonical_digest(seq)
+        if digest in self.digests:
+            return 'exact'
+        sketch = None
+        if self.near_threshold is not None:
+            sketch = minhash_sketch(seq, self.k, self.size)
+            checked = set()
+            for key in self._band_keys(sketch):
+                for kept in self.buckets.get(key, ()):
+                    if kept in checked:
+                        continue
+                    checked.add(kept)
+                    if sketch_similarity(sketch, self.sketches[kept]) >= self.near_threshold:
+                        return 'near'
+        self.digests.add(digest)
+        if sketch is not None:
+            for key in self._band_keys(sketch):
+                self.buckets[key].append(len(self.sketches))
+            self.sketches.append(sketch)
+        return None
+
+def find_duplicates_and_rename(input_file, genome_name, near_threshold=None, k=15):
+    index = DuplicateIndex(near_threshold, k)
     header_dict = defaultdict(list)
     duplicates = []
+    n_near = 0
     renamed_records = []
 
-    # Read sequences and group by sequence (check both orientations) and header
+    # Read sequences, check each against the kept ones in both orientations,
+    # and group by header
     for record in SeqIO.parse(input_file, "fasta"):
-        seq = str(record.seq)
-        rev_comp_seq = str(record.seq.reverse_complement())
-        if seq in seq_dict or rev_comp_seq in seq_dict:
+        match = index.check(str(record.seq))
+        if match is not None:
             duplicates.append(record)
-        else:
-            seq_dict[seq].append(record)
-            seq_dict[rev_comp_seq].append(record)
+            n_near += match == 'near'
 
         header_dict[record.id].append(record)
 
@@ -47,13 +175,15 @@ def find_duplicates_and_rename(input_file, genome_name):
     with open(final_library_file, "w") as final_handle:
         SeqIO.write(renamed_records, final_handle, "fasta")
 
+    if near_threshold is not None:
+        print(f"Found {len(duplicates) - n_near} exact and {n_near} near duplicates (Jaccard >= {near_threshold}).")
     print(f"Processing complete. Duplicates written to {duplicates_file}. Final library written to {final_library_file}.")
 
 def main():
     args = parse_args()
     input_file = args.input
     genome_name = os.path.basename(input_file).split('_')[0]
-    find_duplicates_and_rename(input_file, genome_name)
+    find_duplicates_and_rename(input_file, genome_name, args.near_threshold, args.kmer)
 
 if __name__ == "__main__":
     main()
@@ -65,17 +195,19 @@ Key Functions
 parse_args():
 
 Uses argparse to parse the command-line argument -i or --input, which specifies the path to the input FASTA file.
+Optional -n / --near-threshold enables the near-duplicate mode, with -k / --kmer as its k-mer size.
 Returns the parsed arguments.
-find_duplicates_and_rename(input_file, genome_name):
+find_duplicates_and_rename(input_file, genome_name, near_threshold=None, k=15):
 
 Purpose: Processes the input FASTA file to identify and handle duplicate sequences and headers.
 Steps:
 Read sequences:
 Reads sequences from the FASTA file.
-Stores sequences in seq_dict (grouped by sequence and reverse complement).
+Checks each sequence against a DuplicateIndex, which keeps a 128-bit digest of the canonical orientation (the smaller of the sequence and its reverse complement) of every kept sequence.
 Tracks headers in header_dict.
 Identify duplicates:
-Sequences that match (or reverse complement match) others in seq_dict are added to a duplicates list.
+Sequences whose canonical digest was already seen (identical or reverse complement) are added to a duplicates list.
+With --near-threshold, each kept sequence is also summarized by a MinHash sketch of its canonical k-mers; a sequence whose estimated Jaccard similarity to a kept sequence (found through banded sketch buckets) reaches the threshold is added to the duplicates list as well.
 Rename entries with duplicated headers:
 If a header occurs more than once in the file, appends a numeric suffix (-1, -2, etc.) to distinguish them.
 Maintains a consistent naming convention for renamed headers.
@@ -98,7 +230,7 @@ Output:
 
 Duplicates file:
 <genome_name>_duplicates.fa
-Contains sequences that are identical (or reverse complement) to other sequences in the input file.
+Contains sequences that are identical (or reverse complement) to other sequences in the input file, and near-duplicates when --near-threshold is given.
 Final library file:
 <genome_name>_final_library.fa
 Contains all sequences with renamed headers for duplicated ones.
@@ -1,8 +1,9 @@
 import os
 import argparse
-import gzip
 from pathlib import Path
 
+from repeatmasker_records import open_gzip
+
 def parse_faidx(file_path, num_scaffolds):
     scaffolds = []
     with open(file_path, 'r') as f:
@@ -16,7 +17,7 @@ def parse_faidx(file_path, num_scaffolds):
     return [scaffold[0] for scaffold in top_scaffolds]
 
 def extract_scaffold_to_fa(input_file, scaffold_name, output_file):
-    with gzip.open(input_file, 'rt') as infile, open(output_file, 'w') as outfile:
+    with open_gzip(input_file, 'rt') as infile, open(output_file, 'w') as outfile:
         capture = False
         for line in infile:
             if line.startswith(">"):
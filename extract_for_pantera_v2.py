@@ -1,10 +1,11 @@
 import os
 import argparse
-import gzip
 import subprocess
 import logging
 from pathlib import Path
 
+from repeatmasker_records import open_gzip
+
 def setup_logging():
     logging.basicConfig(
         format='%(asctime)s - %(levelname)s - %(message)s',
@@ -46,7 +47,7 @@ def calculate_similarity(paf_file):
     return similarity
 
 def extract_scaffold(input_file, scaffold_name, output_file):
-    with gzip.open(input_file, 'rt') as infile, open(output_file, 'w') as outfile:
+    with open_gzip(input_file, 'rt') as infile, open(output_file, 'w') as outfile:
         capture = False
         for line in infile:
             if line.startswith(">"):
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Lazy, persistent FASTA index.
+
+FastaIndex records where each sequence of a FASTA file starts and ends (in
+the spirit of a samtools .fai index, but also keeping the full header line
+and allowing ragged line lengths) and behaves as a read-only mapping from
+record ID to sequence. Sequences are read through mmap only when they are
+looked up, so scripts that only route records by header never hold a whole
+library of SeqRecord objects in memory.
+
+The index is saved next to the FASTA file as <file>.fxi and reused while
+the file's size and mtime are unchanged. IDs and header lines follow
+Biopython's FASTA parser (the ID is the first word of the header line), and
+write_fasta() writes records in the same layout as SeqIO.write, so outputs
+do not change when a script switches from SeqIO to the index.
+"""
+
+import mmap
+import os
+import sys
+import tempfile
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, NamedTuple, TextIO
+
+FASTA_INDEX_VERSION = 1
+FASTA_LINE_WIDTH = 60
+# Bytes that are not part of a sequence, as dropped by Biopython's parser
+SEQUENCE_JUNK = b' \r\n'
+
+
+class FastaEntry(NamedTuple):
+    """One record: ID, full header line, sequence length and byte range"""
+    name: str
+    description: str
+    length: int
+    offset: int
+    end: int
+
+
+def fasta_index_path(filepath: str) -> str:
+    """Index file kept next to a FASTA file"""
+    return filepath + '.fxi'
+
+
+def _index_key(filepath: str) -> List[int]:
+    stat = os.stat(filepath)
+    return [FASTA_INDEX_VERSION, stat.st_size, stat.st_mtime_ns]
+
+
+def scan_fasta(filepath: str) -> List[FastaEntry]:
+    """Read a FASTA file once and return the entry of every record in order"""
+    entries = []
+    header = None
+    offset = length = start = 0
+    with open(filepath, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                if header is not None:
+                    entries.append(_entry(header, length, start, offset))
+                header = line[1:].decode().rstrip()
+                length = 0
+                start = offset + len(line)
+            elif header is not None:
+                length += len(line.translate(None, SEQUENCE_JUNK))
+            offset += len(line)
+    if header is not None:
+        entries.append(_entry(header, length, start, offset))
+    return entries
+
+
+def _entry(header: str, length: int, start: int, end: int) -> FastaEntry:
+    name = header.split(None, 1)[0] if header else ''
+    return FastaEntry(name, header, length, start, end)
+
+
+def read_fasta_index(path: str, key: List[int]) -> List[FastaEntry]:
+    """Entries from a saved index, or None if it is missing or stale"""
+    try:
+        with open(path) as f:
+            fields = f.readline().rstrip('\n').split('\t')
+            if fields[0] != '#fasta_index' or [int(x) for x in fields[1:]] != key:
+                return None
+            entries = []
+            for line in f:
+                name, length, offset, end, description = line.rstrip('\n').split('\t', 4)
+                entries.append(FastaEntry(name, description, int(length), int(offset), int(end)))
+            return entries
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: Ignoring unreadable FASTA index {path}: {e}", file=sys.stderr)
+        return None
+
+
+def write_fasta_index(path: str, key: List[int], entries: List[FastaEntry]):
+    """Save entries atomically; failure to write only produces a warning"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=os.path.basename(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\t'.join(['#fasta_index'] + [str(x) for x in key]) + '\n')
+                for entry in entries:
+                    f.write(f"{entry.name}\t{entry.length}\t{entry.offset}\t{entry.end}\t"
+                            f"{entry.description}\n")
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Warning: Could not write FASTA index {path}: {e}", file=sys.stderr)
+
+
+class FastaIndex(Mapping):
+    """
+    Read-only mapping of record ID to sequence string for one FASTA file.
+    With key, records are looked up by key(header line) instead of the ID.
+
+    `entries` lists every record in file order. As with a dict built from
+    the records, a repeated ID maps to its last record but keeps the
+    position of its first; `duplicates` lists such IDs.
+    """
+    def __init__(self, filepath: str, persist: bool = True,
+                 key: Callable[[str], str] = None):
+        self.filepath = filepath
+        file_key = _index_key(filepath)
+        path = fasta_index_path(filepath)
+        entries = read_fasta_index(path, file_key) if persist else None
+        if entries is None:
+            entries = scan_fasta(filepath)
+            if persist:
+                write_fasta_index(path, file_key, entries)
+        self.entries = entries
+        self.by_name: Dict[str, FastaEntry] = {}
+        seen = set()
+        self.duplicates = []
+        for entry in entries:
+            name = entry.name if key is None else key(entry.description)
+            if name in seen and name not in self.duplicates:
+                self.duplicates.append(name)
+            seen.add(name)
+            self.by_name[name] = entry
+        self._file = None
+        self._map = None
+
+    def _bytes(self, entry: FastaEntry) -> bytes:
+        if self._map is None:
+            if entry.offset == entry.end:
+                return b''
+            self._file = open(self.filepath, 'rb')
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[entry.offset:entry.end]
+
+    def sequence(self, entry: FastaEntry) -> str:
+        """Sequence of one entry, read from the file"""
+        return self._bytes(entry).translate(None, SEQUENCE_JUNK).decode()
+
+    def __getitem__(self, name: str) -> str:
+        return self.sequence(self.by_name[name])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.by_name)
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def __contains__(self, name) -> bool:
+        return name in self.by_name
+
+    def entry(self, name: str) -> FastaEntry:
+        return self.by_name[name]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def __enter__(self) -> 'FastaIndex':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_fasta(handle: TextIO, header: str, sequence: str, width: int = FASTA_LINE_WIDTH):
+    """Write one record as SeqIO.write does: header line, then width-wrapped sequence"""
+    handle.write(f">{header}\n")
+    for i in range(0, len(sequence), width):
+        handle.write(sequence[i:i + width] + '\n')
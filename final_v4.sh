@@ -14,7 +14,7 @@ conda activate pantera
 WORKDIR=/lustre/scratch/daray/bat1k_TE_analyses/hite
 MAMMALPATH=/lustre/scratch/daray/bat1k_TE_analyses/mammal_04072022_no_duplicates.fa
 GITPATH=/home/daray/gitrepositories/bioinfo_tools
-USEARCHPATH=/lustre/work/daray/software
+INDEXPATH=$WORKDIR/known_library_index.npz
 CURATIONPATH=/lustre/scratch/daray/bat1k_TE_analyses/curation_templates
 
 cd $WORKDIR
@@ -61,20 +61,21 @@ while IFS= read -r LINE; do
         echo ""
     fi
 
-    echo "Run usearch on ${LINE}_final_library.fa"
+    echo "Run library search on ${LINE}_final_library.fa"
     echo ""
-    $USEARCHPATH/usearch11.0.667_i86linux32 \
-        -usearch_global "${LINE}_final_library.fa" \
-        -db "$DB_PATH" \
-        -strand both \
-        -threads 3 \
-        -id 0.60 \
-        -minsl 0.80 \
-        -maxsl 1.2 \
-        -maxaccepts 1 \
-        -maxrejects 128 \
-        -userfields query+target+id+ql+tl \
-        -userout "${LINE}_vs_mammals_usearch_60_hits.tsv"
+    # Same query+target+id+ql+tl columns as usearch_global -userout; the
+    # known-library index is reused and only extended with new sequences
+    python "$CURATIONPATH/library_search.py" \
+        -q "${LINE}_final_library.fa" \
+        -d "$DB_PATH" \
+        -x "$INDEXPATH" \
+        --threads 3 \
+        --id 0.60 \
+        --minsl 0.80 \
+        --maxsl 1.2 \
+        --maxaccepts 1 \
+        --maxrejects 128 \
+        -o "${LINE}_vs_mammals_usearch_60_hits.tsv"
     
     if [ "$FIRST_ITEM" = true ]; then
         python "$CURATIONPATH/hite_usearch_final.py" \
@@ -7,7 +7,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import matplotlib
 import multiprocessing as mp
-import gzip
+
+from repeatmasker_records import add_cache_arguments, read_out_columns
+from summarize_annotations import OUT_FAMILIES, MatrixBuilder, class_family_totals, load_summary, summary_rows
 
 # Use 'Agg' backend for headless environments
 matplotlib.use('Agg')
@@ -36,43 +38,58 @@ def load_species_family_mapping(mapping_file):
     return species_family_map
 
 # Function to extract class and family data from .out.gz files
-def extract_class_family_data(file_path, species_family_map):
+def extract_class_family_data(file_path, species_family_map, cache=True, rebuild_cache=False):
     te_class_data = defaultdict(int)
     te_family_data = {te_class: defaultdict(int) for te_class in te_classes}
     
     species = os.path.basename(file_path).split('.out.gz')[0]
     tax_family = species_family_map.get(species, "Unknown")
     
-    with gzip.open(file_path, 'rt') as file:
-        for line in file:
-            columns = line.strip().split()
-            if len(columns) > 10:  # Ensure there are enough columns
-                te_class_family = columns[10]  # Class/Family is in column 11
-                te_class = te_class_family.split('/')[0]
-                te_family = te_class_family.split('/')[1] if '/' in te_class_family else "Unknown"
+    for te_class_family in read_out_columns(file_path, ['repeat_class'], cache, rebuild_cache)['repeat_class']:
+        te_class = te_class_family.split('/')[0]
+        te_family = te_class_family.split('/')[1] if '/' in te_class_family else "Unknown"
 
-                if te_class in te_classes:  # Only count known classes
-                    te_class_data[te_class] += 1
-                    te_family_data[te_class][te_family] += 1
+        if te_class in te_classes:  # Only count known classes
+            te_class_data[te_class] += 1
+            te_family_data[te_class][te_family] += 1
     
     return species, tax_family, te_class_data, te_family_data
 
+# Function to extract the same data from a summarize_annotations.py family table
+def summary_class_family_data(families, source, species_family_map):
+    species = source.split('.out.gz')[0]
+    tax_family = species_family_map.get(species, "Unknown")
+    te_class_data, te_family_data = class_family_totals(summary_rows(families, source), 'Count', te_classes)
+    return species, tax_family, te_class_data, te_family_data
+
 # Function to build matrices for classes and families using multiprocessing
-def build_matrices(file_list, species_family_map, num_proc):
-    with mp.Pool(num_proc) as pool:
-        results = pool.starmap(
-            extract_class_family_data,
-            [(file_path, species_family_map) for file_path in file_list]
-        )
+def build_matrices(file_list, species_family_map, num_proc, cache=True, rebuild_cache=False, families=None,
+                   class_matrix=None, family_matrices=None):
+    if families is not None:
+        results = [summary_class_family_data(families, os.path.basename(file_path), species_family_map)
+                   for file_path in file_list]
+    else:
+        with mp.Pool(num_proc) as pool:
+            results = pool.starmap(
+                extract_class_family_data,
+                [(file_path, species_family_map, cache, rebuild_cache) for file_path in file_list]
+            )
     
-    class_matrix = pd.DataFrame()
-    family_matrices = {te_class: pd.DataFrame() for te_class in te_classes}
+    # Accumulate every species' cells, then materialize each matrix once
+    class_builder = MatrixBuilder()
+    family_builders = {te_class: MatrixBuilder() for te_class in te_classes}
+    if class_matrix is not None:
+        class_builder.add_frame(class_matrix)
+        for te_class, df in family_matrices.items():
+            family_builders[te_class].add_frame(df)
     
     for species, tax_family, te_class_data, te_family_data in results:
-        class_matrix = pd.concat([class_matrix, pd.DataFrame(te_class_data, index=[species])], axis=0).fillna(0)
-        for te_class, family_counts in te_family_data.items():
-            family_matrices[te_class] = pd.concat([family_matrices[te_class], pd.DataFrame(family_counts, index=[species])], axis=0).fillna(0)
+        class_builder.add(species, te_class_data)
+        for te_class, family_values in te_family_data.items():
+            family_builders[te_class].add(species, family_values)
     
+    class_matrix = class_builder.build()
+    family_matrices = {te_class: builder.build() for te_class, builder in family_builders.items()}
     return class_matrix, family_matrices
 
 # Function to save matrices
@@ -215,27 +232,48 @@ def run_pca_and_plot(matrix, output_prefix, species_family_map):
 # Main function
 def main():
     parser = argparse.ArgumentParser(description='Generate PCA matrices and plots from RepeatMasker .out.gz files.')
-    parser.add_argument('--out_dir', required=True, help='Directory containing .out.gz files.')
+    parser.add_argument('--out_dir', help='Directory containing .out.gz files.')
     parser.add_argument('--mapping_file', required=True, help='File mapping species to taxonomic families.')
     parser.add_argument('--output_dir', required=True, help='Directory to save output matrices and PCA plots.')
     parser.add_argument('--num_proc', type=int, default=1, help='Number of processors to use for multiprocessing.')
+    parser.add_argument('--summary_dir', help='Build matrices from summarize_annotations.py output instead of the .out.gz files.')
+    parser.add_argument('--update', action='store_true', help='Add species missing from existing matrices without rescanning the others.')
     parser.add_argument('--skip_calculations', action='store_true', help='Skip matrix calculations and go straight to plotting.')
+    add_cache_arguments(parser)
     
     args = parser.parse_args()
     
     species_family_map = load_species_family_mapping(args.mapping_file)
-    file_list = [os.path.join(args.out_dir, f) for f in os.listdir(args.out_dir) if f.endswith('.out.gz')]
+    if args.summary_dir:
+        families = load_summary(args.summary_dir, OUT_FAMILIES)
+        file_list = list(families['Source'].unique())
+    elif args.out_dir:
+        families = None
+        file_list = [os.path.join(args.out_dir, f) for f in os.listdir(args.out_dir) if f.endswith('.out.gz')]
+    else:
+        parser.error('one of --out_dir and --summary_dir is required')
     
     class_matrix_path = os.path.join(args.output_dir, 'class_PCA_count_matrix.tsv')
     family_matrix_paths = {te_class: os.path.join(args.output_dir, f'{te_class}_family_PCA_count_matrix.tsv') for te_class in te_classes}
     matrices_exist = os.path.exists(class_matrix_path) and all(os.path.exists(family_matrix_paths[te_class]) for te_class in te_classes)
     
-    if not args.skip_calculations and not matrices_exist:
-        class_matrix, family_matrices = build_matrices(file_list, species_family_map, args.num_proc)
-        save_matrices(class_matrix, family_matrices, args.output_dir)
-    else:
+    if args.skip_calculations or matrices_exist:
         class_matrix = pd.read_csv(class_matrix_path, sep='\t', index_col=0)
         family_matrices = {te_class: pd.read_csv(family_matrix_paths[te_class], sep='\t', index_col=0) for te_class in te_classes}
+    else:
+        class_matrix = family_matrices = None
+    
+    if not args.skip_calculations and (not matrices_exist or args.update):
+        if matrices_exist:
+            # Only scan species that the saved matrices do not have yet
+            file_list = [file_path for file_path in file_list
+                         if os.path.basename(file_path).split('.out.gz')[0] not in class_matrix.index]
+            print(f'Adding {len(file_list)} new species to {len(class_matrix)} existing ones')
+        if file_list or not matrices_exist:
+            class_matrix, family_matrices = build_matrices(file_list, species_family_map, args.num_proc,
+                                                           args.cache, args.rebuild_cache, families,
+                                                           class_matrix, family_matrices)
+            save_matrices(class_matrix, family_matrices, args.output_dir)
     
     run_pca_and_plot(class_matrix, os.path.join(args.output_dir, 'class_matrix'), species_family_map)
     
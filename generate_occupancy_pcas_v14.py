@@ -7,7 +7,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import matplotlib
 import multiprocessing as mp
-import gzip
+
+from repeatmasker_records import open_gzip
 
 # Use 'Agg' backend for headless environments
 matplotlib.use('Agg')
@@ -44,7 +45,7 @@ def extract_class_family_data(file_path, species_family_map):
     species = os.path.basename(file_path).split('.fa.out.gz')[0]
     tax_family = species_family_map.get(species, "Unknown")
 
-    with gzip.open(file_path, 'rt') as file:
+    with open_gzip(file_path, 'rt') as file:
         for _ in range(3):
             next(file)
         for line in file:
@@ -1,8 +1,13 @@
 import argparse
 import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 from Bio import SeqIO
 
+from fasta_index import FastaIndex, write_fasta
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Process genome files.')
     parser.add_argument('-u', '--usearch', required=True, help='Path to ${GENOME}_usearch_60_hits.tsv')
@@ -15,9 +20,13 @@ def process_usearch_file(usearch_file):
     df = pd.read_csv(usearch_file, sep='\t', header=None)
     df.columns = ['A', 'B', 'C', 'D', 'E']
     df['F'] = df['D'] / df['E']
-    df['G'] = df.apply(lambda row: 'same' if row['C'] > 95 and row['D'] > 80 and 0.8 <= row['F'] <= 1.2 
-                       else ('family' if 80 <= row['C'] <= 95 and row['D'] > 80 and 0.8 <= row['F'] <= 1.2 
-                             else ('class' if 60 <= row['C'] < 80 and row['D'] > 80 and 0.8 <= row['F'] <= 1.2 else '')), axis=1)
+    length_ok = (df['D'] > 80) & df['F'].between(0.8, 1.2)
+    conditions = [
+        length_ok & (df['C'] > 95),
+        length_ok & df['C'].between(80, 95),
+        length_ok & (df['C'] >= 60) & (df['C'] < 80),
+    ]
+    df['G'] = np.select(conditions, ['same', 'family', 'class'], default='')
     df.to_csv(usearch_file, sep='\t', index=False, header=False)
     return df
 
@@ -25,39 +34,43 @@ def copy_and_trim_fasta(cons_file, trimmed_fasta):
     SeqIO.write(SeqIO.parse(cons_file, "fasta"), trimmed_fasta, "fasta")
 
 def process_fasta(df, cons_file, same_file, family_file, class_file, genome_name, tetype):
-    trimmed_seqs = {record.id: record for record in SeqIO.parse(cons_file, "fasta")}
+    # cons_file is rewritten below, so a saved index would be stale at once
+    trimmed_seqs = FastaIndex(cons_file, persist=False)
     
-    same_seqs = []
-    family_seqs = []
-    class_seqs = []
+    # (header, entry) pairs per category; sequences are read when written
+    routed = {'same': [], 'family': [], 'class': []}
+    moved = set()
+    messages = []
     
-    for _, row in df.iterrows():
-        if row['G'] == 'same':
-            if row['A'] in trimmed_seqs:
-                record = trimmed_seqs.pop(row['A'])
-                same_seqs.append(record)
-                print(f"EXACT MATCH: Replaced rediscovered {row['A']} with {record.id}")
-        elif row['G'] == 'family':
-            if row['A'] in trimmed_seqs:
-                record = trimmed_seqs.pop(row['A'])
-                new_header = row['B'].replace('#', f"_{genome_name}#")
-                record.id = new_header
-                record.description = ''
-                family_seqs.append(record)
-                print(f"FAMILY MATCH: Replaced header for {row['A']} with {record.id}")
-        elif row['G'] == 'class':
-            if row['A'] in trimmed_seqs:
-                record = trimmed_seqs.pop(row['A'])
-                new_header = row['B'].replace('#', f"_{genome_name}#")
-                record.id = new_header
-                record.description = ''
-                class_seqs.append(record)
-                print(f"CLASS MATCH: Replaced header for {row['A']} with {record.id}")
+    for query, target, category in zip(df['A'].tolist(), df['B'].tolist(), df['G'].tolist()):
+        if category not in routed or query not in trimmed_seqs or query in moved:
+            continue
+        entry = trimmed_seqs.entry(query)
+        moved.add(query)
+        if category == 'same':
+            header = entry.description
+            messages.append(f"EXACT MATCH: Replaced rediscovered {query} with {entry.name}")
+        else:
+            header = target.replace('#', f"_{genome_name}#")
+            messages.append(f"{category.upper()} MATCH: Replaced header for {query} with {header}")
+        routed[category].append((header, entry))
+    if messages:
+        print('\n'.join(messages))
     
-    SeqIO.write(same_seqs, same_file, "fasta")
-    SeqIO.write(family_seqs, family_file, "fasta")
-    SeqIO.write(class_seqs, class_file, "fasta")
-    SeqIO.write(trimmed_seqs.values(), cons_file, "fasta")
+    with trimmed_seqs:
+        for category, output_file in (('same', same_file), ('family', family_file), ('class', class_file)):
+            with open(output_file, 'w', buffering=1 << 20) as handle:
+                for header, entry in routed[category]:
+                    write_fasta(handle, header, trimmed_seqs.sequence(entry))
+        # The remaining sequences replace cons_file, which is still being read
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cons_file)), suffix='.tmp')
+        with os.fdopen(fd, 'w', buffering=1 << 20) as handle:
+            for name in trimmed_seqs:
+                if name not in moved:
+                    entry = trimmed_seqs.entry(name)
+                    write_fasta(handle, entry.description, trimmed_seqs.sequence(entry))
+    shutil.copymode(cons_file, tmp_path)
+    os.replace(tmp_path, cons_file)
 
 def rename_and_classify_fasta(trimmed_fasta, renamed_fasta, genome_name):
     def classify_header(header):
@@ -22,9 +22,10 @@
 #For any rows where column G is 'same', remove the associated sequence from ${ID}_final_library.fa and save #to a file called "${ID)_known_elements_from_final_search.fa". For all other sequences, add them to the #"known library" file and save the new file as "../concatenated_library_${ID}.fa".
 
 import argparse
+import numpy as np
 import pandas as pd
-from Bio import SeqIO
-from collections import defaultdict
+
+from fasta_index import FastaIndex, write_fasta
 
 def process_tsv(tsv_file):
     # Read the TSV file into a DataFrame
@@ -41,9 +42,7 @@ def process_tsv(tsv_file):
         (df['C'] > 60) & (df['C'] <= 80) & (df['D'] > 80) & (df['F'].between(0.8, 1.2))
     ]
     choices = ['same', 'family', 'class']
-    df['G'] = pd.Series(pd.cut(df['C'], bins=[0, 60, 80, 95, 100], labels=['', 'class', 'family', 'same']))[
-        df['F'].between(0.8, 1.2) & (df['D'] > 80)
-    ].fillna('')[df['C'] > 60]
+    df['G'] = np.select(conditions, choices, default=None)
 
     # Save the updated TSV file
     new_tsv_file = tsv_file.replace('.tsv', '_usearch_final.tsv')
@@ -52,56 +51,43 @@ def process_tsv(tsv_file):
     return df, new_tsv_file
 
 def process_fasta_files(new_library, known_library, tsv_data, output_id):
-    # Read the sequences from the new library
-    new_seqs = SeqIO.to_dict(SeqIO.parse(new_library, 'fasta'))
-    
-    # Handle duplicate keys in new_seqs
-    new_seq_keys = defaultdict(int)
-    for key in list(new_seqs.keys()):
-        new_seq_keys[key] += 1
-        if new_seq_keys[key] > 1:
-            new_key = f"{key}_{new_seq_keys[key]}"
-            new_seqs[new_key] = new_seqs.pop(key)
-    
-    # Read the sequences from the known library and handle duplicates
-    known_seq_keys = defaultdict(int)
-    known_seqs = {}
-    for record in SeqIO.parse(known_library, 'fasta'):
-        key = record.id
-        known_seq_keys[key] += 1
-        if known_seq_keys[key] > 1:
-            key = f"{key}_{known_seq_keys[key]}"
-        known_seqs[key] = record
-
-    # Open output files
-    known_elements_output = open(f"{output_id}_known_elements_from_final_search.fa", 'w')
-    concatenated_output = open(f"../concatenated_library_{output_id}.fa", 'w')
+    # Index the new library (read once, so the index is not saved); sequences
+    # are only read when written out
+    new_seqs = FastaIndex(new_library, persist=False)
+    if new_seqs.duplicates:
+        raise ValueError(f"Duplicate key '{new_seqs.duplicates[0]}' in {new_library}")
     
-    # Process each row in the TSV file
-    for index, row in tsv_data.iterrows():
-        fasta_header_new = row['A']
-        fasta_header_known = row['B']
-        classification = row['G']
-        
-        if fasta_header_new not in new_seqs:
+    # Route each hit's new sequence to the known elements (same) or the
+    # concatenated library (everything else), in TSV row order
+    known_elements = []
+    concatenated = []
+    moved = set()
+    for fasta_header_new, classification in zip(tsv_data['A'].tolist(), tsv_data['G'].tolist()):
+        if fasta_header_new not in new_seqs or fasta_header_new in moved:
             print(f"Warning: {fasta_header_new} not found in new_seqs. It was moved to the duplicates file. Skipping this entry.")
             continue
         
+        entry = new_seqs.entry(fasta_header_new)
         if classification == 'same':
-            # Write the sequence to the "known elements" file and remove it from new_seqs
-            SeqIO.write(new_seqs[fasta_header_new], known_elements_output, 'fasta')
-            del new_seqs[fasta_header_new]
+            # Move the sequence to the "known elements" file
+            known_elements.append(entry)
+            moved.add(fasta_header_new)
         else:
-            # Write the sequence to the concatenated output file
-            SeqIO.write(new_seqs[fasta_header_new], concatenated_output, 'fasta')
-    
-    # Write remaining sequences to the concatenated output file
-    for seq in known_seqs.values():
-        SeqIO.write(seq, concatenated_output, 'fasta')
+            concatenated.append(entry)
 
-    known_elements_output.close()
-    concatenated_output.close()
+    # Write each output in one buffered pass; the known library follows the
+    # new sequences in the concatenated output
     concatenated_output_file = f"../concatenated_library_{output_id}.fa"
+    with new_seqs, FastaIndex(known_library) as known_seqs:
+        with open(f"{output_id}_known_elements_from_final_search.fa", 'w', buffering=1 << 20) as known_elements_output:
+            for entry in known_elements:
+                write_fasta(known_elements_output, entry.description, new_seqs.sequence(entry))
+        with open(concatenated_output_file, 'w', buffering=1 << 20) as concatenated_output:
+            for entry in concatenated:
+                write_fasta(concatenated_output, entry.description, new_seqs.sequence(entry))
+            for entry in known_seqs.entries:
+                write_fasta(concatenated_output, entry.description, known_seqs.sequence(entry))
+
     print('Output file is ' + concatenated_output_file)
 
 def main():
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+In-process replacement for the usearch_global search in final_v4.sh.
+
+Every sequence of the new library is searched against the known library in
+both orientations and the best accepted hit is written as a
+query, target, id, ql, tl row, the same A-E columns hite_usearch_final.py
+reads from `usearch -userfields query+target+id+ql+tl`.
+
+The known library is kept in a persistent minimizer index (-x). Each run
+syncs the index with the current known library: records already in the
+index (same header and sequence) keep their stored minimizers and only new
+records are sketched, so the growing concatenated library is never
+re-indexed from scratch. Candidate targets are the ones sharing the most
+canonical minimizers with the query on one strand and within the length
+ratio limits; they are verified in that order with a global edit-distance
+alignment until maxaccepts hits are accepted or maxrejects candidates are
+rejected. Identity is 1 - edit distance / longer length, which approximates
+usearch's identity for global alignments. Queries are searched on several
+worker processes with --threads.
+
+Usage:
+    library_search.py -q GENOME_final_library.fa -d known_library.fa \\
+        -x known_library_index.npz -o GENOME_vs_mammals_usearch_60_hits.tsv \\
+        --id 0.60 --minsl 0.80 --maxsl 1.2 --threads 3
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from Bio import SeqIO
+
+from duplicate_check import canonical_kmers, mix64, reverse_complement
+
+INDEX_VERSION = 1
+# Queries per task sent to a worker process
+SEARCH_BATCH_SIZE = 50
+
+def record_digest(label, seq):
+    return hashlib.blake2b(f"{label}\n{seq}".encode(), digest_size=16).digest()
+
+def minimizers(seq, k, w):
+    """
+    Distinct (w, k) minimizers of the canonical k-mer hashes of seq and, for
+    each, whether it was read from the reverse strand.
+    """
+    kmers, reverse = canonical_kmers(seq.upper(), k, return_strand=True)
+    if len(kmers) == 0:
+        return kmers, reverse
+    hashes = mix64(kmers)
+    if len(hashes) > w:
+        windows = np.lib.stride_tricks.sliding_window_view(hashes, w)
+        picks = np.unique(windows.argmin(axis=1) + np.arange(len(windows)))
+    else:
+        picks = np.array([hashes.argmin()])
+    values, first = np.unique(hashes[picks], return_index=True)
+    return values, reverse[picks][first]
+
+def pattern_masks(query):
+    """Bit mask of the positions of each byte value in query"""
+    masks = {}
+    for i, base in enumerate(query):
+        masks[base] = masks.get(base, 0) | (1 << i)
+    return masks
+
+def edit_distance(query, target, max_distance, masks=None):
+    """
+    Unit-cost global edit distance between two byte strings, or None if it
+    exceeds max_distance. Uses Myers' bit-parallel algorithm with the whole
+    query column held in one Python integer, so each target base costs a
+    few big-integer operations; masks (from pattern_masks) can be reused
+    across targets. Stops early once the distance can no longer come back
+    under max_distance in the remaining columns.
+    """
+    m = len(query)
+    if m == 0:
+        return len(target) if len(target) <= max_distance else None
+    if masks is None:
+        masks = pattern_masks(query)
+    all_rows = (1 << m) - 1
+    last_row = 1 << (m - 1)
+    pv, mv, score = all_rows, 0, m
+    remaining = len(target)
+    for base in target:
+        eq = masks.get(base, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & all_rows)
+        mh = pv & xh
+        if ph & last_row:
+            score += 1
+        elif mh & last_row:
+            score -= 1
+        remaining -= 1
+        if score - remaining > max_distance:
+            return None
+        ph = ((ph << 1) | 1) & all_rows
+        mh = (mh << 1) & all_rows
+        pv = mh | (~(xv | ph) & all_rows)
+        mv = ph & xv
+    return score if score <= max_distance else None
+
+class LibraryIndex:
+    """
+    Minimizer index of a sequence library. Per record it stores the header
+    label, the upper-cased sequence and its minimizers; build_postings()
+    sorts all minimizer values into posting arrays holding the record and
+    strand each one occurs in.
+    """
+    def __init__(self, k=12, w=6):
+        self.k = k
+        self.w = w
+        self.labels = []
+        self.digests = []
+        self.sequences = []
+        self.values = []
+        self.reverse = []
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, label, seq, digest=None, values=None, reverse=None):
+        if values is None:
+            values, reverse = minimizers(seq, self.k, self.w)
+        self.labels.append(label)
+        self.digests.append(digest or record_digest(label, seq))
+        self.sequences.append(seq.upper().encode())
+        self.values.append(values)
+        self.reverse.append(reverse)
+
+    def build_postings(self):
+        counts = np.array([len(values) for values in self.values], dtype=np.int64)
+        values = np.concatenate(self.values) if self.values else np.array([], dtype=np.uint64)
+        reverse = np.concatenate(self.reverse) if self.reverse else np.array([], dtype=bool)
+        records = np.repeat(np.arange(len(self.values), dtype=np.int64), counts)
+        order = np.argsort(values, kind='stable')
+        self.posting_values = values[order]
+        self.posting_records = records[order]
+        self.posting_reverse = reverse[order]
+        self.lengths = np.array([len(seq) for seq in self.sequences], dtype=np.int64)
+
+    @classmethod
+    def sync(cls, fasta_file, index_file=None, k=12, w=6):
+        """
+        Index the records of fasta_file, reusing the minimizers of records
+        already in index_file (if it exists and used the same k and w), and
+        save the updated index back to index_file.
+        """
+        old = None
+        if index_file and os.path.exists(index_file):
+            try:
+                old = cls.load(index_file)
+                if (old.k, old.w) != (k, w):
+                    print(f"Index {index_file} uses different k/w; rebuilding.")
+                    old = None
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Ignoring unreadable index {index_file}: {e}", file=sys.stderr)
+                old = None
+        known = {digest: i for i, digest in enumerate(old.digests)} if old is not None else {}
+
+        index = cls(k, w)
+        reused = 0
+        for record in SeqIO.parse(fasta_file, 'fasta'):
+            seq = str(record.seq)
+            digest = record_digest(record.description, seq)
+            i = known.get(digest)
+            if i is None:
+                index.add(record.description, seq, digest)
+            else:
+                index.add(record.description, seq, digest, old.values[i], old.reverse[i])
+                reused += 1
+        print(f"Indexed {len(index)} known sequences ({len(index) - reused} new, {reused} reused).")
+        index.build_postings()
+        if index_file:
+            index.save(index_file)
+        return index
+
+    def save(self, path):
+        seq_ends = np.cumsum([len(seq) for seq in self.sequences], dtype=np.int64)
+        value_ends = np.cumsum([len(values) for values in self.values], dtype=np.int64)
+        arrays = {
+            'params': np.array([INDEX_VERSION, self.k, self.w], dtype=np.int64),
+            'labels': np.array(self.labels, dtype=str),
+            'digests': np.frombuffer(b''.join(self.digests), dtype='V16'),
+            'sequences': np.frombuffer(b''.join(self.sequences), dtype=np.uint8),
+            'seq_ends': seq_ends,
+            'values': np.concatenate(self.values) if self.values else np.array([], dtype=np.uint64),
+            'reverse': np.concatenate(self.reverse) if self.reverse else np.array([], dtype=bool),
+            'value_ends': value_ends,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=os.path.basename(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version, k, w = data['params'].tolist()
+            if version != INDEX_VERSION:
+                raise ValueError(f"index version {version} is not supported")
+            index = cls(k, w)
+            index.labels = data['labels'].tolist()
+            index.digests = [digest.tobytes() for digest in data['digests']]
+            sequences = data['sequences'].tobytes()
+            seq_starts = np.concatenate(([0], data['seq_ends'][:-1])).tolist()
+            index.sequences = [sequences[start:end] for start, end in
+                               zip(seq_starts, data['seq_ends'].tolist())]
+            index.values = np.split(data['values'], data['value_ends'][:-1])
+            index.reverse = np.split(data['reverse'], data['value_ends'][:-1])
+        if not index.labels:
+            index.sequences, index.values, index.reverse = [], [], []
+        return index
+
+    def candidates(self, seq):
+        """
+        Candidate (record, on_reverse_strand) pairs for seq, ordered by the
+        number of minimizers shared on that strand.
+        """
+        values, reverse = minimizers(seq, self.k, self.w)
+        lo = np.searchsorted(self.posting_values, values, 'left')
+        hi = np.searchsorted(self.posting_values, values, 'right')
+        counts = hi - lo
+        if not counts.sum():
+            return []
+        rows = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts) \
+            + np.repeat(lo, counts)
+        strand = self.posting_reverse[rows] != np.repeat(reverse, counts)
+        keys, shared = np.unique(self.posting_records[rows] * 2 + strand, return_counts=True)
+        order = np.lexsort((keys, -shared))
+        return [(key >> 1, bool(key & 1)) for key in keys[order].tolist()]
+
+    def search(self, seq, identity=0.6, minsl=0.8, maxsl=1.2, maxaccepts=1, maxrejects=128):
+        """Accepted hits for seq as (record, identity) pairs, best candidates first"""
+        query_len = len(seq)
+        forward = seq.upper().encode()
+        backward = reverse_complement(seq.upper()).encode()
+        masks = {False: pattern_masks(forward), True: pattern_masks(backward)}
+        hits = []
+        rejects = 0
+        seen = set()
+        for record, on_reverse in self.candidates(seq):
+            target_len = int(self.lengths[record])
+            if record in seen or not minsl <= query_len / target_len <= maxsl:
+                continue
+            seen.add(record)
+            longer = max(query_len, target_len)
+            max_distance = int((1 - identity) * longer)
+            distance = edit_distance(backward if on_reverse else forward,
+                                     self.sequences[record], max_distance, masks[on_reverse])
+            if distance is not None and 1 - distance / longer >= identity:
+                hits.append((record, 1 - distance / longer))
+                if len(hits) >= maxaccepts:
+                    break
+            else:
+                rejects += 1
+                if rejects >= maxrejects:
+                    break
+        return hits
+
+_worker_index = None
+
+def init_worker(index_file):
+    global _worker_index
+    _worker_index = LibraryIndex.load(index_file)
+    _worker_index.build_postings()
+
+def search_batch(queries, options):
+    rows = []
+    for label, seq in queries:
+        for record, hit_identity in _worker_index.search(seq, **options):
+            rows.append((label, _worker_index.labels[record], round(100 * hit_identity, 1),
+                         len(seq), int(_worker_index.lengths[record])))
+    return rows
+
+def iter_batches(fasta_file, size):
+    batch = []
+    for record in SeqIO.parse(fasta_file, 'fasta'):
+        batch.append((record.description, str(record.seq)))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a new TE library against a known library with a persistent minimizer index.")
+    parser.add_argument('-q', '--query', required=True, help="New library FASTA (usearch_global input).")
+    parser.add_argument('-d', '--db', required=True, help="Known library FASTA (usearch -db).")
+    parser.add_argument('-x', '--index', help="Persistent index file, created or updated to match --db.")
+    parser.add_argument('-o', '--output', required=True, help="Output TSV: query, target, id, ql, tl.")
+    parser.add_argument('--id', type=float, default=0.6, help="Minimum identity (default: 0.6).")
+    parser.add_argument('--minsl', type=float, default=0.8, help="Minimum query/target length ratio (default: 0.8).")
+    parser.add_argument('--maxsl', type=float, default=1.2, help="Maximum query/target length ratio (default: 1.2).")
+    parser.add_argument('--maxaccepts', type=int, default=1, help="Hits reported per query (default: 1).")
+    parser.add_argument('--maxrejects', type=int, default=128, help="Candidates rejected before giving up on a query (default: 128).")
+    parser.add_argument('-k', '--kmer', type=int, default=12, help="k-mer size (default: 12).")
+    parser.add_argument('-w', '--window', type=int, default=6, help="Minimizer window in k-mers (default: 6).")
+    parser.add_argument('-t', '--threads', type=int, default=1, help="Worker processes (default: 1).")
+    args = parser.parse_args()
+
+    options = dict(identity=args.id, minsl=args.minsl, maxsl=args.maxsl,
+                   maxaccepts=args.maxaccepts, maxrejects=args.maxrejects)
+    global _worker_index
+    _worker_index = LibraryIndex.sync(args.db, args.index, args.kmer, args.window)
+    batches = iter_batches(args.query, SEARCH_BATCH_SIZE)
+    pool = None
+    tmp_dir = None
+    if args.threads > 1:
+        # Workers load the index saved by sync; without -x the parent's index
+        # is saved to a temporary file so --db is not re-indexed per worker
+        index_file = args.index
+        if not index_file:
+            tmp_dir = tempfile.TemporaryDirectory()
+            index_file = os.path.join(tmp_dir.name, 'library_index.npz')
+            _worker_index.save(index_file)
+        pool = ProcessPoolExecutor(args.threads, initializer=init_worker, initargs=(index_file,))
+        results = pool.map(partial(search_batch, options=options), batches)
+    else:
+        results = (search_batch(batch, options) for batch in batches)
+
+    n_hits = 0
+    try:
+        with open(args.output, 'w') as out:
+            for rows in results:
+                for row in rows:
+                    out.write('\t'.join(map(str, row)) + '\n')
+                n_hits += len(rows)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+    print(f"Wrote {n_hits} hits to {args.output}")
+
+if __name__ == "__main__":
+    main()
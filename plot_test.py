@@ -5,6 +5,8 @@ import gzip
 import re
 import multiprocessing as mp
 
+from repeatmasker_records import add_cache_arguments, read_out_table
+
 # Use non-interactive Agg backend
 import matplotlib
 matplotlib.use('Agg')
@@ -17,15 +19,8 @@ class_colors = {
 }
 
 # Function to parse the .out file (supporting .gz)
-def parse_repeatmasker_outfile(out_file):
-    columns = ['SW_score', 'perc_div', 'perc_del', 'perc_ins', 'query_sequence', 'begin', 'end', 'left', 
-               'strand', 'matching_repeat', 'repeat_class', 'repeat_pos_begin', 'repeat_pos_end', 'repeat_left', 'ID']
-    
-    if out_file.endswith('.gz'):
-        with gzip.open(out_file, 'rt') as f:
-            df = pd.read_csv(f, delim_whitespace=True, skiprows=3, names=columns, engine='python')
-    else:
-        df = pd.read_csv(out_file, delim_whitespace=True, skiprows=3, names=columns, engine='python')
+def parse_repeatmasker_outfile(out_file, cache=True, rebuild_cache=False):
+    df = read_out_table(out_file, ['perc_div', 'begin', 'end', 'repeat_class'], cache, rebuild_cache)
 
     df['TE_class'] = df['repeat_class'].apply(lambda x: x.split('/')[0] if isinstance(x, str) and '/' in x else x)
     df['TE_class'] = df['TE_class'].apply(lambda x: 'Satellite' if x == 'Simple_repeat' else x)
@@ -167,6 +162,7 @@ def main():
     parser.add_argument('--classes', default='all', help='Comma-separated list of TE classes to include (default: all)')
     #Example alternative to all: --classes DNA,DIRS,LINE,LTR,RC,SINE,NonLTR,Unknown,Other
     parser.add_argument('-proc', '--num_procs', type=int, default=1, help='Number of processors to use')
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     selected_classes = args.classes.split(',') if args.classes != 'all' else list(class_colors.keys())
@@ -174,7 +170,7 @@ def main():
     genome_size = extract_genome_size(args.summary)
     
     # Process .out file
-    df_out = parse_repeatmasker_outfile(args.repeatmasker)
+    df_out = parse_repeatmasker_outfile(args.repeatmasker, args.cache, args.rebuild_cache)
     process_and_plot(df_out, genome_size, f"{args.output}_out", args.bin_size, args.max_divergence, args.spacing, args.mutation_rate, selected_classes, args.num_procs, args.plot_type)
     
     # Process .bed file
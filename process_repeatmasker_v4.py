@@ -10,6 +10,8 @@ from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import multiprocessing
 
+from run_metrics import RunMetrics, add_metrics_arguments
+
 
 class RepeatElement:
     """Represents a single RepeatMasker annotation."""
@@ -125,10 +127,11 @@ def parse_arguments():
         '--progress-dir',
         help='Directory to write progress files (default: no progress files)'
     )
+    add_metrics_arguments(parser)
     return parser.parse_args()
 
 
-def read_repeatmasker_file(filepath, progress_dir=None):
+def read_repeatmasker_file(filepath, progress_dir=None, metrics=None):
     """Read RepeatMasker file and return header and elements."""
     print(f"Reading file: {filepath}")
     
@@ -165,12 +168,13 @@ def read_repeatmasker_file(filepath, progress_dir=None):
                 if parse_errors <= 10:  # Only show first 10 errors
                     print(f"Warning: Could not parse line {i}: {line.strip()}", file=sys.stderr)
         
-        # Progress updates every 100k lines
-        if progress_dir and (i - 3) % 100000 == 0:
-            with open(read_progress, 'a') as f:
-                f.write(f"Parsed {i - 3} lines, {len(elements)} valid elements\n")
+        # Throughput metrics every 10k lines
+        if metrics is not None and (i - 3) % 10000 == 0:
+            metrics.update(lines=i, elements=len(elements))
     
     print(f"Parsed {len(elements)} valid elements")
+    if metrics is not None:
+        metrics.update(lines=total_lines, elements=len(elements), parse_errors=parse_errors)
     
     if progress_dir:
         with open(read_progress, 'a') as f:
@@ -251,8 +255,12 @@ def resolve_overlap(elem1, elem2, method):
     return elem1
 
 
-def resolve_overlaps_for_sequence(seq_elements, method):
-    """Resolve overlaps for elements from a single sequence."""
+def resolve_overlaps_for_sequence(seq_elements, method, stats=None):
+    """
+    Resolve overlaps for elements from a single sequence. If a stats dict is
+    given, its 'largest_cluster' is set to the most elements resolved against
+    each other at once (an element plus the kept elements it overlaps).
+    """
     # Sort by start position
     seq_elements.sort(key=lambda e: (e.begin, e.end))
     
@@ -269,6 +277,8 @@ def resolve_overlaps_for_sequence(seq_elements, method):
             # No overlap, keep it
             kept.append(elem)
         else:
+            if stats is not None:
+                stats['largest_cluster'] = max(stats.get('largest_cluster', 0), len(overlaps) + 1)
             # Has overlaps - resolve them
             should_keep = True
             indices_to_remove = []
@@ -305,7 +315,7 @@ def resolve_overlaps_for_sequence(seq_elements, method):
     return kept
 
 
-def resolve_overlaps(elements, method, num_threads, progress_dir=None):
+def resolve_overlaps(elements, method, num_threads, progress_dir=None, metrics=None):
     """Resolve all overlaps in the element list using multithreading."""
     # Group by sequence
     by_sequence = defaultdict(list)
@@ -328,8 +338,10 @@ def resolve_overlaps(elements, method, num_threads, progress_dir=None):
     # Process sequences in parallel
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         # Submit all sequences for processing
+        seq_stats = {sequence: {} for sequence in by_sequence}
         future_to_seq = {
-            executor.submit(resolve_overlaps_for_sequence, seq_elements, method): sequence
+            executor.submit(resolve_overlaps_for_sequence, seq_elements, method,
+                            seq_stats[sequence]): sequence
             for sequence, seq_elements in by_sequence.items()
         }
         
@@ -340,6 +352,9 @@ def resolve_overlaps(elements, method, num_threads, progress_dir=None):
                 seq_resolved = future.result()
                 resolved.extend(seq_resolved)
                 completed += 1
+                if metrics is not None:
+                    metrics.cluster(seq_stats[sequence].get('largest_cluster', 0))
+                    metrics.count(sequences=1, resolved=len(seq_resolved))
                 
                 # Update progress
                 if completed % 10 == 0 or completed == len(by_sequence):
@@ -412,17 +427,17 @@ def write_bed_format_parallel(elements_by_file, num_threads):
                 print(f"Error writing file: {e}", file=sys.stderr)
 
 
-def main():
-    """Main processing pipeline."""
-    args = parse_arguments()
-    
+def run_pipeline(args, metrics):
+    """Read, filter, resolve and write, timing each stage in metrics."""
     print(f"Reading {args.input}...")
-    header, elements = read_repeatmasker_file(args.input, args.progress_dir)
+    with metrics.stage('parse'):
+        header, elements = read_repeatmasker_file(args.input, args.progress_dir, metrics)
     print(f"Read {len(elements)} elements")
     
     # Filter by divergence if specified
     if args.min_divergence is not None or args.max_divergence is not None:
-        elements = filter_by_divergence(elements, args.min_divergence, args.max_divergence)
+        with metrics.stage('filter'):
+            elements = filter_by_divergence(elements, args.min_divergence, args.max_divergence)
         print(f"After divergence filtering: {len(elements)} elements")
         
         if args.progress_dir:
@@ -438,7 +453,9 @@ def main():
     
     # Resolve overlaps
     print(f"Resolving overlaps using '{args.overlap_resolution}' method...")
-    resolved = resolve_overlaps(elements, args.overlap_resolution, args.threads, args.progress_dir)
+    with metrics.stage('resolve'):
+        resolved = resolve_overlaps(elements, args.overlap_resolution, args.threads,
+                                    args.progress_dir, metrics)
     print(f"After overlap resolution: {len(resolved)} elements")
     
     # Apply minimum hits filter if splitting
@@ -450,12 +467,13 @@ def main():
             counts[key] += 1
         
         # Filter
-        filtered = []
-        for elem in resolved:
-            key = elem.repeat_class if args.split == 'class' else elem.repeat_class.split('/')[0]
-            if counts[key] >= args.min_hits:
-                filtered.append(elem)
-        resolved = filtered
+        with metrics.stage('filter'):
+            filtered = []
+            for elem in resolved:
+                key = elem.repeat_class if args.split == 'class' else elem.repeat_class.split('/')[0]
+                if counts[key] >= args.min_hits:
+                    filtered.append(elem)
+            resolved = filtered
         print(f"After minimum hits filter: {len(resolved)} elements")
         
         if args.progress_dir:
@@ -469,87 +487,97 @@ def main():
                     f.write(f"{category}: {count} elements [{status}]\n")
     
     # Output files
-    if args.split == 'none':
-        # Single output file
-        if args.output_type in ['out', 'both']:
-            out_file = f"{args.prefix}.out"
-            write_out_format(resolved, out_file, header)
-            print(f"Wrote {out_file}")
+    with metrics.stage('write'):
+        if args.split == 'none':
+            # Single output file
+            if args.output_type in ['out', 'both']:
+                out_file = f"{args.prefix}.out"
+                write_out_format(resolved, out_file, header)
+                print(f"Wrote {out_file}")
         
-        if args.output_type in ['bed', 'both']:
-            bed_file = f"{args.prefix}.bed"
-            write_bed_format(resolved, bed_file)
-            print(f"Wrote {bed_file}")
+            if args.output_type in ['bed', 'both']:
+                bed_file = f"{args.prefix}.bed"
+                write_bed_format(resolved, bed_file)
+                print(f"Wrote {bed_file}")
         
-        if args.progress_dir:
-            progress_path = Path(args.progress_dir)
-            summary_file = progress_path / "03_final_summary.txt"
-            with open(summary_file, 'w') as f:
-                f.write(f"Final Summary\n")
-                f.write(f"=============\n\n")
-                f.write(f"Input file: {args.input}\n")
-                f.write(f"Total elements in output: {len(resolved)}\n")
-                f.write(f"Overlap resolution method: {args.overlap_resolution}\n")
-                if args.output_type in ['out', 'both']:
-                    f.write(f"Output .out file: {out_file}\n")
-                if args.output_type in ['bed', 'both']:
-                    f.write(f"Output .bed file: {bed_file}\n")
+            if args.progress_dir:
+                progress_path = Path(args.progress_dir)
+                summary_file = progress_path / "03_final_summary.txt"
+                with open(summary_file, 'w') as f:
+                    f.write(f"Final Summary\n")
+                    f.write(f"=============\n\n")
+                    f.write(f"Input file: {args.input}\n")
+                    f.write(f"Total elements in output: {len(resolved)}\n")
+                    f.write(f"Overlap resolution method: {args.overlap_resolution}\n")
+                    if args.output_type in ['out', 'both']:
+                        f.write(f"Output .out file: {out_file}\n")
+                    if args.output_type in ['bed', 'both']:
+                        f.write(f"Output .bed file: {bed_file}\n")
     
-    else:
-        # Split by class or family
-        by_category = defaultdict(list)
-        for elem in resolved:
-            if args.split == 'class':
-                category = elem.repeat_class
-            else:  # family
-                category = elem.repeat_class.split('/')[0] if '/' in elem.repeat_class else elem.repeat_class
-            by_category[category].append(elem)
+        else:
+            # Split by class or family
+            by_category = defaultdict(list)
+            for elem in resolved:
+                if args.split == 'class':
+                    category = elem.repeat_class
+                else:  # family
+                    category = elem.repeat_class.split('/')[0] if '/' in elem.repeat_class else elem.repeat_class
+                by_category[category].append(elem)
         
-        print(f"\nWriting {len(by_category)} split files using {args.threads} threads...")
+            print(f"\nWriting {len(by_category)} split files using {args.threads} threads...")
         
-        if args.output_type in ['out', 'both']:
-            # Prepare files for parallel writing
-            out_files = {}
-            for category, cat_elements in by_category.items():
-                safe_cat = category.replace('/', '_')
-                out_file = f"{args.prefix}.{safe_cat}.out"
-                out_files[out_file] = (cat_elements, header)
+            if args.output_type in ['out', 'both']:
+                # Prepare files for parallel writing
+                out_files = {}
+                for category, cat_elements in by_category.items():
+                    safe_cat = category.replace('/', '_')
+                    out_file = f"{args.prefix}.{safe_cat}.out"
+                    out_files[out_file] = (cat_elements, header)
             
-            write_out_format_parallel(out_files, args.threads)
+                write_out_format_parallel(out_files, args.threads)
             
-            for category, cat_elements in by_category.items():
-                safe_cat = category.replace('/', '_')
-                print(f"  {safe_cat}: {len(cat_elements)} elements -> {args.prefix}.{safe_cat}.out")
+                for category, cat_elements in by_category.items():
+                    safe_cat = category.replace('/', '_')
+                    print(f"  {safe_cat}: {len(cat_elements)} elements -> {args.prefix}.{safe_cat}.out")
         
-        if args.output_type in ['bed', 'both']:
-            # Prepare files for parallel writing
-            bed_files = {}
-            for category, cat_elements in by_category.items():
-                safe_cat = category.replace('/', '_')
-                bed_file = f"{args.prefix}.{safe_cat}.bed"
-                bed_files[bed_file] = cat_elements
+            if args.output_type in ['bed', 'both']:
+                # Prepare files for parallel writing
+                bed_files = {}
+                for category, cat_elements in by_category.items():
+                    safe_cat = category.replace('/', '_')
+                    bed_file = f"{args.prefix}.{safe_cat}.bed"
+                    bed_files[bed_file] = cat_elements
             
-            write_bed_format_parallel(bed_files, args.threads)
+                write_bed_format_parallel(bed_files, args.threads)
             
-            for category, cat_elements in by_category.items():
-                safe_cat = category.replace('/', '_')
-                print(f"  {safe_cat}: {len(cat_elements)} elements -> {args.prefix}.{safe_cat}.bed")
-        
-        if args.progress_dir:
-            progress_path = Path(args.progress_dir)
-            summary_file = progress_path / "03_final_summary.txt"
-            with open(summary_file, 'w') as f:
-                f.write(f"Final Summary\n")
-                f.write(f"=============\n\n")
-                f.write(f"Input file: {args.input}\n")
-                f.write(f"Split by: {args.split}\n")
-                f.write(f"Number of categories: {len(by_category)}\n")
-                f.write(f"Total elements in output: {len(resolved)}\n")
-                f.write(f"Overlap resolution method: {args.overlap_resolution}\n\n")
-                f.write(f"Files created:\n")
-                for category, cat_elements in sorted(by_category.items(), key=lambda x: len(x[1]), reverse=True):
+                for category, cat_elements in by_category.items():
                     safe_cat = category.replace('/', '_')
-                    f.write(f"  {safe_cat}: {len(cat_elements)} elements\n")
+                    print(f"  {safe_cat}: {len(cat_elements)} elements -> {args.prefix}.{safe_cat}.bed")
+        
+            if args.progress_dir:
+                progress_path = Path(args.progress_dir)
+                summary_file = progress_path / "03_final_summary.txt"
+                with open(summary_file, 'w') as f:
+                    f.write(f"Final Summary\n")
+                    f.write(f"=============\n\n")
+                    f.write(f"Input file: {args.input}\n")
+                    f.write(f"Split by: {args.split}\n")
+                    f.write(f"Number of categories: {len(by_category)}\n")
+                    f.write(f"Total elements in output: {len(resolved)}\n")
+                    f.write(f"Overlap resolution method: {args.overlap_resolution}\n\n")
+                    f.write(f"Files created:\n")
+                    for category, cat_elements in sorted(by_category.items(), key=lambda x: len(x[1]), reverse=True):
+                        safe_cat = category.replace('/', '_')
+                        f.write(f"  {safe_cat}: {len(cat_elements)} elements\n")
+
+
+def main():
+    """Main processing pipeline."""
+    args = parse_arguments()
+    with RunMetrics('process_repeatmasker_v4', args.metrics, args.metrics_interval,
+                    input=args.input, overlap_resolution=args.overlap_resolution,
+                    threads=args.threads) as metrics:
+        run_pipeline(args, metrics)
     
     print("\nDone!")
 
@@ -18,11 +18,14 @@ from __future__ import annotations
 import argparse
 import re
 import sys
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, namedtuple
 from dataclasses import dataclass, field
 from typing import List, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor
 
+from run_metrics import RunMetrics, add_metrics_arguments
+
 print("DEBUG: script started")
 
 # Data structure for an interval / element
@@ -192,29 +195,72 @@ def trim_element_remove_overlap(loser: Element, overlap_start: int, overlap_end:
         new_elements.append(right)
     return new_elements
 
-def process_intervals(elements: List[Element], mode: str = "lower_divergence") -> List[Element]:
+class ScaffoldIntervals:
+    """
+    Resolved elements of one scaffold, kept sorted by start.
+
+    Resolved elements never overlap each other, so ordering by start also
+    orders them by end: the elements overlapping a query are a contiguous
+    run found with one bisect on the ends. `orders` holds the position each
+    element would have in a single list of resolved elements (the input
+    position of the hit it came from), so overlaps can be handled in the
+    same order as a scan of that list.
+    """
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.elements: List[Element] = []
+        self.orders: List[int] = []
+
+    def overlapping(self, e: Element) -> List[Tuple[int, Element]]:
+        """(order, element) of every resolved element overlapping e, in list-scan order"""
+        lo = bisect_left(self.ends, e.start)
+        hi = bisect_right(self.starts, e.end, lo)
+        hits = list(zip(self.orders[lo:hi], self.elements[lo:hi]))
+        # fragments of one hit share an order and sit in start order, as in the list
+        hits.sort(key=lambda x: (x[0], x[1].start))
+        return hits
+
+    def replace(self, e: Element, fragments: List[Element]):
+        """Swap resolved element e for its fragments (which lie within e, in start order)"""
+        pos = bisect_left(self.starts, e.start)
+        order = self.orders[pos]
+        self.starts[pos:pos + 1] = [f.start for f in fragments]
+        self.ends[pos:pos + 1] = [f.end for f in fragments]
+        self.elements[pos:pos + 1] = fragments
+        self.orders[pos:pos + 1] = [order] * len(fragments)
+
+    def add(self, e: Element, order: int):
+        pos = bisect_left(self.starts, e.start)
+        self.starts.insert(pos, e.start)
+        self.ends.insert(pos, e.end)
+        self.elements.insert(pos, e)
+        self.orders.insert(pos, order)
+
+def process_intervals(elements: List[Element], mode: str = "lower_divergence",
+                      stats: Optional[dict] = None) -> List[Element]:
     """
     Main function to resolve overlaps. Processes elements in original order and builds
-    a list of resolved elements (may be trimmed or split).
+    the resolved elements (may be trimmed or split), indexed per scaffold so each
+    fragment is only compared with the resolved elements it can overlap.
+    If a stats dict is given, 'largest_cluster' is set to the most elements
+    resolved against each other at once (a fragment plus those it overlaps).
     """
-    resolved: List[Element] = []
-
-    for e in elements:
-        # We'll maintain a working queue of fragments of e to insert
-        fragments: List[Element] = [e]
-        i = 0
-        while i < len(fragments):
-            cur = fragments[i]
-            j = 0
-            while j < len(resolved):
-                existing = resolved[j]
-                if cur.seqname != existing.seqname:
-                    j += 1
-                    continue
-                if not overlaps(cur, existing):
-                    j += 1
-                    continue
-
+    scaffolds = defaultdict(ScaffoldIntervals)
+
+    for order, e in enumerate(elements):
+        index = scaffolds[e.seqname]
+        # Working stack of fragments of e still to be checked (next fragment last)
+        pending: List[Element] = [e]
+        kept: List[Element] = []
+        while pending:
+            cur = pending.pop()
+            # trimming or removing an existing element never leaves anything overlapping cur,
+            # so the overlapping set only has to be looked up again once cur itself is trimmed
+            overlapping = index.overlapping(cur)
+            if stats is not None and overlapping:
+                stats['largest_cluster'] = max(stats.get('largest_cluster', 0), len(overlapping) + 1)
+            for _, existing in overlapping:
                 # If containment, special rules: the lower-scoring (per mode) element is discarded entirely
                 cont = containment_holder(cur, existing)
                 if cont:
@@ -223,19 +269,13 @@ def process_intervals(elements: List[Element], mode: str = "lower_divergence") -
                     winner = choose_winner(container, containee, mode)
                     loser = containee if winner is container else container
 
-                    # If loser is container (i.e., winner was containee), special handling:
                     # Our rule: discard the lower scoring element entirely (even if it's the containing alignment).
-                    # So we remove loser entirely.
                     if loser is existing:
-                        # remove existing from resolved
-                        resolved.pop(j)
-                        # do not increment j (we removed it)
+                        index.replace(existing, [])
                         continue
-                    else:
-                        # loser is current fragment -> discard and break out of checking existing overlaps
-                        fragments.pop(i)
-                        i -= 1
-                        break
+                    # loser is current fragment -> discard and stop checking it
+                    cur = None
+                    break
                 else:
                     # basic partial overlap -> determine winner for overlapping bases
                     winner = choose_winner(cur, existing, mode)
@@ -245,31 +285,21 @@ def process_intervals(elements: List[Element], mode: str = "lower_divergence") -
                     ov_e = min(cur.end, existing.end)
 
                     if loser is existing:
-                        # trim existing in resolved: replace existing by fragments (0/1/2)
-                        new_frags = trim_element_remove_overlap(existing, ov_s, ov_e)
-                        # replace resolved[j] by the new_frags (maintain stable order)
-                        resolved.pop(j)
-                        # insert new_frags at position j (in order)
-                        for f in reversed(new_frags):
-                            resolved.insert(j, f)
-                        # since we modified resolved, continue checking same j with same cur
+                        # trim existing in place: replace it by its fragments (0/1/2)
+                        index.replace(existing, trim_element_remove_overlap(existing, ov_s, ov_e))
                         continue
-                    else:
-                        # loser is current fragment: trim cur into up to two fragments
-                        new_fragments = trim_element_remove_overlap(cur, ov_s, ov_e)
-                        # replace cur in fragments list by new_fragments
-                        fragments.pop(i)
-                        for f in reversed(new_fragments):
-                            fragments.insert(i, f)
-                        i -= 1  # because we will increment at loop bottom
-                        break  # break to re-evaluate newly-inserted fragment at same index
-                j += 1
-            i += 1
-        # after resolving against all existing resolved intervals, append remaining fragments to resolved
-        # preserve original relative order by simply extending
-        resolved.extend(fragments)
+                    # loser is current fragment: trim cur into up to two fragments and check those instead
+                    pending.extend(reversed(trim_element_remove_overlap(cur, ov_s, ov_e)))
+                    cur = None
+                    break
+            if cur is not None:
+                kept.append(cur)
+        # after resolving against the resolved intervals, add the remaining fragments
+        for f in kept:
+            index.add(f, order)
 
     # final pass: sort resolved by seqname then start then original source order
+    resolved = [e for index in scaffolds.values() for e in index.elements]
     resolved.sort(key=lambda x: (x.seqname, x.start, x.source_order))
     return resolved
 
@@ -403,64 +433,80 @@ def main():
     parser.add_argument('-dmin', '--dmin', type=float, default=None, help='Minimum divergence allowed (filter)')
     parser.add_argument('--progress-dir', default=None, help='Optional progress directory to copy outputs into')
     parser.add_argument('-t', '--threads', type=int, default=1, help='Number of threads (used for parallel writing)')
+    add_metrics_arguments(parser)
     args = parser.parse_args()
 
     print("DEBUG: starting multiprocessing with", args.threads, "threads")
 
-    # read file and parse lines
-    elements: List[Element] = []
-    with open(args.input, 'r') as fh:
-        for idx, line in enumerate(fh):
-            try:
-                el = parse_rm_line(line, idx)
-            except ValueError:
-                el = None
-            if el:
-                elements.append(el)
-
-    if not elements:
-        print("No valid RepeatMasker entries parsed. Exiting.", file=sys.stderr)
-        sys.exit(1)
-
-    # apply divergence filters if provided (note: Simple repeats have huge divergence)
-    filtered_elements = []
-    for e in elements:
-        keep = True
-        if args.dmin is not None and (e.div < args.dmin):
-            keep = False
-        if args.dmax is not None and (e.div > args.dmax):
-            keep = False
-        if keep:
-            filtered_elements.append(e)
-    elements = filtered_elements
-
-    if not elements:
-        print("No entries left after divergence filtering. Exiting.", file=sys.stderr)
-        sys.exit(1)
-
-    # if splitting and min_hits provided, we'll apply min_hits only after group counts computed on original dataset
-    class_counts, family_counts = compute_group_counts(elements)
-    if args.split == 'class' and args.min_hits is not None:
-        # drop any elements from classes with too few hits
-        keep_classes = {k for k,v in class_counts.items() if v >= args.min_hits}
-        elements = [e for e in elements if e.class_family in keep_classes]
-    if args.split == 'family' and args.min_hits is not None:
-        keep_fams = {k for k,v in family_counts.items() if v >= args.min_hits}
-        elements = [e for e in elements if (e.class_family.split('/')[0] if '/' in e.class_family else e.class_family) in keep_fams]
-
-    # Process overlaps
-    resolved = process_intervals(elements, mode=args.ovlp_resolution)
-
-    # Output
-    if args.output_type == 'both':
-        out_types = ['bed','out']
-    else:
-        out_types = [args.output_type]
-
-    results = write_outputs(resolved, args.prefix, out_types, args.split, args.progress_dir, args.min_hits)
-    print("Write summary:")
-    for r in results:
-        print("  ", r)
+    metrics = RunMetrics('process_repeatmasker_v5', args.metrics, args.metrics_interval,
+                         input=args.input, overlap_resolution=args.ovlp_resolution,
+                         threads=args.threads)
+    with metrics:
+        # read file and parse lines
+        elements: List[Element] = []
+        idx = -1
+        with metrics.stage('parse'), open(args.input, 'r') as fh:
+            for idx, line in enumerate(fh):
+                try:
+                    el = parse_rm_line(line, idx)
+                except ValueError:
+                    el = None
+                if el:
+                    elements.append(el)
+                if idx % 100000 == 99999:
+                    metrics.update(lines=idx + 1, elements=len(elements))
+        metrics.update(lines=idx + 1, elements=len(elements))
+
+        if not elements:
+            print("No valid RepeatMasker entries parsed. Exiting.", file=sys.stderr)
+            sys.exit(1)
+
+        with metrics.stage('filter'):
+            # apply divergence filters if provided (note: Simple repeats have huge divergence)
+            filtered_elements = []
+            for e in elements:
+                keep = True
+                if args.dmin is not None and (e.div < args.dmin):
+                    keep = False
+                if args.dmax is not None and (e.div > args.dmax):
+                    keep = False
+                if keep:
+                    filtered_elements.append(e)
+            elements = filtered_elements
+
+        if not elements:
+            print("No entries left after divergence filtering. Exiting.", file=sys.stderr)
+            sys.exit(1)
+
+        with metrics.stage('filter'):
+            # if splitting and min_hits provided, we'll apply min_hits only after group counts computed on original dataset
+            class_counts, family_counts = compute_group_counts(elements)
+            if args.split == 'class' and args.min_hits is not None:
+                # drop any elements from classes with too few hits
+                keep_classes = {k for k,v in class_counts.items() if v >= args.min_hits}
+                elements = [e for e in elements if e.class_family in keep_classes]
+            if args.split == 'family' and args.min_hits is not None:
+                keep_fams = {k for k,v in family_counts.items() if v >= args.min_hits}
+                elements = [e for e in elements if (e.class_family.split('/')[0] if '/' in e.class_family else e.class_family) in keep_fams]
+
+        # Process overlaps
+        stats = {}
+        with metrics.stage('resolve'):
+            resolved = process_intervals(elements, mode=args.ovlp_resolution, stats=stats)
+        metrics.cluster(stats.get('largest_cluster', 0))
+        metrics.count(kept=len(elements), resolved=len(resolved))
+
+        # Output
+        if args.output_type == 'both':
+            out_types = ['bed','out']
+        else:
+            out_types = [args.output_type]
+
+        with metrics.stage('write'):
+            results = write_outputs(resolved, args.prefix, out_types, args.split, args.progress_dir, args.min_hits)
+        print("Write summary:")
+        for r in results:
+            print("  ", r)
 
 if __name__ == "__main__":
     main()
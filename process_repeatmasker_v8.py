@@ -5,15 +5,50 @@ Resolves overlapping repetitive elements using various criteria.
 """
 
 import argparse
+import gzip
+import heapq
+import json
+import shutil
 import sys
 import os
+from array import array
+from itertools import groupby
 from pathlib import Path
-from collections import defaultdict
-from typing import List, Tuple, Dict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Dict, Iterable, Iterator
 import multiprocessing as mp
+import time
+
+import numpy as np
+
+from bed_index import IndexedBedWriter
+from repeatmasker_records import RepeatRecords, iter_out_lines
+from run_metrics import RunMetrics, add_metrics_arguments
+
+# Groups at least this large go straight to sweep_group; smaller ones get
+# this many pairwise passes first
+SWEEP_MIN_GROUP = 256
+SWEEP_AFTER_PASSES = 4
+# Slots checked directly before falling back to an ActiveSet lookup
+SWEEP_SCAN_AHEAD = 8
+# Scaffold chunks per worker process, so one slow chunk doesn't idle the rest
+CHUNKS_PER_WORKER = 4
+# Elements per task when streaming to worker processes
+STREAM_BATCH_ELEMENTS = 50000
+# A checkpoint shard is committed once it holds this many input elements or
+# has been open this many seconds, whichever comes first
+CHECKPOINT_SHARD_ELEMENTS = 500000
+CHECKPOINT_SHARD_SECONDS = 60
+# Bump when the shard layout or manifest format changes
+CHECKPOINT_VERSION = 1
 
 class RepeatElement:
     """Represents a single RepeatMasker element"""
+    __slots__ = ('score', 'divergence', 'deletion', 'insertion', 'scaffold',
+                 'start', 'end', 'left', 'strand', 'repeat_name', 'repeat_class',
+                 'remaining', 'line_num', 'original_line')
+    
     def __init__(self, line: str, line_num: int):
         parts = line.split()
         self.score = int(parts[0])
@@ -28,7 +63,6 @@ class RepeatElement:
         self.repeat_name = parts[9]
         self.repeat_class = parts[10]
         self.remaining = ' '.join(parts[11:])
-        self.line = line
         self.line_num = line_num
         self.original_line = line
         
@@ -77,22 +111,63 @@ class RepeatElement:
         return self.original_line
 
 
+class GroupElement:
+    """
+    Mutable view of one RepeatRecords row while its overlap group is being
+    resolved. Groups never span scaffolds, so only coordinates and the
+    fields resolve_overlap_pair compares are carried.
+    """
+    __slots__ = ('row', 'start', 'end', 'score', 'divergence')
+    
+    def __init__(self, row: int, start: int, end: int, score: int, divergence: float):
+        self.row = row
+        self.start = start
+        self.end = end
+        self.score = score
+        self.divergence = divergence
+    
+    def overlaps(self, other) -> bool:
+        """Check if this element overlaps with another"""
+        return not (self.end < other.start or self.start > other.end)
+    
+    def contains(self, other) -> bool:
+        """Check if this element completely contains another"""
+        return self.start <= other.start and self.end >= other.end
+    
+    def length(self) -> int:
+        """Return length of element"""
+        return self.end - self.start + 1
+
+
+def is_simple_class(repeat_class: str) -> bool:
+    """Simple repeats and low complexity are resolved as if highly diverged"""
+    return 'Simple_repeat' in repeat_class or 'Low_complexity' in repeat_class
+
+
+def iter_repeatmasker(filepath: str) -> Iterator[RepeatElement]:
+    """Yield elements from a RepeatMasker .out file one line at a time"""
+    for i, line in iter_out_lines(filepath):
+        try:
+            yield RepeatElement(line, i)
+        except (IndexError, ValueError) as e:
+            print(f"Warning: Skipping malformed line {i}: {e}", file=sys.stderr)
+
+
 def parse_repeatmasker(filepath: str) -> List[RepeatElement]:
     """Parse RepeatMasker .out file"""
-    elements = []
-    with open(filepath, 'r') as f:
-        for i, line in enumerate(f, 1):
-            # Skip first 3 lines (header)
-            if i <= 3:
-                continue
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                elements.append(RepeatElement(line, i))
-            except (IndexError, ValueError) as e:
-                print(f"Warning: Skipping malformed line {i}: {e}", file=sys.stderr)
-    return elements
+    return list(iter_repeatmasker(filepath))
+
+
+def prepare_records(records: RepeatRecords) -> RepeatRecords:
+    """Assign Simple_repeat/Low_complexity hits high divergence, as RepeatElement does"""
+    records.divergence = np.where(records.class_mask(is_simple_class),
+                                  999.0, records.divergence)
+    return records
+
+
+def load_records(filepath: str, keep_lines: bool = True) -> RepeatRecords:
+    """Parse RepeatMasker .out or .out.gz file into a RepeatRecords store"""
+    return prepare_records(RepeatRecords.read(filepath, keep_lines))
 
 
 def resolve_overlap_pair(elem1: RepeatElement, elem2: RepeatElement, 
@@ -157,51 +232,458 @@ def resolve_overlap_pair(elem1: RepeatElement, elem2: RepeatElement,
         return (winner, loser)
 
 
+def overlap_groups(starts: List[int], ends: List[int]) -> Iterator[Tuple[int, List[int]]]:
+    """
+    Split the elements of one scaffold, sorted by start, into overlap groups.
+    Yields (index, overlapping) where overlapping lists the later elements
+    that overlap element `index`; the next group starts after the last of them.
+    """
+    i = 0
+    while i < len(starts):
+        start, end = starts[i], ends[i]
+        j = i + 1
+        
+        # Find all overlapping elements
+        overlapping = []
+        while j < len(starts):
+            if not (end < starts[j] or start > ends[j]):
+                overlapping.append(j)
+            elif starts[j] > end:
+                break
+            j += 1
+        
+        yield i, overlapping
+        i = overlapping[-1] + 1 if overlapping else i + 1
+
+
+def record_cluster(stats: Dict, size: int):
+    """Count one resolved overlap cluster of the given size"""
+    if stats is not None:
+        stats['clusters'] = stats.get('clusters', 0) + 1
+        stats['largest_cluster'] = max(stats.get('largest_cluster', 0), size)
+
+
 def resolve_overlaps(elements: List[RepeatElement], resolution: str, 
-                     progress_callback=None) -> List[RepeatElement]:
+                     progress_callback=None, engine: str = 'sweep',
+                     stats: Dict = None) -> List[RepeatElement]:
     """Resolve all overlaps in list of elements"""
     if not elements:
         return []
     
+    group_resolver = resolve_group if engine == 'sweep' else resolve_group_pairwise
+    
     # Sort by scaffold and start position
     elements = sorted(elements, key=lambda x: (x.scaffold, x.start, x.line_num))
     
     resolved = []
-    i = 0
     total = len(elements)
+    offset = 0
     
-    while i < len(elements):
-        if progress_callback and i % 1000 == 0:
-            progress_callback(i, total)
-        
-        current = elements[i]
-        j = i + 1
-        
-        # Find all overlapping elements
-        overlapping = []
-        while j < len(elements) and elements[j].scaffold == current.scaffold:
-            if current.overlaps(elements[j]):
-                overlapping.append(j)
-                j += 1
-            elif elements[j].start > current.end:
-                break
+    for scaffold, run in groupby(elements, key=lambda x: x.scaffold):
+        run = list(run)
+        for i, overlapping in overlap_groups([e.start for e in run], [e.end for e in run]):
+            if progress_callback and (offset + i) % 1000 == 0:
+                progress_callback(offset + i, total)
+            
+            if not overlapping:
+                resolved.append(run[i])
             else:
-                j += 1
-        
-        if not overlapping:
-            resolved.append(current)
-            i += 1
-        else:
-            # Resolve overlaps iteratively
-            group = [current] + [elements[idx] for idx in overlapping]
-            resolved_group = resolve_group(group, resolution)
-            resolved.extend(resolved_group)
-            i = max(overlapping) + 1
+                # Resolve overlaps iteratively
+                group = [run[i]] + [run[idx] for idx in overlapping]
+                resolved.extend(group_resolver(group, resolution))
+                record_cluster(stats, len(group))
+        offset += len(run)
     
     return resolved
 
 
+def resolve_record_rows(records: RepeatRecords, resolution: str, progress_callback=None,
+                        engine: str = 'sweep', stats: Dict = None
+                        ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Resolve all overlaps in a RepeatRecords store, with the same grouping and
+    output order as resolve_overlaps. Returns the surviving rows in output
+    order and their (possibly trimmed) starts and ends. Objects are only
+    created for elements in an overlap group, one scaffold at a time.
+    """
+    group_resolver = resolve_group if engine == 'sweep' else resolve_group_pairwise
+    
+    order = records.sort_order()
+    bounds = np.flatnonzero(np.diff(records.scaffold[order])) + 1
+    out_rows, out_starts, out_ends = array('q'), array('q'), array('q')
+    total = len(order)
+    offset = 0
+    
+    for run in np.split(order, bounds) if total else []:
+        rows = run.tolist()
+        starts = records.start[run].tolist()
+        ends = records.end[run].tolist()
+        for i, overlapping in overlap_groups(starts, ends):
+            if progress_callback and (offset + i) % 1000 == 0:
+                progress_callback(offset + i, total)
+            
+            if not overlapping:
+                out_rows.append(rows[i])
+                out_starts.append(starts[i])
+                out_ends.append(ends[i])
+                continue
+            
+            group = [GroupElement(rows[k], starts[k], ends[k],
+                                  int(records.score[rows[k]]),
+                                  float(records.divergence[rows[k]]))
+                     for k in [i] + overlapping]
+            for elem in group_resolver(group, resolution):
+                out_rows.append(elem.row)
+                out_starts.append(elem.start)
+                out_ends.append(elem.end)
+            record_cluster(stats, len(group))
+        offset += len(rows)
+    
+    return (np.frombuffer(out_rows, dtype=np.int64), np.frombuffer(out_starts, dtype=np.int64),
+            np.frombuffer(out_ends, dtype=np.int64))
+
+
+def resolved_records(records: RepeatRecords, rows: np.ndarray, starts: np.ndarray,
+                     ends: np.ndarray) -> RepeatRecords:
+    """Store of the surviving rows, in output order, with trimmed coordinates"""
+    resolved = records.take(rows)
+    resolved.start = starts
+    resolved.end = ends
+    return resolved
+
+
+def resolve_records(records: RepeatRecords, resolution: str, progress_callback=None,
+                    engine: str = 'sweep', stats: Dict = None) -> RepeatRecords:
+    """Resolve all overlaps in a RepeatRecords store"""
+    rows, starts, ends = resolve_record_rows(records, resolution, progress_callback,
+                                             engine, stats)
+    return resolved_records(records, rows, starts, ends)
+
+
+def resolve_chunk(chunks: List[RepeatRecords], resolution: str,
+                  engine: str = 'sweep') -> Tuple[List[Tuple[np.ndarray, np.ndarray, np.ndarray]], List[Dict]]:
+    """Resolve a list of record stores in a worker process, with the cluster statistics of each"""
+    resolved, stats = [], []
+    for chunk in chunks:
+        chunk_stats = {}
+        resolved.append(resolve_record_rows(chunk, resolution, engine=engine, stats=chunk_stats))
+        stats.append(chunk_stats)
+    return resolved, stats
+
+
+def merge_stats(stats: Dict, chunk_stats: Dict):
+    """Add a worker's cluster statistics to the running totals"""
+    stats['clusters'] = stats.get('clusters', 0) + chunk_stats.get('clusters', 0)
+    stats['largest_cluster'] = max(stats.get('largest_cluster', 0),
+                                   chunk_stats.get('largest_cluster', 0))
+
+
+def balance_chunks(blocks: List[np.ndarray], n_chunks: int) -> List[List[np.ndarray]]:
+    """
+    Split scaffold blocks into at most n_chunks chunks of similar element
+    count, placing the largest blocks first onto the lightest chunk.
+    """
+    n_chunks = max(1, min(n_chunks, len(blocks)))
+    heap = [(0, k) for k in range(n_chunks)]
+    chunks = [[] for _ in range(n_chunks)]
+    for block in sorted(blocks, key=len, reverse=True):
+        load, k = heapq.heappop(heap)
+        chunks[k].append(block)
+        heapq.heappush(heap, (load + len(block), k))
+    return [chunk for chunk in chunks if chunk]
+
+
+def resolve_records_parallel(records: RepeatRecords, resolution: str, threads: int,
+                             engine: str = 'sweep', stats: Dict = None) -> RepeatRecords:
+    """
+    Resolve overlaps with scaffolds sharded across a process pool. Scaffolds
+    never share an overlap group, so ordering the per-scaffold results by
+    scaffold gives exactly the output of resolve_records.
+    """
+    by_scaffold = np.argsort(records.scaffold, kind='stable')
+    bounds = np.flatnonzero(np.diff(records.scaffold[by_scaffold])) + 1
+    blocks = np.split(by_scaffold, bounds) if len(records) else []
+    
+    chunks = balance_chunks(blocks, threads * CHUNKS_PER_WORKER)
+    print(f"Resolving {len(blocks)} scaffolds in {len(chunks)} chunks "
+          f"with {threads} processes...")
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        futures = {}
+        for chunk in chunks:
+            chunk_rows = np.concatenate(chunk)
+            chunk_records = records.take(chunk_rows, keep_lines=False)
+            futures[executor.submit(resolve_chunk, [chunk_records], resolution, engine)] = chunk_rows
+        for done, future in enumerate(as_completed(futures), 1):
+            [(rows, starts, ends)], [chunk_stats] = future.result()
+            results.append((futures[future][rows], starts, ends))
+            if stats is not None:
+                merge_stats(stats, chunk_stats)
+            print(f"Progress: {done}/{len(chunks)} chunks", end='\r')
+    
+    if not results:
+        return records.take(np.zeros(0, dtype=np.int64))
+    rows, starts, ends = (np.concatenate(column) for column in zip(*results))
+    
+    # Each scaffold came back whole from one chunk, so a stable sort on
+    # scaffold name keeps every scaffold's own output order
+    scaffold_rank = records.scaffold_ranks()
+    order = np.argsort(scaffold_rank[records.scaffold[rows]], kind='stable')
+    return resolved_records(records, rows[order], starts[order], ends[order])
+
+
+def resolve_blocks(blocks: Iterable[RepeatRecords], resolution: str,
+                   threads: int = 1, engine: str = 'sweep',
+                   stats: Dict = None) -> Iterator[RepeatRecords]:
+    """
+    Resolve scaffold blocks, yielding results in input order. With more than
+    one thread, blocks are batched into tasks of about STREAM_BATCH_ELEMENTS
+    elements and at most 2 * threads tasks are in flight at once.
+    """
+    if threads <= 1:
+        for block in blocks:
+            yield resolve_records(block, resolution, engine=engine, stats=stats)
+        return
+    
+    def collect(task):
+        future, batch = task
+        batch_resolved, batch_stats = future.result()
+        for block, (rows, starts, ends), block_stats in zip(batch, batch_resolved, batch_stats):
+            if stats is not None:
+                merge_stats(stats, block_stats)
+            yield resolved_records(block, rows, starts, ends)
+    
+    def submit(batch):
+        columns = [block.take(slice(None), keep_lines=False) for block in batch]
+        return executor.submit(resolve_chunk, columns, resolution, engine), batch
+    
+    with ProcessPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        batch, batch_size = [], 0
+        for block in blocks:
+            batch.append(block)
+            batch_size += len(block)
+            if batch_size >= STREAM_BATCH_ELEMENTS:
+                pending.append(submit(batch))
+                batch, batch_size = [], 0
+                while len(pending) > 2 * threads:
+                    yield from collect(pending.popleft())
+        if batch:
+            pending.append(submit(batch))
+        while pending:
+            yield from collect(pending.popleft())
+
+
+class ActiveSet:
+    """
+    Active elements of a group keyed by their slot in the output order.
+    
+    A segment tree over slots holds the minimum start and maximum end of
+    each subtree, so the first later slot overlapping an interval is found
+    without scanning every slot after it.
+    """
+    def __init__(self, capacity: int):
+        self.size = 1
+        while self.size < capacity:
+            self.size <<= 1
+        self.min_start = [float('inf')] * (2 * self.size)
+        self.max_end = [-1] * (2 * self.size)
+    
+    def set(self, slot: int, elem: RepeatElement):
+        """Store element coordinates at the given slot"""
+        while slot >= self.size:
+            self._grow()
+        self._update(slot, elem.start, elem.end)
+    
+    def clear(self, slot: int):
+        """Remove the element at the given slot"""
+        self._update(slot, float('inf'), -1)
+    
+    def _update(self, slot: int, start, end):
+        min_start, max_end = self.min_start, self.max_end
+        node = self.size + slot
+        min_start[node] = start
+        max_end[node] = end
+        node >>= 1
+        while node:
+            left = 2 * node
+            new_start = min(min_start[left], min_start[left + 1])
+            new_end = max(max_end[left], max_end[left + 1])
+            if min_start[node] == new_start and max_end[node] == new_end:
+                break
+            min_start[node] = new_start
+            max_end[node] = new_end
+            node >>= 1
+    
+    def _grow(self):
+        old_size = self.size
+        leaves_start = self.min_start[old_size:]
+        leaves_end = self.max_end[old_size:]
+        self.size *= 2
+        self.min_start = [float('inf')] * (2 * self.size)
+        self.max_end = [-1] * (2 * self.size)
+        self.min_start[self.size:self.size + old_size] = leaves_start
+        self.max_end[self.size:self.size + old_size] = leaves_end
+        for node in range(self.size - 1, 0, -1):
+            left = 2 * node
+            self.min_start[node] = min(self.min_start[left], self.min_start[left + 1])
+            self.max_end[node] = max(self.max_end[left], self.max_end[left + 1])
+    
+    def first_overlap(self, after: int, start: int, end: int) -> int:
+        """Return the lowest slot above `after` overlapping [start, end], or -1"""
+        min_start, max_end = self.min_start, self.max_end
+        stack = [(1, 0, self.size - 1)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if hi <= after or min_start[node] > end or max_end[node] < start:
+                continue
+            if lo == hi:
+                return lo
+            mid = (lo + hi) // 2
+            # Right child first so the left subtree is searched first
+            stack.append((2 * node + 1, mid + 1, hi))
+            stack.append((2 * node, lo, mid))
+        return -1
+    
+    def overlapping(self, start: int, end: int) -> List[int]:
+        """Return all slots overlapping [start, end]"""
+        min_start, max_end, size = self.min_start, self.max_end, self.size
+        slots = []
+        stack = [1]
+        while stack:
+            node = stack.pop()
+            if min_start[node] > end or max_end[node] < start:
+                continue
+            if node >= size:
+                slots.append(node - size)
+            else:
+                stack.append(2 * node)
+                stack.append(2 * node + 1)
+        return slots
+
+
 def resolve_group(group: List[RepeatElement], resolution: str) -> List[RepeatElement]:
+    """
+    Resolve overlaps within a group of overlapping elements.
+    
+    Small groups usually settle in a few passes of resolve_group_pairwise, so
+    those are tried first; large groups, and small ones still changing after
+    SWEEP_AFTER_PASSES passes, are handed to sweep_group. Output and output
+    order are identical to resolve_group_pairwise.
+    """
+    if len(group) <= 1:
+        return group
+    if len(group) >= SWEEP_MIN_GROUP:
+        return sweep_group(group, resolution)
+    
+    active = group
+    for _ in range(SWEEP_AFTER_PASSES):
+        active, changed = pairwise_pass(active, resolution)
+        if not changed:
+            return active
+    return sweep_group(active, resolution)
+
+
+def sweep_group(group: List[RepeatElement], resolution: str) -> List[RepeatElement]:
+    """
+    Sweep-line version of resolve_group_pairwise.
+    
+    Each element sits in a slot of the output order; a pass sweeps the slots
+    in order and pairs each one with the first later slot it overlaps, the
+    loser being trimmed and moved to a new slot at the end. Only slots that
+    still have a later overlapping slot are visited, so elements that are
+    already resolved cost nothing in later passes. This keeps stacked
+    clusters, where one element outlives thousands of passes, near-linear.
+    """
+    if len(group) <= 1:
+        return group
+    
+    # Output order is a linked list of slots, each holding one element
+    slot_elems = list(group)
+    next_slot = list(range(1, len(group))) + [-1]
+    prev_slot = [-1] + list(range(len(group) - 1))
+    head, tail = 0, len(group) - 1
+    
+    # All live slots, and the live slots not queued for a visit
+    active = ActiveSet(2 * len(group))
+    idle = ActiveSet(2 * len(group))
+    for slot, elem in enumerate(group):
+        active.set(slot, elem)
+    
+    # Slots queued for the next pass
+    candidates = list(range(len(group)))
+    while candidates:
+        sweep = sorted(candidates)
+        candidates = []
+        cursor = -1
+        while sweep:
+            slot = heapq.heappop(sweep)
+            elem1 = slot_elems[slot]
+            if elem1 is None:
+                continue
+            cursor = slot
+            
+            # The next few slots usually hold the overlap in dense groups
+            other = next_slot[slot]
+            for _ in range(SWEEP_SCAN_AHEAD):
+                if other < 0:
+                    break
+                elem2 = slot_elems[other]
+                if elem2.start <= elem1.end and elem2.end >= elem1.start:
+                    break
+                other = next_slot[other]
+            else:
+                other = active.first_overlap(slot, elem1.start, elem1.end)
+            if other < 0:
+                idle.set(slot, elem1)
+                continue
+            
+            winner, loser = resolve_overlap_pair(elem1, slot_elems[other], resolution)
+            
+            # Winner takes this slot, the other slot is unlinked
+            slot_elems[slot] = winner
+            active.set(slot, winner)
+            candidates.append(slot)
+            slot_elems[other] = None
+            active.clear(other)
+            idle.clear(other)
+            before, after = prev_slot[other], next_slot[other]
+            next_slot[before] = after
+            if after >= 0:
+                prev_slot[after] = before
+            else:
+                tail = before
+            
+            if loser is not None:
+                # Every idle slot the loser overlaps gains a later overlap
+                # once the loser moves to the end, so queue it again
+                for earlier in idle.overlapping(loser.start, loser.end):
+                    idle.clear(earlier)
+                    if earlier > cursor:
+                        heapq.heappush(sweep, earlier)
+                    else:
+                        candidates.append(earlier)
+                
+                # Put loser back for re-evaluation in a new slot at the end
+                new_slot = len(slot_elems)
+                slot_elems.append(loser)
+                next_slot.append(-1)
+                prev_slot.append(tail)
+                next_slot[tail] = new_slot
+                tail = new_slot
+                active.set(new_slot, loser)
+                idle.set(new_slot, loser)
+    
+    resolved = []
+    slot = head
+    while slot >= 0:
+        resolved.append(slot_elems[slot])
+        slot = next_slot[slot]
+    return resolved
+
+
+def resolve_group_pairwise(group: List[RepeatElement], resolution: str) -> List[RepeatElement]:
     """Resolve overlaps within a group of overlapping elements"""
     if len(group) <= 1:
         return group
@@ -211,68 +693,109 @@ def resolve_group(group: List[RepeatElement], resolution: str) -> List[RepeatEle
     changed = True
     
     while changed:
-        changed = False
-        new_active = []
-        processed = set()
+        active, changed = pairwise_pass(active, resolution)
+    
+    return active
+
+
+def pairwise_pass(active: List[RepeatElement], resolution: str) -> Tuple[List[RepeatElement], bool]:
+    """
+    One pass of resolve_group_pairwise: pair each element with the first later
+    element it overlaps. Returns the new active list and whether anything changed.
+    """
+    active = active[:]
+    changed = False
+    new_active = []
+    processed = set()
+    
+    for i, elem1 in enumerate(active):
+        if i in processed:
+            continue
         
-        for i, elem1 in enumerate(active):
-            if i in processed:
+        # Check for overlaps with remaining elements
+        found_overlap = False
+        for j, elem2 in enumerate(active[i+1:], start=i+1):
+            if j in processed:
                 continue
             
-            # Check for overlaps with remaining elements
-            found_overlap = False
-            for j, elem2 in enumerate(active[i+1:], start=i+1):
-                if j in processed:
-                    continue
-                
-                if elem1.overlaps(elem2):
-                    winner, loser = resolve_overlap_pair(elem1, elem2, resolution)
-                    new_active.append(winner)
-                    if loser is not None:
-                        # Put loser back for re-evaluation
-                        active.append(loser)
-                    processed.add(i)
-                    processed.add(j)
-                    found_overlap = True
-                    changed = True
-                    break
-            
-            if not found_overlap:
-                new_active.append(elem1)
+            if elem1.overlaps(elem2):
+                winner, loser = resolve_overlap_pair(elem1, elem2, resolution)
+                new_active.append(winner)
+                if loser is not None:
+                    # Put loser back for re-evaluation
+                    active.append(loser)
                 processed.add(i)
+                processed.add(j)
+                found_overlap = True
+                changed = True
+                break
         
-        active = new_active
+        if not found_overlap:
+            new_active.append(elem1)
+            processed.add(i)
     
-    return active
+    return new_active, changed
 
 
-def filter_elements(elements: List[RepeatElement], dmin: float = None, 
-                   dmax: float = None, min_hits: int = None) -> List[RepeatElement]:
-    """Filter elements by divergence and minimum hits"""
+def filter_elements(records: RepeatRecords, dmin: float = None, 
+                   dmax: float = None, min_hits: int = None,
+                   class_counts: Dict[str, int] = None) -> RepeatRecords:
+    """
+    Filter elements by divergence and minimum hits. Hits per class/family are
+    counted from `records` unless precomputed `class_counts` are given.
+    """
     # Filter by divergence
     if dmin is not None or dmax is not None:
-        filtered = []
-        for elem in elements:
-            if dmin is not None and elem.divergence < dmin:
-                continue
-            if dmax is not None and elem.divergence > dmax:
-                continue
-            filtered.append(elem)
-        elements = filtered
+        keep = np.ones(len(records), dtype=bool)
+        if dmin is not None:
+            keep &= records.divergence >= dmin
+        if dmax is not None:
+            keep &= records.divergence <= dmax
+        records = records.take(keep)
     
     # Filter by minimum hits per class/family
     if min_hits is not None:
-        class_counts = defaultdict(int)
-        for elem in elements:
-            class_counts[elem.repeat_class] += 1
-        
-        elements = [e for e in elements if class_counts[e.repeat_class] >= min_hits]
+        if class_counts is None:
+            counts = records.class_counts()
+        else:
+            counts = np.array([class_counts.get(c, 0) for c in records.repeat_classes] or [0])
+        records = records.take(counts[records.repeat_class] >= min_hits)
     
-    return elements
+    return records
 
 
-def write_output(elements: List[RepeatElement], output_prefix: str, 
-                output_type: str, split_by: str = None, progress_dir: str = None):
+def count_classes(records: RepeatRecords) -> Dict[str, int]:
+    """Count elements per class/family"""
+    return {repeat_class: int(count) for repeat_class, count
+            in zip(records.repeat_classes, records.class_counts()) if count}
+
+
+def get_class(repeat_class: str) -> str:
+    """Extract class from repeat_class field"""
+    return repeat_class.split('/')[0] if '/' in repeat_class else repeat_class
+
+
+def get_family(repeat_class: str) -> str:
+    """Extract family from repeat_class field"""
+    return repeat_class.split('/')[-1] if '/' in repeat_class else repeat_class
+
+
+def split_groups(records: RepeatRecords, split_by: str) -> Iterator[Tuple[str, RepeatRecords]]:
+    """
+    Yield (key, records) per TE class or family, keys in order of first
+    appearance and rows in their original order.
+    """
+    codes, keys = records.class_codes(get_class if split_by == 'class' else get_family)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    runs = np.split(order, bounds) if len(order) else []
+    for run in sorted(runs, key=lambda run: run[0]):
+        yield keys[codes[run[0]]], records.take(run)
+
+
+def write_output(records: RepeatRecords, output_prefix: str, 
+                output_type: str, split_by: str = None, progress_dir: str = None,
+                bgzip: bool = False):
     """Write output files"""
     
     if progress_dir:
@@ -282,43 +805,468 @@ def write_output(elements: List[RepeatElement], output_prefix: str,
             f.write(f"Writing output files...\n")
     
     if split_by:
-        # Group elements by split criterion
-        groups = defaultdict(list)
-        for elem in elements:
-            if split_by == 'class':
-                key = elem.get_class()
-            elif split_by == 'family':
-                key = elem.get_family()
-            else:
-                key = 'all'
-            groups[key].append(elem)
-        
-        # Write each group
-        for key, group_elems in groups.items():
-            write_group(group_elems, f"{output_prefix}.{key}", output_type)
+        # Write each class/family group
+        for key, group_records in split_groups(records, split_by):
+            write_group(group_records, f"{output_prefix}.{key}", output_type, bgzip)
     else:
-        write_group(elements, output_prefix, output_type)
+        write_group(records, output_prefix, output_type, bgzip)
     
     if progress_dir:
         with open(progress_file, 'a') as f:
             f.write(f"Output complete!\n")
 
 
-def write_group(elements: List[RepeatElement], prefix: str, output_type: str):
+def write_group(records: RepeatRecords, prefix: str, output_type: str, bgzip: bool = False):
     """Write a group of elements to file(s)"""
     if output_type in ['out', 'both']:
         out_file = f"{prefix}.out"
         with open(out_file, 'w') as f:
-            for elem in elements:
-                f.write(elem.to_out() + '\n')
-        print(f"Wrote {len(elements)} elements to {out_file}")
+            f.writelines(line + '\n' for line in records.out_lines())
+        print(f"Wrote {len(records)} elements to {out_file}")
     
-    if output_type in ['bed', 'both']:
+    if output_type in ['bed', 'both'] and bgzip:
+        # The index needs hits sorted by scaffold and start
+        bed_file = f"{prefix}.bed.gz"
+        with IndexedBedWriter(bed_file) as f:
+            f.writelines(line + '\n' for line in records.take(records.sort_order(), keep_lines=False).bed_lines())
+        print(f"Wrote {len(records)} elements to {bed_file} (indexed)")
+    elif output_type in ['bed', 'both']:
         bed_file = f"{prefix}.bed"
         with open(bed_file, 'w') as f:
-            for elem in elements:
-                f.write(elem.to_bed() + '\n')
-        print(f"Wrote {len(elements)} elements to {bed_file}")
+            f.writelines(line + '\n' for line in records.bed_lines())
+        print(f"Wrote {len(records)} elements to {bed_file}")
+
+
+class StreamingWriter:
+    """Writes resolved elements to their output files as they are produced"""
+    def __init__(self, output_prefix: str, output_type: str, split_by: str = None,
+                 bgzip: bool = False, verbose: bool = True):
+        self.output_prefix = output_prefix
+        self.output_type = output_type
+        self.split_by = split_by
+        self.bgzip = bgzip
+        self.verbose = verbose
+        self.handles = {}
+        self.counts = defaultdict(int)
+    
+    def write(self, records: RepeatRecords):
+        """Append a block of elements to the output file(s)"""
+        if self.split_by:
+            groups = ((f"{self.output_prefix}.{key}", group_records) for key, group_records
+                      in split_groups(records, self.split_by))
+        else:
+            groups = [(self.output_prefix, records)]
+        
+        for prefix, group_records in groups:
+            if self.output_type in ['out', 'both']:
+                self._handle(f"{prefix}.out").writelines(
+                    line + '\n' for line in group_records.out_lines())
+                self.counts[f"{prefix}.out"] += len(group_records)
+            if self.output_type in ['bed', 'both'] and self.bgzip:
+                # Each block is one scaffold; the index needs it sorted by start
+                sorted_records = group_records.take(group_records.sort_order(), keep_lines=False)
+                self._handle(f"{prefix}.bed.gz").writelines(
+                    line + '\n' for line in sorted_records.bed_lines())
+                self.counts[f"{prefix}.bed.gz"] += len(group_records)
+            elif self.output_type in ['bed', 'both']:
+                self._handle(f"{prefix}.bed").writelines(
+                    line + '\n' for line in group_records.bed_lines())
+                self.counts[f"{prefix}.bed"] += len(group_records)
+    
+    def _handle(self, path: str):
+        if path not in self.handles:
+            self.handles[path] = IndexedBedWriter(path) if path.endswith('.bed.gz') else open(path, 'w')
+        return self.handles[path]
+    
+    def close(self):
+        """Close all output files"""
+        for path, handle in self.handles.items():
+            handle.close()
+            if self.verbose:
+                print(f"Wrote {self.counts[path]} elements to {path}")
+        self.handles = {}
+
+
+def checkpoint_key(args) -> Dict:
+    """Settings a checkpoint was written with; a resumed run must match them"""
+    stat = os.stat(args.input)
+    return {'version': CHECKPOINT_VERSION, 'input': os.path.abspath(args.input),
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'overlap_resolution': args.overlap_resolution, 'engine': args.engine,
+            'min_divergence': args.min_divergence, 'max_divergence': args.max_divergence,
+            'min_hits': args.min_hits, 'split': args.split,
+            'output_type': args.output_type, 'bgzip': args.bgzip}
+
+
+class Checkpoint:
+    """
+    Per-scaffold checkpoint of a streaming run.
+    
+    Resolved scaffolds are written through a StreamingWriter into numbered
+    shard directories. A shard is written under a temporary name, renamed
+    into place and then recorded by appending a line to manifest.jsonl, so
+    the manifest only ever lists complete shards, each covering the next
+    run of whole scaffolds in input order. The manifest starts with the
+    run's settings (checkpoint_key) and per-class hit counts, and every
+    shard line carries the running totals, so a resumed run skips the
+    scaffolds already done and reports the same totals. When all
+    scaffolds are done, finish() concatenates the shards into the final
+    outputs and removes the shards and manifest.
+    """
+    def __init__(self, directory: str, key: Dict, output_type: str, split_by: str = None,
+                 bgzip: bool = False):
+        self.directory = directory
+        self.key = key
+        self.output_type = output_type
+        self.split_by = split_by
+        self.bgzip = bgzip
+        self.manifest = os.path.join(directory, 'manifest.jsonl')
+        self.class_counts = None
+        self.shards = []
+        self.complete = False
+        self.started = False
+        self._load()
+        self.writer = None
+        self.shard_elements = 0
+        self.shard_scaffolds = []
+        self.shard_opened = 0.0
+    
+    def _load(self):
+        try:
+            with open(self.manifest) as f:
+                lines = f.read().split('\n')
+        except FileNotFoundError:
+            lines = []
+        entries = []
+        # A line cut short by a kill is the last one and is ignored
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+        if entries and entries[0].get('key') == self.key:
+            self.class_counts = entries[0].get('class_counts')
+            self.started = True
+            for entry in entries[1:]:
+                if entry.get('complete'):
+                    self.complete = True
+                else:
+                    self.shards.append(entry)
+        elif entries:
+            print(f"Warning: Checkpoint in {self.directory} was written for different "
+                  f"input or settings; starting over", file=sys.stderr)
+        if not self.started and os.path.exists(self.manifest):
+            os.remove(self.manifest)
+        os.makedirs(self.directory, exist_ok=True)
+        # Shards renamed into place but never recorded are redone
+        recorded = {entry['shard'] for entry in self.shards}
+        for name in self._shard_dirs():
+            if name not in recorded:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        if self.shards:
+            done = self.shards[-1]
+            print(f"Resuming from checkpoint: {done['scaffolds']} scaffolds "
+                  f"({done['totals']['loaded']} elements) already resolved")
+    
+    @property
+    def scaffolds(self) -> int:
+        """Number of input scaffolds covered by committed shards"""
+        return self.shards[-1]['scaffolds'] if self.shards else 0
+    
+    @property
+    def last_scaffold(self) -> str:
+        return self.shards[-1]['last'] if self.shards else None
+    
+    def totals(self) -> Tuple[Dict, Dict]:
+        """(element counts, cluster stats) of the committed shards"""
+        if not self.shards:
+            return {}, {}
+        return dict(self.shards[-1]['totals']), dict(self.shards[-1]['stats'])
+    
+    def start(self, class_counts: Dict[str, int] = None):
+        """Write the manifest header of a new checkpoint"""
+        if not self.started:
+            self.class_counts = class_counts
+            self._append({'key': self.key, 'class_counts': class_counts})
+            self.started = True
+    
+    def _append(self, entry: Dict):
+        with open(self.manifest, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _shard_name(self, number: int) -> str:
+        return f"{number:06d}"
+    
+    def _shard_dirs(self) -> List[str]:
+        """Shard directories, committed or not; other files in the directory are left alone"""
+        return [name for name in os.listdir(self.directory)
+                if len(name) >= 6 and name[:6].isdigit() and name[6:] in ('', '.tmp')]
+    
+    def write(self, records: RepeatRecords):
+        """Add one resolved scaffold block to the open shard"""
+        if self.writer is None:
+            tmp_dir = os.path.join(self.directory, self._shard_name(len(self.shards)) + '.tmp')
+            os.makedirs(tmp_dir, exist_ok=True)
+            self.writer = StreamingWriter(os.path.join(tmp_dir, 'part'), self.output_type,
+                                          self.split_by, self.bgzip, verbose=False)
+            self.shard_opened = time.perf_counter()
+        self.writer.write(records)
+    
+    def scaffold_done(self, scaffold: str, block_size: int, totals: Dict, stats: Dict):
+        """
+        Record that the scaffold last passed to write() is complete, and
+        commit the shard if it is large or old enough
+        """
+        self.shard_scaffolds.append(scaffold)
+        self.shard_elements += block_size
+        if (self.shard_elements >= CHECKPOINT_SHARD_ELEMENTS or
+                time.perf_counter() - self.shard_opened >= CHECKPOINT_SHARD_SECONDS):
+            self.commit(totals, stats)
+    
+    def commit(self, totals: Dict, stats: Dict):
+        """Move the open shard into place and record it in the manifest"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        name = self._shard_name(len(self.shards))
+        tmp_dir = os.path.join(self.directory, name + '.tmp')
+        prefix = os.path.join(tmp_dir, 'part')
+        files = {path[len(prefix):]: count for path, count in self.writer.counts.items()}
+        os.replace(tmp_dir, os.path.join(self.directory, name))
+        entry = {'shard': name, 'scaffolds': self.scaffolds + len(self.shard_scaffolds),
+                 'last': self.shard_scaffolds[-1], 'files': files,
+                 'totals': dict(totals), 'stats': dict(stats)}
+        self._append(entry)
+        self.shards.append(entry)
+        self.writer = None
+        self.shard_elements = 0
+        self.shard_scaffolds = []
+    
+    def close(self):
+        """Drop a shard left open by an interrupted run; its scaffolds are redone on resume"""
+        if self.writer is not None:
+            self.writer.close()
+            shutil.rmtree(os.path.join(self.directory, self._shard_name(len(self.shards)) + '.tmp'),
+                          ignore_errors=True)
+            self.writer = None
+    
+    def finish(self, output_prefix: str, totals: Dict, stats: Dict):
+        """Commit the last shard, concatenate all shards into the outputs and clean up"""
+        self.commit(totals, stats)
+        if not self.complete:
+            self._append({'complete': True})
+            self.complete = True
+        suffixes = {}
+        for entry in self.shards:
+            for suffix, count in entry['files'].items():
+                suffixes[suffix] = suffixes.get(suffix, 0) + count
+        print(f"Concatenating {len(self.shards)} checkpoint shards...")
+        for suffix, count in suffixes.items():
+            path = output_prefix + suffix
+            shard_paths = [os.path.join(self.directory, entry['shard'], 'part' + suffix)
+                           for entry in self.shards if suffix in entry['files']]
+            if path.endswith('.bed.gz'):
+                # Shards are BGZF (gzip members); the index is rebuilt for the whole file
+                with IndexedBedWriter(path) as out:
+                    for shard_path in shard_paths:
+                        with gzip.open(shard_path, 'rt') as f:
+                            out.writelines(f)
+            else:
+                with open(path, 'wb') as out:
+                    for shard_path in shard_paths:
+                        with open(shard_path, 'rb') as f:
+                            shutil.copyfileobj(f, out)
+            print(f"Wrote {count} elements to {path}")
+        # The manifest goes first: a kill during the cleanup then leaves only
+        # unrecorded shards, which the next run's _load sweeps away
+        os.remove(self.manifest)
+        for name in self._shard_dirs():
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+def run_streaming(args, metrics: RunMetrics):
+    """
+    Resolve one scaffold block at a time and write it out immediately, so
+    memory is bounded by the largest scaffold rather than the whole file.
+    Scaffolds are written in input order. With a checkpoint directory,
+    finished scaffolds are committed to shards there and a rerun resumes
+    after the last committed scaffold.
+    """
+    keep_lines = args.output_type in ['out', 'both']
+    
+    def scaffold_blocks(keep_lines):
+        for block in metrics.timed('parse', RepeatRecords.iter_scaffold_blocks(args.input, keep_lines)):
+            yield prepare_records(block)
+    
+    checkpoint = None
+    if args.checkpoint_dir:
+        checkpoint = Checkpoint(args.checkpoint_dir, checkpoint_key(args),
+                                args.output_type, args.split, args.bgzip)
+    
+    class_counts = checkpoint.class_counts if checkpoint else None
+    if args.min_hits is not None and class_counts is None:
+        # Hits per class/family need a full first pass over the file
+        print(f"Counting hits per class/family...")
+        class_counts = defaultdict(int)
+        for block in scaffold_blocks(keep_lines=False):
+            with metrics.stage('filter'):
+                block = filter_elements(block, args.min_divergence, args.max_divergence)
+                for repeat_class, count in count_classes(block).items():
+                    class_counts[repeat_class] += count
+    if checkpoint:
+        checkpoint.start(class_counts)
+    
+    progress_file = None
+    if args.progress_dir:
+        os.makedirs(args.progress_dir, exist_ok=True)
+        progress_file = os.path.join(args.progress_dir, f"{args.prefix}_progress.txt")
+        with open(progress_file, 'w') as f:
+            f.write(f"Streaming {args.input}\n")
+    
+    print(f"Resolving overlaps using '{args.overlap_resolution}' strategy, one scaffold at a time...")
+    stats = {}
+    counts = defaultdict(int)
+    skip = 0
+    if checkpoint:
+        writer = checkpoint
+        done_counts, stats = checkpoint.totals()
+        counts.update(done_counts)
+        skip = checkpoint.scaffolds
+    else:
+        writer = StreamingWriter(args.prefix, args.output_type, args.split, args.bgzip)
+    # (scaffold, loaded, kept) of the blocks sent to resolve_blocks, in order.
+    # With worker processes the reader runs ahead of the written output, so
+    # checkpoint totals are kept separately, per scaffold written
+    pending_blocks = deque()
+    done = defaultdict(int, counts)
+    
+    def filtered_blocks():
+        if checkpoint and checkpoint.complete:
+            return
+        for ordinal, block in enumerate(scaffold_blocks(keep_lines), 1):
+            scaffold = block.scaffolds[int(block.scaffold[0])]
+            if ordinal <= skip:
+                if ordinal == skip and scaffold != checkpoint.last_scaffold:
+                    raise ValueError(f"Scaffold {ordinal} is {scaffold}, but the checkpoint "
+                                     f"ends with {checkpoint.last_scaffold}")
+                continue
+            counts['scaffolds'] += 1
+            counts['loaded'] += len(block)
+            counts['largest'] = max(counts['largest'], len(block))
+            loaded = len(block)
+            # Line number of the block's last hit, i.e. input lines read so far
+            metrics.update(lines=int(block.line_num[-1]))
+            with metrics.stage('filter'):
+                block = filter_elements(block, args.min_divergence, args.max_divergence,
+                                        args.min_hits, class_counts)
+            counts['kept'] += len(block)
+            metrics.count(scaffolds=1, elements=loaded, kept=len(block))
+            pending_blocks.append((scaffold, loaded, len(block)))
+            print(f"Scaffolds: {counts['scaffolds']}, elements: {counts['loaded']}", end='\r')
+            
+            if progress_file and counts['scaffolds'] % 1000 == 0:
+                with open(progress_file, 'a') as f:
+                    f.write(f"Scaffolds: {counts['scaffolds']}, elements: {counts['loaded']}\n")
+            yield block
+    
+    t0 = time.perf_counter()
+    try:
+        resolved_blocks = resolve_blocks(filtered_blocks(), args.overlap_resolution,
+                                         args.threads, args.engine, stats)
+        for resolved in metrics.timed('resolve', resolved_blocks):
+            with metrics.stage('write'):
+                writer.write(resolved)
+                counts['written'] += len(resolved)
+                if checkpoint:
+                    scaffold, loaded, kept = pending_blocks.popleft()
+                    done['scaffolds'] += 1
+                    done['loaded'] += loaded
+                    done['largest'] = max(done['largest'], loaded)
+                    done['kept'] += kept
+                    done['written'] += len(resolved)
+                    checkpoint.scaffold_done(scaffold, loaded, done, stats)
+            metrics.cluster(stats.get('largest_cluster', 0))
+            metrics.count(resolved=len(resolved))
+        if checkpoint:
+            with metrics.stage('write'):
+                checkpoint.finish(args.prefix, done, stats)
+    finally:
+        with metrics.stage('write'):
+            writer.close()
+    elapsed = time.perf_counter() - t0
+    
+    print(f"\nLoaded {counts['loaded']} elements on {counts['scaffolds']} scaffolds "
+          f"(largest scaffold: {counts['largest']} elements)")
+    print(f"After filtering: {counts['kept']} elements")
+    print(f"Resolved: {counts['written']} elements")
+    clusters = stats.get('clusters', 0)
+    rate = clusters / elapsed if elapsed > 0 else 0.0
+    print(f"Resolved {clusters} overlap clusters in {elapsed:.2f}s "
+          f"({rate:.1f} clusters/sec, largest cluster: {stats.get('largest_cluster', 0)} elements)")
+    
+    if progress_file:
+        with open(progress_file, 'a') as f:
+            f.write(f"Output complete!\n")
+
+
+def run_in_memory(args, metrics: RunMetrics):
+    """Load the whole file, then filter, resolve and write it"""
+    print(f"Reading RepeatMasker file: {args.input}")
+    with metrics.stage('parse'):
+        records = load_records(args.input, keep_lines=args.output_type in ['out', 'both'])
+    print(f"Loaded {len(records)} elements")
+    metrics.count(lines=int(records.line_num.max()) if len(records) else 0,
+                  elements=len(records))
+    
+    if args.progress_dir:
+        os.makedirs(args.progress_dir, exist_ok=True)
+        progress_file = os.path.join(args.progress_dir, f"{args.prefix}_progress.txt")
+        with open(progress_file, 'w') as f:
+            f.write(f"Loaded {len(records)} elements\n")
+    
+    print(f"Filtering elements...")
+    with metrics.stage('filter'):
+        records = filter_elements(records, args.min_divergence, 
+                                  args.max_divergence, args.min_hits)
+    print(f"After filtering: {len(records)} elements")
+    metrics.count(kept=len(records))
+    
+    print(f"Resolving overlaps using '{args.overlap_resolution}' strategy...")
+    
+    def progress(current, total):
+        pct = (current / total) * 100
+        print(f"Progress: {current}/{total} ({pct:.1f}%)", end='\r')
+        metrics.cluster(stats.get('largest_cluster', 0))
+        metrics.maybe_emit()
+    
+    stats = {}
+    t0 = time.perf_counter()
+    with metrics.stage('resolve'):
+        if args.threads > 1:
+            resolved = resolve_records_parallel(records, args.overlap_resolution,
+                                                args.threads, args.engine, stats)
+        else:
+            resolved = resolve_records(records, args.overlap_resolution, progress,
+                                       engine=args.engine, stats=stats)
+    elapsed = time.perf_counter() - t0
+    print(f"\nResolved: {len(resolved)} elements")
+    clusters = stats.get('clusters', 0)
+    rate = clusters / elapsed if elapsed > 0 else 0.0
+    print(f"Resolved {clusters} overlap clusters in {elapsed:.2f}s "
+          f"({rate:.1f} clusters/sec, largest cluster: {stats.get('largest_cluster', 0)} elements)")
+    metrics.cluster(stats.get('largest_cluster', 0))
+    metrics.count(resolved=len(resolved))
+    
+    print(f"Writing output files...")
+    with metrics.stage('write'):
+        write_output(resolved, args.prefix, args.output_type, 
+                    args.split, args.progress_dir, args.bgzip)
 
 
 def main():
@@ -328,7 +1276,7 @@ def main():
     )
     
     parser.add_argument('-i', '--input', required=True,
-                       help='Input RepeatMasker .out file')
+                       help='Input RepeatMasker .out or .out.gz file')
     parser.add_argument('-s', '--split', choices=['class', 'family'],
                        help='Split output by TE Class or Family')
     parser.add_argument('-ot', '--output-type', required=True,
@@ -349,43 +1297,41 @@ def main():
     parser.add_argument('--progress-dir', 
                        help='Directory for progress updates')
     parser.add_argument('-t', '--threads', type=int, default=1,
-                       help='Number of threads (currently single-threaded)')
+                       help='Number of worker processes; scaffolds are resolved '
+                            'in parallel when greater than 1 (default: 1)')
+    parser.add_argument('--engine', choices=['sweep', 'pairwise'], default='sweep',
+                       help='Overlap resolution engine; pairwise is the original '
+                            'quadratic scan, kept for cross-checking (default: sweep)')
+    parser.add_argument('--stream', action='store_true',
+                       help='Resolve and write one scaffold at a time to bound memory; '
+                            "each scaffold's hits must be contiguous in the input")
+    parser.add_argument('--bgzip', action='store_true',
+                       help='Write BED output as coordinate-sorted, block-gzipped .bed.gz '
+                            'with a tabix index (.bed.gz.tbi) for region queries')
+    parser.add_argument('--checkpoint-dir',
+                       help='Commit resolved scaffolds to shards in this directory so an '
+                            'interrupted run resumes where it stopped; implies --stream')
+    
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
     
-    # Set start method for multiprocessing
+    # Set start method for the scaffold worker processes
     mp.set_start_method('spawn', force=True)
     
-    print(f"Reading RepeatMasker file: {args.input}")
-    elements = parse_repeatmasker(args.input)
-    print(f"Loaded {len(elements)} elements")
-    
-    if args.progress_dir:
-        os.makedirs(args.progress_dir, exist_ok=True)
-        progress_file = os.path.join(args.progress_dir, f"{args.prefix}_progress.txt")
-        with open(progress_file, 'w') as f:
-            f.write(f"Loaded {len(elements)} elements\n")
-    
-    print(f"Filtering elements...")
-    elements = filter_elements(elements, args.min_divergence, 
-                              args.max_divergence, args.min_hits)
-    print(f"After filtering: {len(elements)} elements")
-    
-    print(f"Resolving overlaps using '{args.overlap_resolution}' strategy...")
-    
-    def progress(current, total):
-        pct = (current / total) * 100
-        print(f"Progress: {current}/{total} ({pct:.1f}%)", end='\r')
-    
-    resolved = resolve_overlaps(elements, args.overlap_resolution, progress)
-    print(f"\nResolved: {len(resolved)} elements")
-    
-    print(f"Writing output files...")
-    write_output(resolved, args.prefix, args.output_type, 
-                args.split, args.progress_dir)
+    metrics = RunMetrics('process_repeatmasker_v8', args.metrics, args.metrics_interval,
+                         input=args.input, overlap_resolution=args.overlap_resolution,
+                         threads=args.threads, stream=bool(args.stream or args.checkpoint_dir))
+    with metrics:
+        if args.stream or args.checkpoint_dir:
+            try:
+                run_streaming(args, metrics)
+            except ValueError as e:
+                sys.exit(f"Error: {e}")
+        else:
+            run_in_memory(args, metrics)
     
     print("Done!")
 
-
 if __name__ == '__main__':
     main()
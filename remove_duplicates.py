@@ -1,45 +1,109 @@
 import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 from Bio import SeqIO
-from collections import defaultdict
-
-def remove_duplicates(input_file, output_dir):
-    # Dictionaries to store sequences and duplicates
-    seq_dict = defaultdict(list)
-    duplicates = []
-
-    # Read the input FASTA file and populate the dictionary
+import numpy as np
+
+# Bytes of the BLAKE2b digest used as the duplicate key (128 bits)
+DIGEST_SIZE = 16
+
+def sequence_digest(seq):
+    """128-bit digest of a sequence, normalized to upper case without whitespace"""
+    normalized = ''.join(seq.split()).upper()
+    return hashlib.blake2b(normalized.encode(), digest_size=DIGEST_SIZE).digest()
+
+@contextmanager
+def atomic_output(path, mode_source=None):
+    """
+    Open a temporary file next to path for writing and rename it over path
+    only when the block finishes without an error, so readers never see a
+    partly written file. The permissions of mode_source are copied if given,
+    otherwise the file gets the default permissions for new files.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as handle:
+            yield handle
+        if mode_source is not None:
+            shutil.copymode(mode_source, tmp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def first_occurrences(input_file):
+    """
+    First pass of the two-pass mode: digest every record into one compact
+    array and return a boolean mask that is True for the first record of
+    each distinct sequence.
+    """
+    digests = bytearray()
     for record in SeqIO.parse(input_file, "fasta"):
-        seq = str(record.seq)
-        header = record.id
-
-        if seq in seq_dict:
-            # If the sequence is already in the dictionary, mark it as a duplicate
-            duplicates.append(record)
+        digests += sequence_digest(str(record.seq))
+    keys = np.frombuffer(bytes(digests), dtype=f'V{DIGEST_SIZE}')
+    first = np.zeros(len(keys), dtype=bool)
+    first[np.unique(keys, return_index=True)[1]] = True
+    return first
+
+def iter_unique_flags(input_file, two_pass=False):
+    """
+    Yield (record, is_first) for every record, where is_first is False for
+    a repeat of an earlier sequence. The single-pass mode keeps a set of
+    digests; the two-pass mode reads the file twice and holds only 16 bytes
+    per record.
+    """
+    if two_pass:
+        first = first_occurrences(input_file)
+        for i, record in enumerate(SeqIO.parse(input_file, "fasta")):
+            yield record, bool(first[i])
+        return
+    seen = set()
+    for record in SeqIO.parse(input_file, "fasta"):
+        digest = sequence_digest(str(record.seq))
+        if digest in seen:
+            yield record, False
         else:
-            # Otherwise, store the record in the dictionary
-            seq_dict[seq].append(record)
-
-    # Write the unique sequences back to the input file
-    with open(input_file, "w") as output_handle:
-        for records in seq_dict.values():
-            SeqIO.write(records, output_handle, "fasta")
+            seen.add(digest)
+            yield record, True
 
-    # Write the duplicates to the separate file
+def remove_duplicates(input_file, output_dir, two_pass=False):
     output_id = input_file.split('/')[-1].split('_')[2]  # Extract ID from filename
     duplicates_file = f"{output_dir}/duplicated_sequences_{output_id}.pri.fa"
-    with open(duplicates_file, "w") as duplicates_handle:
-        SeqIO.write(duplicates, duplicates_handle, "fasta")
 
+    # Stream unique sequences and duplicates to temporary files, then
+    # replace the input file and the duplicates file in one rename each
+    n_unique = n_duplicates = 0
+    with atomic_output(input_file, mode_source=input_file) as output_handle, \
+            atomic_output(duplicates_file) as duplicates_handle:
+        for record, is_first in iter_unique_flags(input_file, two_pass):
+            if is_first:
+                SeqIO.write(record, output_handle, "fasta")
+                n_unique += 1
+            else:
+                SeqIO.write(record, duplicates_handle, "fasta")
+                n_duplicates += 1
+
+    print(f"Kept {n_unique} unique sequences, removed {n_duplicates} duplicates.")
     print(f"Finished processing. Duplicates saved to {duplicates_file}.")
 
 def main():
     parser = argparse.ArgumentParser(description="Remove exact duplicate sequences from a FASTA file.")
     parser.add_argument('-i', '--input', required=True, help="Path to the input FASTA file.")
     parser.add_argument('-o', '--output_dir', required=True, help="Directory to save the duplicate sequences file.")
+    parser.add_argument('--two-pass', action='store_true',
+                        help="Read the input twice, holding only a 16-byte digest per sequence; for very large libraries.")
     
     args = parser.parse_args()
     
-    remove_duplicates(args.input, args.output_dir)
+    remove_duplicates(args.input, args.output_dir, args.two_pass)
 
 if __name__ == "__main__":
     main()
@@ -51,41 +115,42 @@ Functionality Overview
 Input FASTA File:
 
 The script reads a FASTA file specified via the -i or --input argument.
-It processes each sequence in the file, identifies exact duplicates (sequences with identical nucleotide content), and saves:
-Unique sequences: back to the input file (overwrites it).
+It processes each sequence in the file, identifies exact duplicates (sequences with identical nucleotide content, ignoring case), and saves:
+Unique sequences: back to the input file (replaced atomically once processing finishes).
 Duplicate sequences: to a separate file in a specified output directory.
 Output Files:
 
 Original Input File: Updated to retain only unique sequences.
 Duplicates File: Contains all the duplicate sequences removed from the input file, named duplicated_sequences_<ID>.pri.fa, where <ID> is extracted from the input filename.
 Detailed Breakdown
-remove_duplicates(input_file, output_dir):
+remove_duplicates(input_file, output_dir, two_pass=False):
 
 Step 1: Parse Input File:
 
-Reads all sequences in the input FASTA file using Biopython's SeqIO.
-Stores unique sequences in a dictionary seq_dict (keyed by sequence).
-Tracks duplicate sequences in a list duplicates.
+Streams the sequences in the input FASTA file using Biopython's SeqIO.
+Keys each sequence on a 128-bit BLAKE2b digest of its upper-cased sequence, so only the set of digests is held in memory.
+With --two-pass, a first pass stores the digests in one compact array and marks the first occurrence of each, and a second pass writes the outputs.
 Step 2: Identify Duplicates:
 
-If a sequence is already in seq_dict, it is added to the duplicates list.
-If a sequence is not in seq_dict, it is added as a unique sequence.
+If a sequence's digest has been seen before, the record is a duplicate.
+Otherwise it is the first (unique) copy.
 Step 3: Write Outputs:
 
-Writes the unique sequences back to the input file, overwriting it.
-Writes the duplicate sequences to a new file in the specified output directory.
+Unique sequences and duplicates are streamed to temporary files as they are read.
+The temporary files are then renamed over the input file and the duplicates file, so an interrupted run leaves the input untouched.
 Filename Parsing:
 
 Extracts an identifier (<ID>) from the input filename by splitting it on underscores (_) and taking the third segment (input_file.split('/')[-1].split('_')[2]).
 Example: From path/to/file_GENOME_123_library.fa, it would extract 123.
 Output Files:
 
-Unique Sequences: Overwrites the input FASTA file.
+Unique Sequences: Replace the input FASTA file.
 Duplicates: Saved as duplicated_sequences_<ID>.pri.fa in the specified output directory.
 main():
 
 Uses argparse to parse command-line arguments:
 -i / --input: Path to the input FASTA file.
 -o / --output_dir: Directory where the duplicate sequences file will be saved.
+--two-pass: Read the input twice to minimize memory on very large libraries.
 Calls remove_duplicates() with the parsed arguments.
 """
\ No newline at end of file
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Persistent region index over RepeatMasker .out annotations.
+
+RepeatIndex parses a .out or .out.gz file with the same RepeatRecords parser
+process_repeatmasker_v8.py uses and stores the hits sorted by scaffold and
+start, together with a running maximum of the end coordinate within each
+scaffold. An overlap query is then two binary searches per scaffold: hits
+starting after the query end are cut off on the right, and hits before the
+first position whose running maximum end reaches the query start cannot
+overlap it. Only the rows in between are checked.
+
+The index is saved as a directory of .npy files next to the .out file
+(<file>.idx) and loaded with memory mapping, so a query only reads the pages
+it touches and answers at interactive latency even for whole-genome
+annotations. It records the size and mtime of the .out file it was built
+from and is rebuilt when that changes.
+
+Coordinates of regions and results follow the .out file (1-based,
+inclusive); regions read from BED files are converted from 0-based,
+half-open. Results are written as BED lines, as in process_repeatmasker_v8.
+
+Usage:
+    repeat_index.py -i genome.fa.out.gz -r chr5:1,200,000-1,350,000
+    repeat_index.py -i genome.fa.out.gz -r chr5:1200000 -r chrX
+    repeat_index.py -i genome.fa.out.gz -b insertions.bed -o hits.tsv
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from repeatmasker_records import RepeatRecords, open_gzip
+
+INDEX_VERSION = 1
+# Bits the scaffold code is shifted by when taking the per-scaffold running
+# maximum of hit ends in one pass; ends must stay below 2^40
+SCAFFOLD_SHIFT = 40
+INDEX_COLUMNS = ('score', 'divergence', 'start', 'end', 'strand', 'line_num',
+                 'scaffold', 'repeat_name', 'repeat_class', 'max_end')
+
+
+def index_path(filepath: str) -> str:
+    """Index directory kept next to a .out or .out.gz file"""
+    return filepath + '.idx'
+
+
+def source_key(filepath: str) -> List[int]:
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns, INDEX_VERSION]
+
+
+def parse_region(region: str) -> Tuple[str, int, Optional[int]]:
+    """
+    Parse 'scaffold', 'scaffold:pos' or 'scaffold:start-end' (1-based,
+    inclusive; commas allowed) into (scaffold, start, end). end is None for
+    a whole scaffold. Scaffold names containing ':' are kept whole when the
+    part after the last ':' is not a coordinate.
+    """
+    scaffold, sep, coords = region.rpartition(':')
+    if not sep:
+        return region, 1, None
+    begin, dash, end = coords.replace(',', '').partition('-')
+    try:
+        start = int(begin)
+        stop = int(end) if dash else start
+    except ValueError:
+        return region, 1, None
+    if start < 1 or stop < start:
+        raise ValueError(f"Invalid region {region}")
+    return scaffold, start, stop
+
+
+class RepeatIndex:
+    """
+    Sorted-array interval index over the hits of one .out file.
+
+    `records` holds the hits ordered by scaffold code and start (columns
+    may be memory-mapped), `offsets[code]:offsets[code + 1]` is the row
+    range of scaffold `code`, and `max_end[i]` is the largest end among the
+    rows of the same scaffold up to and including i.
+    """
+    def __init__(self, records: RepeatRecords, offsets: np.ndarray, max_end: np.ndarray,
+                 key: Sequence[int] = None):
+        self.records = records
+        self.offsets = offsets
+        self.max_end = max_end
+        self.key = list(key) if key is not None else None
+        self.scaffold_codes = {name: code for code, name in enumerate(records.scaffolds)}
+
+    @classmethod
+    def build(cls, filepath: str) -> 'RepeatIndex':
+        """Parse a .out or .out.gz file and index its hits"""
+        records = RepeatRecords.read(filepath, keep_lines=False)
+        records = records.take(np.lexsort((records.line_num, records.start, records.scaffold)))
+        if len(records) and int(records.end.max()) >= 1 << SCAFFOLD_SHIFT:
+            raise ValueError(f"Hit end {int(records.end.max())} is too large to index")
+        offsets = np.searchsorted(records.scaffold, np.arange(len(records.scaffolds) + 1))
+        shifted = records.scaffold.astype(np.int64) << SCAFFOLD_SHIFT
+        max_end = np.maximum.accumulate(shifted | records.end) - shifted
+        return cls(records, offsets, max_end, source_key(filepath))
+
+    def save(self, path: str):
+        """Write the index directory, replacing any previous one at path"""
+        parent = os.path.dirname(os.path.abspath(path))
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path), suffix='.tmp')
+        try:
+            for name in INDEX_COLUMNS:
+                values = self.max_end if name == 'max_end' else getattr(self.records, name)
+                np.save(os.path.join(tmp_path, name + '.npy'), values)
+            np.save(os.path.join(tmp_path, 'offsets.npy'), self.offsets)
+            with open(os.path.join(tmp_path, 'tables.json'), 'w') as f:
+                json.dump({'key': self.key,
+                           'scaffolds': self.records.scaffolds,
+                           'repeat_names': self.records.repeat_names,
+                           'repeat_classes': self.records.repeat_classes}, f)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'RepeatIndex':
+        """Open a saved index; the column arrays are memory-mapped"""
+        with open(os.path.join(path, 'tables.json')) as f:
+            tables = json.load(f)
+        if tables['key'] is not None and tables['key'][-1] != INDEX_VERSION:
+            raise ValueError(f"Index {path} was written by an incompatible version")
+        columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                   for name in INDEX_COLUMNS}
+        max_end = columns.pop('max_end')
+        records = RepeatRecords(**columns, scaffolds=tables['scaffolds'],
+                                repeat_names=tables['repeat_names'],
+                                repeat_classes=tables['repeat_classes'])
+        offsets = np.load(os.path.join(path, 'offsets.npy'))
+        return cls(records, offsets, max_end, tables['key'])
+
+    @classmethod
+    def open(cls, filepath: str, path: str = None, rebuild: bool = False) -> 'RepeatIndex':
+        """
+        Load the index of a .out file, building and saving it first if it
+        is missing, was built from a different version of the file, or
+        rebuild is set.
+        """
+        path = path or index_path(filepath)
+        if not rebuild and os.path.isdir(path):
+            try:
+                index = cls.load(path)
+                if index.key == source_key(filepath):
+                    return index
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Ignoring unreadable index {path}: {e}", file=sys.stderr)
+        print(f"Building index: {path}", file=sys.stderr)
+        index = cls.build(filepath)
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Warning: Could not write index {path}: {e}", file=sys.stderr)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def overlap_rows(self, scaffold: str, start: int = 1, end: int = None) -> np.ndarray:
+        """
+        Rows of the hits on scaffold overlapping start..end (1-based,
+        inclusive; end=None for the rest of the scaffold), in start order.
+        """
+        code = self.scaffold_codes.get(scaffold)
+        if code is None:
+            return np.array([], dtype=np.int64)
+        first, last = int(self.offsets[code]), int(self.offsets[code + 1])
+        if end is not None:
+            last = first + int(np.searchsorted(self.records.start[first:last], end, 'right'))
+        lo = first + int(np.searchsorted(self.max_end[first:last], start, 'left'))
+        rows = np.arange(lo, last, dtype=np.int64)
+        return rows[np.asarray(self.records.end[lo:last]) >= start]
+
+    def overlap_pairs(self, scaffolds: Sequence[str], starts: Sequence[int],
+                      ends: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Overlaps of a batch of regions (1-based, inclusive), as parallel
+        arrays of (query position, hit row), sorted by query then hit start.
+        The binary searches run once per scaffold over all its regions.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        codes = np.array([self.scaffold_codes.get(name, -1) for name in scaffolds], dtype=np.int64)
+        lo = np.zeros(len(codes), dtype=np.int64)
+        hi = np.zeros(len(codes), dtype=np.int64)
+        for code in np.unique(codes[codes >= 0]).tolist():
+            queries = np.flatnonzero(codes == code)
+            first, last = int(self.offsets[code]), int(self.offsets[code + 1])
+            hi[queries] = first + np.searchsorted(self.records.start[first:last], ends[queries], 'right')
+            lo[queries] = first + np.searchsorted(self.max_end[first:last], starts[queries], 'left')
+        counts = np.maximum(hi - lo, 0)
+        query_pos = np.repeat(np.arange(len(codes), dtype=np.int64), counts)
+        rows = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts) \
+            + np.repeat(lo, counts)
+        keep = np.asarray(self.records.end[rows]) >= starts[query_pos]
+        return query_pos[keep], rows[keep]
+
+    def query(self, scaffold: str, start: int = 1, end: int = None) -> RepeatRecords:
+        """Hits overlapping a region, as a RepeatRecords store"""
+        return self.records.take(self.overlap_rows(scaffold, start, end))
+
+
+def iter_bed_regions(filepath: str) -> Iterator[Tuple[List[str], str, int, int]]:
+    """
+    Yield (fields, scaffold, start, end) per BED line, with start and end
+    converted to 1-based, inclusive. Header and comment lines are skipped.
+    """
+    with open_gzip(filepath) if filepath.endswith('.gz') else open(filepath) as f:
+        for i, line in enumerate(f, 1):
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            try:
+                yield fields, fields[0], int(fields[1]) + 1, int(fields[2])
+            except (IndexError, ValueError) as e:
+                print(f"Warning: Skipping malformed BED line {i}: {e}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Query RepeatMasker hits overlapping regions through a persistent index')
+    parser.add_argument('-i', '--input', required=True,
+                        help='RepeatMasker .out or .out.gz file')
+    parser.add_argument('-x', '--index',
+                        help='Index directory (default: <input>.idx)')
+    parser.add_argument('-r', '--region', action='append', default=[],
+                        help='Region scaffold[:start[-end]], 1-based inclusive; may be repeated')
+    parser.add_argument('-b', '--bed',
+                        help='BED file of regions; each hit is written after its region\'s BED fields')
+    parser.add_argument('-o', '--output',
+                        help='Output file (default: stdout)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Rebuild the index even if it is current')
+    args = parser.parse_args()
+
+    try:
+        regions = [parse_region(region) for region in args.region]
+    except ValueError as e:
+        parser.error(str(e))
+
+    index = RepeatIndex.open(args.input, args.index, args.rebuild)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for scaffold, start, end in regions:
+            for line in index.query(scaffold, start, end).bed_lines():
+                out.write(line + '\n')
+        if args.bed:
+            bed_regions = list(iter_bed_regions(args.bed))
+            query_pos, rows = index.overlap_pairs([r[1] for r in bed_regions],
+                                                  [r[2] for r in bed_regions],
+                                                  [r[3] for r in bed_regions])
+            hits = index.records.take(rows).bed_lines()
+            for pos, line in zip(query_pos.tolist(), hits):
+                out.write('\t'.join(bed_regions[pos][0]) + '\t' + line + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
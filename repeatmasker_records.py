@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+Columnar record store for RepeatMasker .out annotations.
+
+Instead of one Python object per hit, RepeatRecords keeps one NumPy array
+per column (score, divergence, start, end, strand, line number) and stores
+the scaffold, repeat name and class/family columns as integer codes into
+interned string tables. The original lines can be kept in a single byte
+buffer so .out output is reproduced exactly.
+
+For scripts that only need a few columns, iter_out_batches() tokenizes a
+.out file in large blocks and yields typed column batches.
+read_out_columns() and read_out_table() collect whole columns and can keep
+a columnar .npz cache next to the .out file so later runs skip the text
+parse.
+
+open_gzip() reads and writes gzip files through an external igzip or pigz
+process when one is on the PATH, so inflate/deflate runs outside the Python
+process (and on several cores for pigz compression), and falls back to the
+gzip module otherwise.
+"""
+
+import gzip
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from array import array
+from itertools import chain
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# .out columns, named as in the plotting scripts' DataFrames. 'overlap' is an
+# extra boolean column, True where the line ends with RepeatMasker's '*' flag.
+OUT_COLUMNS = ('SW_score', 'perc_div', 'perc_del', 'perc_ins', 'query_sequence', 'begin', 'end',
+               'left', 'strand', 'matching_repeat', 'repeat_class', 'repeat_pos_begin',
+               'repeat_pos_end', 'repeat_left', 'ID')
+OUT_INT_COLUMNS = {'SW_score', 'begin', 'end', 'repeat_pos_end', 'ID'}
+OUT_FLOAT_COLUMNS = {'perc_div', 'perc_del', 'perc_ins'}
+OUT_BATCH_BYTES = 1 << 22
+# Bump when the tokenizer or the cache layout changes so old caches are reparsed
+OUT_CACHE_VERSION = 1
+# External gzip tools, fastest first, with their decompress and compress
+# arguments. The thread count is substituted for {threads}.
+GZIP_TOOLS = (
+    ('igzip', ['-d', '-c'], ['-c', '-T', '{threads}']),
+    ('pigz', ['-d', '-c', '-p', '{threads}'], ['-c', '-p', '{threads}']),
+)
+GZIP_THREADS = min(4, os.cpu_count() or 1)
+GZIP_BUFFER_BYTES = 1 << 20
+
+
+class _GzipProcess(io.RawIOBase):
+    """Raw stream over an external gzip tool decompressing or compressing one file"""
+    def __init__(self, tool: str, args: List[str], filepath: str, writing: bool):
+        self.tool = tool
+        self.filepath = filepath
+        self.writing = writing
+        self.finished = False
+        if writing:
+            self.output = open(filepath, 'wb')
+            self.proc = subprocess.Popen([tool] + args, stdin=subprocess.PIPE, stdout=self.output,
+                                         stderr=subprocess.PIPE)
+        else:
+            self.output = None
+            self.proc = subprocess.Popen([tool] + args + [filepath], stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+
+    def readable(self) -> bool:
+        return not self.writing
+
+    def writable(self) -> bool:
+        return self.writing
+
+    def readinto(self, buffer) -> int:
+        n = self.proc.stdout.readinto(buffer)
+        if not n and not self.finished:
+            self.finished = True
+            self._check()
+        return n
+
+    def write(self, data) -> int:
+        self.proc.stdin.write(data)
+        return len(data)
+
+    def _check(self):
+        if self.proc.wait() != 0:
+            message = self.proc.stderr.read().decode(errors='replace').strip()
+            raise OSError(f"{os.path.basename(self.tool)} failed on {self.filepath}: {message}")
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.writing:
+                self.proc.stdin.close()
+                self.finished = True
+                self._check()
+            else:
+                self.proc.stdout.close()
+                if not self.finished:
+                    # Closed before EOF: stop the tool instead of checking its status
+                    self.proc.kill()
+                    self.proc.wait()
+        finally:
+            self.proc.stderr.close()
+            if self.output is not None:
+                self.output.close()
+            super().close()
+
+
+def gzip_tool() -> Optional[Tuple[str, List[str], List[str]]]:
+    """(path, decompress args, compress args) of the first GZIP_TOOLS entry on the PATH, or None"""
+    for name, decompress_args, compress_args in GZIP_TOOLS:
+        path = shutil.which(name)
+        if path:
+            return path, decompress_args, compress_args
+    return None
+
+
+def open_gzip(filepath: str, mode: str = 'rt', threads: int = GZIP_THREADS, use_tool: bool = True):
+    """
+    Open a gzip file for reading or writing ('r'/'w', text or binary), through
+    igzip or pigz when available (see GZIP_TOOLS) and the gzip module otherwise
+    """
+    binary_mode = mode.replace('t', '').replace('b', '')
+    tool = gzip_tool() if use_tool and binary_mode in ('r', 'w') else None
+    if tool is None:
+        return gzip.open(filepath, mode)
+    path, decompress_args, compress_args = tool
+    writing = binary_mode == 'w'
+    args = [arg.format(threads=threads) for arg in (compress_args if writing else decompress_args)]
+    raw = _GzipProcess(path, args, filepath, writing)
+    if writing:
+        stream = io.BufferedWriter(raw, GZIP_BUFFER_BYTES)
+    else:
+        stream = io.BufferedReader(raw, GZIP_BUFFER_BYTES)
+    if 't' in mode:
+        return io.TextIOWrapper(stream)
+    return stream
+
+
+def open_repeatmasker(filepath: str, mode: str = 'rt'):
+    """Open a RepeatMasker .out or .out.gz file for reading"""
+    if filepath.endswith('.gz'):
+        return open_gzip(filepath, mode)
+    return open(filepath, mode)
+
+
+def is_out_header(line: str) -> bool:
+    """True for the blank and column header lines at the top of a .out file"""
+    fields = line.split(None, 1)
+    return not fields or not fields[0].isdigit()
+
+
+def iter_out_lines(filepath: str) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, stripped line) for each non-empty line after the header"""
+    with open_repeatmasker(filepath) as f:
+        in_header = True
+        for i, line in enumerate(f, 1):
+            if in_header:
+                if is_out_header(line):
+                    continue
+                in_header = False
+            line = line.strip()
+            if line:
+                yield i, line
+
+
+def out_dtype(column: str):
+    """NumPy dtype of a column yielded by iter_out_batches"""
+    if column in OUT_INT_COLUMNS:
+        return np.int64
+    if column in OUT_FLOAT_COLUMNS:
+        return np.float64
+    if column == 'overlap':
+        return bool
+    return object
+
+
+def _split_out_fields(text: str, first_line: int) -> Tuple[List[str], List[int]]:
+    """
+    Split a block of whole .out lines into a flat list of 15 fields per hit
+    and the hit indices carrying the '*' flag. Lines that would break the
+    column layout are skipped with a warning.
+    """
+    tokens = text.split()
+    stars = []
+    if '*' in text:
+        i = 0
+        try:
+            while True:
+                i = tokens.index('*', i)
+                stars.append(i)
+                i += 1
+        except ValueError:
+            pass
+    # Fast path: one hit per line and every '*' closes a hit
+    if len(tokens) - len(stars) == 15 * text.count('\n') and all(
+            s > k and (s - k) % 15 == 0 for k, s in enumerate(stars)):
+        flagged = [(s - k) // 15 - 1 for k, s in enumerate(stars)]
+        if stars:
+            pieces = []
+            prev = 0
+            for s in stars:
+                pieces.append(tokens[prev:s])
+                prev = s + 1
+            pieces.append(tokens[prev:])
+            tokens = list(chain.from_iterable(pieces))
+        if len(set(flagged)) == len(flagged) and set(tokens[8::15]) <= {'+', 'C'}:
+            return tokens, flagged
+
+    fields_out, flagged = [], []
+    for offset, line in enumerate(text.split('\n')):
+        fields = line.split()
+        if not fields:
+            continue
+        star = len(fields) == 16 and fields[15] == '*'
+        if star:
+            fields.pop()
+        if len(fields) != 15:
+            print(f"Warning: Skipping malformed line {first_line + offset}: "
+                  f"expected 15 fields, found {len(fields)}", file=sys.stderr)
+            continue
+        if fields[8] not in ('+', 'C'):
+            print(f"Warning: Skipping malformed line {first_line + offset}: "
+                  f"unexpected strand {fields[8]}", file=sys.stderr)
+            continue
+        if star:
+            flagged.append(len(fields_out) // 15)
+        fields_out.extend(fields)
+    return fields_out, flagged
+
+
+def _out_batch(text: str, first_line: int, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Typed arrays for the requested columns of a block of whole .out lines"""
+    tokens, flagged = _split_out_fields(text, first_line)
+    batch = {}
+    try:
+        for name in columns:
+            if name == 'overlap':
+                continue
+            values = tokens[OUT_COLUMNS.index(name)::15]
+            if name in OUT_INT_COLUMNS or name in OUT_FLOAT_COLUMNS:
+                batch[name] = np.array(values, dtype=object).astype(out_dtype(name))
+            else:
+                batch[name] = np.array(values, dtype=object)
+    except ValueError:
+        if text.count('\n') == 1:
+            print(f"Warning: Skipping malformed line {first_line}: "
+                  f"non-numeric value in column {name}", file=sys.stderr)
+            return {name: np.array([], dtype=out_dtype(name)) for name in columns}
+        # Bisect the block down to the offending lines
+        lines = text.split('\n')
+        half = len(lines) // 2
+        head = _out_batch('\n'.join(lines[:half]) + '\n', first_line, columns)
+        tail = _out_batch('\n'.join(lines[half:]), first_line + half, columns)
+        return {name: np.concatenate((head[name], tail[name])) for name in columns}
+    if 'overlap' in columns:
+        overlap = np.zeros(len(tokens) // 15, dtype=bool)
+        overlap[flagged] = True
+        batch['overlap'] = overlap
+    return batch
+
+
+def iter_out_batches(filepath: str, columns: Sequence[str] = None,
+                     batch_bytes: int = OUT_BATCH_BYTES) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Yield dicts of column name -> array for a .out or .out.gz file, reading
+    about batch_bytes of input per batch. Columns default to OUT_COLUMNS;
+    integer and float columns are int64/float64 arrays, the rest object
+    arrays of str. The header is skipped, the trailing '*' is reported in the
+    optional 'overlap' column, and malformed lines are skipped with a warning.
+    """
+    columns = OUT_COLUMNS if columns is None else tuple(columns)
+    for name in columns:
+        if name not in OUT_COLUMNS and name != 'overlap':
+            raise ValueError(f"Unknown .out column: {name}")
+    with open_repeatmasker(filepath, 'rb') as f:
+        line_num = 1
+        in_header = True
+        rest = b''
+        while True:
+            data = f.read(batch_bytes)
+            if data:
+                data = rest + data
+                cut = data.rfind(b'\n') + 1
+                if not cut:
+                    rest = data
+                    continue
+                data, rest = data[:cut], data[cut:]
+            elif rest:
+                data, rest = rest + b'\n', b''
+            else:
+                break
+            text = data.decode()
+            if in_header:
+                pos = 0
+                while pos < len(text):
+                    end = text.index('\n', pos) + 1
+                    if not is_out_header(text[pos:end]):
+                        in_header = False
+                        break
+                    pos = end
+                    line_num += 1
+                text = text[pos:]
+            if text:
+                batch = _out_batch(text, line_num, columns)
+                line_num += text.count('\n')
+                if batch and len(next(iter(batch.values()))):
+                    yield batch
+
+
+def out_cache_path(filepath: str) -> str:
+    """Sidecar cache written next to a .out or .out.gz file"""
+    return filepath + '.npz'
+
+
+def _out_cache_key(filepath: str) -> np.ndarray:
+    stat = os.stat(filepath)
+    return np.array([stat.st_size, stat.st_mtime_ns, OUT_CACHE_VERSION], dtype=np.int64)
+
+
+def load_out_cache(filepath: str, columns: Sequence[str]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Columns from the sidecar cache of filepath, or None if there is no
+    cache or it was written for a different size, mtime or cache version.
+    """
+    path = out_cache_path(filepath)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as cache:
+            if not np.array_equal(cache['key'], _out_cache_key(filepath)):
+                return None
+            result = {}
+            for name in columns:
+                if out_dtype(name) is object:
+                    values = np.array(cache[f'{name}_values'].tolist(), dtype=object)
+                    result[name] = values[cache[f'{name}_codes']]
+                else:
+                    result[name] = cache[name]
+            return result
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Ignoring unreadable cache {path}: {e}", file=sys.stderr)
+        return None
+
+
+def write_out_cache(filepath: str, data: Dict[str, np.ndarray]):
+    """
+    Write all columns of filepath (as returned by read_out_columns) to its
+    compressed sidecar cache. String columns are stored as codes into a
+    table of their distinct values. Failure to write only produces a warning.
+    """
+    path = out_cache_path(filepath)
+    arrays = {'key': _out_cache_key(filepath)}
+    for name in OUT_COLUMNS + ('overlap',):
+        if out_dtype(name) is object:
+            interner = Interner()
+            codes = [interner(value) for value in data[name]]
+            arrays[f'{name}_codes'] = np.array(codes, dtype=np.min_scalar_type(max(len(interner) - 1, 0)))
+            arrays[f'{name}_values'] = np.array(interner.values, dtype=str)
+        else:
+            arrays[name] = data[name]
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=os.path.basename(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Warning: Could not write cache {path}: {e}", file=sys.stderr)
+
+
+def read_out_columns(filepath: str, columns: Sequence[str] = None, cache: bool = False,
+                     rebuild_cache: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Read whole columns of a .out or .out.gz file (see iter_out_batches).
+    With cache=True the columns come from the sidecar cache when it is
+    current; otherwise the file is parsed and the cache (re)written.
+    rebuild_cache=True ignores any existing cache.
+    """
+    columns = OUT_COLUMNS if columns is None else tuple(columns)
+    if cache and not rebuild_cache:
+        cached = load_out_cache(filepath, columns)
+        if cached is not None:
+            return cached
+    parse_columns = OUT_COLUMNS + ('overlap',) if cache else columns
+    batches = list(iter_out_batches(filepath, parse_columns))
+    data = {name: np.concatenate([batch[name] for batch in batches])
+            if batches else np.array([], dtype=out_dtype(name)) for name in parse_columns}
+    if cache:
+        write_out_cache(filepath, data)
+    return {name: data[name] for name in columns}
+
+
+def read_out_table(filepath: str, columns: Sequence[str] = None, cache: bool = False,
+                   rebuild_cache: bool = False):
+    """Read a .out or .out.gz file into a pandas DataFrame (see read_out_columns)"""
+    import pandas as pd
+    return pd.DataFrame(read_out_columns(filepath, columns, cache, rebuild_cache))
+
+
+def add_cache_arguments(parser):
+    """Add the --no-cache and --rebuild-cache options shared by the .out readers"""
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Do not read or write the .npz cache next to each .out file')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='Reparse each .out file and overwrite its .npz cache')
+
+
+def map_distinct(func: Callable, *columns) -> np.ndarray:
+    """
+    Call func once per distinct combination of values in the given columns
+    (equal-length arrays or pandas Series) and broadcast the results back
+    to every row as an object array. Missing values are passed through to
+    func like any other value.
+    """
+    import pandas as pd
+    columns = [np.asarray(column, dtype=object) for column in columns]
+    codes, _ = pd.factorize(columns[0], use_na_sentinel=False)
+    for column in columns[1:]:
+        column_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        codes, _ = pd.factorize(codes.astype(np.int64) * len(uniques) + column_codes)
+    first_rows = np.unique(codes, return_index=True)[1]
+    results = np.empty(len(first_rows), dtype=object)
+    results[:] = [func(*(column[row] for column in columns)) for row in first_rows.tolist()]
+    return results[codes]
+
+
+class Interner:
+    """Assigns dense integer codes to strings"""
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __call__(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class RecordBuilder:
+    """Accumulates parsed .out lines into compact arrays"""
+    def __init__(self, keep_lines: bool = True, scaffolds: Interner = None,
+                 repeat_names: Interner = None, repeat_classes: Interner = None):
+        self.score = array('q')
+        self.divergence = array('d')
+        self.start = array('q')
+        self.end = array('q')
+        self.strand = array('b')
+        self.line_num = array('q')
+        self.scaffold = array('i')
+        self.repeat_name = array('i')
+        self.repeat_class = array('i')
+        self.scaffolds = scaffolds if scaffolds is not None else Interner()
+        self.repeat_names = repeat_names if repeat_names is not None else Interner()
+        self.repeat_classes = repeat_classes if repeat_classes is not None else Interner()
+        self.lines = bytearray() if keep_lines else None
+        self.line_ends = array('q')
+
+    def __len__(self) -> int:
+        return len(self.line_num)
+
+    def add(self, line: str, line_num: int) -> str:
+        """
+        Parse one .out line and return its scaffold. Raises IndexError or
+        ValueError on a malformed line without adding anything.
+        """
+        parts = line.split()
+        score = int(parts[0])
+        divergence = float(parts[1])
+        float(parts[2])
+        float(parts[3])
+        scaffold = parts[4]
+        start = int(parts[5])
+        end = int(parts[6])
+        strand = 0 if parts[8] == '+' else 1
+        repeat_name = parts[9]
+        repeat_class = parts[10]
+
+        self.score.append(score)
+        self.divergence.append(divergence)
+        self.start.append(start)
+        self.end.append(end)
+        self.strand.append(strand)
+        self.line_num.append(line_num)
+        self.scaffold.append(self.scaffolds(scaffold))
+        self.repeat_name.append(self.repeat_names(repeat_name))
+        self.repeat_class.append(self.repeat_classes(repeat_class))
+        if self.lines is not None:
+            self.lines += line.encode()
+            self.line_ends.append(len(self.lines))
+        return scaffold
+
+    def build(self) -> 'RepeatRecords':
+        """Return the accumulated rows as a RepeatRecords store"""
+        line_starts = line_ends = None
+        if self.lines is not None:
+            line_ends = np.frombuffer(self.line_ends, dtype=np.int64).copy()
+            line_starts = np.concatenate(([0], line_ends[:-1])).astype(np.int64)
+        return RepeatRecords(
+            score=np.frombuffer(self.score, dtype=np.int64).copy(),
+            divergence=np.frombuffer(self.divergence, dtype=np.float64).copy(),
+            start=np.frombuffer(self.start, dtype=np.int64).copy(),
+            end=np.frombuffer(self.end, dtype=np.int64).copy(),
+            strand=np.frombuffer(self.strand, dtype=np.int8).copy(),
+            line_num=np.frombuffer(self.line_num, dtype=np.int64).copy(),
+            scaffold=np.frombuffer(self.scaffold, dtype=np.int32).copy(),
+            repeat_name=np.frombuffer(self.repeat_name, dtype=np.int32).copy(),
+            repeat_class=np.frombuffer(self.repeat_class, dtype=np.int32).copy(),
+            scaffolds=self.scaffolds.values,
+            repeat_names=self.repeat_names.values,
+            repeat_classes=self.repeat_classes.values,
+            lines=self.lines,
+            line_starts=line_starts,
+            line_ends=line_ends,
+        )
+
+
+class RepeatRecords:
+    """
+    Columnar store of RepeatMasker hits.
+
+    Numeric columns are NumPy arrays; scaffold, repeat_name and repeat_class
+    are int32 codes into the `scaffolds`, `repeat_names` and `repeat_classes`
+    string tables. Strand is 0 for '+' and 1 for 'C'. When lines are kept,
+    row i's original (stripped) line is lines[line_starts[i]:line_ends[i]].
+    """
+    NUMERIC_COLUMNS = ('score', 'divergence', 'start', 'end', 'strand', 'line_num',
+                       'scaffold', 'repeat_name', 'repeat_class')
+
+    def __init__(self, score, divergence, start, end, strand, line_num,
+                 scaffold, repeat_name, repeat_class,
+                 scaffolds: List[str], repeat_names: List[str], repeat_classes: List[str],
+                 lines=None, line_starts=None, line_ends=None):
+        self.score = score
+        self.divergence = divergence
+        self.start = start
+        self.end = end
+        self.strand = strand
+        self.line_num = line_num
+        self.scaffold = scaffold
+        self.repeat_name = repeat_name
+        self.repeat_class = repeat_class
+        self.scaffolds = scaffolds
+        self.repeat_names = repeat_names
+        self.repeat_classes = repeat_classes
+        self.lines = lines
+        self.line_starts = line_starts
+        self.line_ends = line_ends
+
+    @classmethod
+    def read(cls, filepath: str, keep_lines: bool = True) -> 'RepeatRecords':
+        """Read a whole .out or .out.gz file"""
+        builder = RecordBuilder(keep_lines)
+        for line_num, line in iter_out_lines(filepath):
+            try:
+                builder.add(line, line_num)
+            except (IndexError, ValueError) as e:
+                print(f"Warning: Skipping malformed line {line_num}: {e}", file=sys.stderr)
+        return builder.build()
+
+    @classmethod
+    def iter_scaffold_blocks(cls, filepath: str, keep_lines: bool = True) -> Iterator['RepeatRecords']:
+        """
+        Yield one store per contiguous scaffold block of a .out file. String
+        tables are shared between blocks. Raises ValueError if a scaffold's
+        hits are not contiguous in the input.
+        """
+        scaffolds, repeat_names, repeat_classes = Interner(), Interner(), Interner()
+        builder = RecordBuilder(keep_lines, scaffolds, repeat_names, repeat_classes)
+        current = None
+        seen = set()
+        for line_num, line in iter_out_lines(filepath):
+            try:
+                scaffold = line.split(None, 5)[4]
+            except IndexError as e:
+                print(f"Warning: Skipping malformed line {line_num}: {e}", file=sys.stderr)
+                continue
+            if scaffold != current and len(builder):
+                seen.add(current)
+                yield builder.build()
+                builder = RecordBuilder(keep_lines, scaffolds, repeat_names, repeat_classes)
+            if scaffold in seen:
+                raise ValueError(
+                    f"Scaffold {scaffold} reappears at line {line_num}; "
+                    f"streaming needs each scaffold's hits to be contiguous")
+            try:
+                builder.add(line, line_num)
+                current = scaffold
+            except (IndexError, ValueError) as e:
+                print(f"Warning: Skipping malformed line {line_num}: {e}", file=sys.stderr)
+        if len(builder):
+            yield builder.build()
+
+    def __len__(self) -> int:
+        return len(self.line_num)
+
+    def take(self, index, keep_lines: bool = True) -> 'RepeatRecords':
+        """
+        Return a store of the selected rows (index array, slice or boolean
+        mask). With keep_lines=False the lines are dropped, e.g. before
+        sending the store to a worker that only needs the columns.
+        """
+        columns = {name: getattr(self, name)[index] for name in self.NUMERIC_COLUMNS}
+        if keep_lines and self.lines is not None:
+            columns['lines'] = self.lines
+            columns['line_starts'] = self.line_starts[index]
+            columns['line_ends'] = self.line_ends[index]
+        return RepeatRecords(**columns, scaffolds=self.scaffolds,
+                             repeat_names=self.repeat_names,
+                             repeat_classes=self.repeat_classes)
+
+    def __getstate__(self):
+        # Ship only the referenced lines when a subset is pickled to a worker
+        state = self.__dict__.copy()
+        if self.lines is not None:
+            lengths = self.line_ends - self.line_starts
+            state['lines'] = b''.join(self.lines[s:e] for s, e in
+                                      zip(self.line_starts.tolist(), self.line_ends.tolist()))
+            state['line_ends'] = np.cumsum(lengths)
+            state['line_starts'] = state['line_ends'] - lengths
+        return state
+
+    def class_mask(self, predicate: Callable[[str], bool]) -> np.ndarray:
+        """Boolean mask of rows whose class/family string satisfies predicate"""
+        lookup = np.array([predicate(value) for value in self.repeat_classes], dtype=bool)
+        return lookup[self.repeat_class] if len(lookup) else np.zeros(len(self), dtype=bool)
+
+    def class_codes(self, func: Callable[[str], str]) -> Tuple[np.ndarray, List[str]]:
+        """
+        Map the class/family column through func (e.g. class or family
+        extraction), once per distinct value. Returns (codes, values).
+        """
+        interner = Interner()
+        lookup = np.array([interner(func(value)) for value in self.repeat_classes],
+                          dtype=np.int32)
+        codes = lookup[self.repeat_class] if len(lookup) else np.zeros(len(self), dtype=np.int32)
+        return codes, interner.values
+
+    def class_counts(self) -> np.ndarray:
+        """Number of rows per class/family code"""
+        return np.bincount(self.repeat_class, minlength=len(self.repeat_classes))
+
+    def scaffold_ranks(self) -> np.ndarray:
+        """Rank of each scaffold code in scaffold name order"""
+        ranks = np.empty(len(self.scaffolds), dtype=np.int64)
+        ranks[np.argsort(np.array(self.scaffolds, dtype=object), kind='stable')] = \
+            np.arange(len(self.scaffolds))
+        return ranks
+
+    def sort_order(self) -> np.ndarray:
+        """Row order sorted by scaffold name, start and line number"""
+        return np.lexsort((self.line_num, self.start, self.scaffold_ranks()[self.scaffold]))
+
+    def line(self, i: int) -> str:
+        """Original line of row i"""
+        return self.lines[self.line_starts[i]:self.line_ends[i]].decode()
+
+    def out_lines(self) -> Iterator[str]:
+        """Original lines in row order"""
+        lines = self.lines
+        for s, e in zip(self.line_starts.tolist(), self.line_ends.tolist()):
+            yield lines[s:e].decode()
+
+    def bed_lines(self) -> Iterator[str]:
+        """BED lines (scaffold, start, end, name, hit size, strand, class) in row order"""
+        scaffolds, names, classes = self.scaffolds, self.repeat_names, self.repeat_classes
+        strands = ('+', '-')
+        for scaffold, start, end, strand, name, repeat_class in zip(
+                self.scaffold.tolist(), self.start.tolist(), self.end.tolist(),
+                self.strand.tolist(), self.repeat_name.tolist(), self.repeat_class.tolist()):
+            yield (f"{scaffolds[scaffold]}\t{start - 1}\t{end}\t{names[name]}\t"
+                   f"{end - start + 1}\t{strands[strand]}\t{classes[repeat_class]}")
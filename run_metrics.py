@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Structured throughput metrics for the RepeatMasker overlap resolvers.
+
+RunMetrics times the stages of a run (parse, filter, resolve, write),
+counts the input lines read and elements handled, and keeps the largest
+overlap cluster seen. They are written as JSON lines, with the peak RSS, to
+a file or to stderr: a "progress" line at most once per interval while the
+run is counting, and a "summary" line when it finishes. Summaries of many
+runs can be appended to one file and compared to find the genomes that are
+slow or large in a particular stage, without rerunning them under a
+profiler.
+
+Stages nest: time spent in an inner stage is not also charged to the
+stage around it, so a streaming run whose reader is pulled from inside the
+resolve loop still reports parse and resolve time separately. Without a
+destination every call is a no-op, so scripts can use a RunMetrics
+unconditionally.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_INTERVAL = 10.0
+# Counters reported with a per-second rate over the run's wall time
+RATE_COUNTERS = ('lines', 'elements')
+
+
+def peak_rss_mb(who: int = None) -> Optional[float]:
+    """Peak resident set size of this process (or of its reaped children) in MB"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    return usage.ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+class RunMetrics:
+    """
+    Stage timers and counters of one run, written as JSON lines to `path`
+    ('-' for stderr, appended to otherwise) when it is given. `context` is
+    copied into every line, e.g. the input file and resolution mode.
+    """
+    def __init__(self, tool: str, path: str = None, interval: float = METRICS_INTERVAL,
+                 **context):
+        self.tool = tool
+        self.enabled = path is not None
+        self.interval = interval
+        self.context = context
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.largest_cluster = 0
+        self._stack = []
+        self._started = self._switched = time.perf_counter()
+        self._next_emit = self._started + interval
+        self._handle = None
+        if self.enabled:
+            self._handle = sys.stderr if path == '-' else open(path, 'a')
+
+    def _switch(self) -> float:
+        """Charge the time since the last stage change to the innermost stage"""
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._switched
+        self._switched = now
+        return now
+
+    def begin(self, name: str):
+        """Enter stage `name`; the stage it is nested in is paused until end()"""
+        if self.enabled:
+            self._switch()
+            self._stack.append(name)
+
+    def end(self):
+        """Leave the innermost stage"""
+        if self.enabled:
+            self._switch()
+            self._stack.pop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name`, excluding nested stages"""
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        """Yield from items, charging the time spent producing each one to stage `name`"""
+        if not self.enabled:
+            yield from items
+            return
+        items = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, **increments: int):
+        """Add to named counters, e.g. count(lines=n, elements=m)"""
+        if not self.enabled:
+            return
+        for name, value in increments.items():
+            self.counts[name] += value
+        self.maybe_emit()
+
+    def update(self, **values: int):
+        """Set named counters to running totals kept by the caller"""
+        if not self.enabled:
+            return
+        self.counts.update(values)
+        self.maybe_emit()
+
+    def cluster(self, size: int):
+        """Note the size of one resolved overlap cluster"""
+        if size > self.largest_cluster:
+            self.largest_cluster = size
+
+    def maybe_emit(self):
+        """Write a progress line if the interval has passed since the last one"""
+        if self.enabled and time.perf_counter() >= self._next_emit:
+            self.emit('progress')
+
+    def record(self, event: str) -> Dict:
+        """Current state as a JSON-serializable dict"""
+        now = self._switch()
+        elapsed = now - self._started
+        record = {'event': event, 'tool': self.tool, 'pid': os.getpid(),
+                  'time': round(time.time(), 3), 'elapsed': round(elapsed, 3)}
+        record.update(self.context)
+        if self._stack:
+            record['stage'] = self._stack[-1]
+        record['stage_seconds'] = {name: round(seconds, 3) for name, seconds in self.seconds.items()}
+        record.update(self.counts)
+        for name in RATE_COUNTERS:
+            if name in self.counts:
+                record[f"{name}_per_sec"] = round(self.counts[name] / elapsed, 1) if elapsed > 0 else 0.0
+        record['largest_cluster'] = self.largest_cluster
+        if resource is not None:
+            record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+            record['children_peak_rss_mb'] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+        return record
+
+    def emit(self, event: str, **fields):
+        """Write one JSON line now"""
+        if not self.enabled:
+            return
+        record = self.record(event)
+        record.update(fields)
+        self._handle.write(json.dumps(record) + '\n')
+        self._handle.flush()
+        self._next_emit = time.perf_counter() + self.interval
+
+    def close(self, status: str = 'ok'):
+        """Write the summary line and close the destination"""
+        if not self.enabled:
+            return
+        self.emit('summary', status=status)
+        if self._handle is not sys.stderr:
+            self._handle.close()
+        self.enabled = False
+
+    def __enter__(self) -> 'RunMetrics':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close('ok' if exc_type is None else 'error')
+
+
+def add_metrics_arguments(parser):
+    """Add the --metrics and --metrics-interval options shared by the resolvers"""
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Append JSON-lines throughput metrics (stage timers, rates, "
+                             "peak RSS, largest cluster) to FILE, or '-' for stderr")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL,
+                        metavar='SECONDS',
+                        help=f'Seconds between progress lines in --metrics output '
+                             f'(default: {METRICS_INTERVAL:g})')
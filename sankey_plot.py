@@ -1,26 +1,22 @@
 import argparse
-import gzip
-import re
 import pandas as pd
 from collections import defaultdict
 import matplotlib.pyplot as plt
 from matplotlib.sankey import Sankey
 
-def parse_repeatmasker_out(file):
+from repeatmasker_records import add_cache_arguments, read_out_columns
+
+def parse_repeatmasker_out(file, cache=True, rebuild_cache=False):
     data = []
-    with (gzip.open(file, 'rt') if file.endswith('.gz') else open(file, 'r')) as f:
-        for line in f:
-            if re.match(r'\s*\d+', line):  # Skip header and blank lines
-                fields = line.split()
-                repeat_class_family = fields[10]
-                if '/' in repeat_class_family:
-                    repeat_class, repeat_family = repeat_class_family.split('/')
-                else:
-                    repeat_class, repeat_family = repeat_class_family, 'Unknown'
-                data.append({
-                    'class': repeat_class,
-                    'family': repeat_family
-                })
+    for repeat_class_family in read_out_columns(file, ['repeat_class'], cache, rebuild_cache)['repeat_class']:
+        if '/' in repeat_class_family:
+            repeat_class, repeat_family = repeat_class_family.split('/')
+        else:
+            repeat_class, repeat_family = repeat_class_family, 'Unknown'
+        data.append({
+            'class': repeat_class,
+            'family': repeat_family
+        })
     return data
 
 def categorize_repeats(data):
@@ -103,11 +99,12 @@ def main():
     parser = argparse.ArgumentParser(description='Generate a Sankey diagram from RepeatMasker output.')
     parser.add_argument('-r', '--repeatmasker', required=True, help='RepeatMasker .out file (can be gzipped)')
     parser.add_argument('-s', '--sankey', required=False, help='Output Sankey diagram')
+    add_cache_arguments(parser)
 
     args = parser.parse_args()
 
     # Parse the RepeatMasker file
-    repeat_data = parse_repeatmasker_out(args.repeatmasker)
+    repeat_data = parse_repeatmasker_out(args.repeatmasker, args.cache, args.rebuild_cache)
 
     # Categorize the repeat elements
     counts = categorize_repeats(repeat_data)
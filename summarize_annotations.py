@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Scan-once summarizer for per-genome RepeatMasker annotations.
+
+The landscape, pie, proportion and PCA scripts each reread the same
+<ID>_rm.bed and <Species_ID>.fa.out.gz files. This script reads every file
+once and writes the small aggregate tables those scripts need, so they can
+be run with --summary_dir instead of scanning the annotations again:
+
+  landscape_bins.tsv    BED hit bp per landscape TE type and 1% divergence bin
+  class_bp.tsv          BED hit bp per class (pie charts)
+  out_families.tsv      .out hit count, occupancy (end - begin + 1) and
+                        in-range length (end - begin) per class and family
+  summary_settings.tsv  the filters the tables were built with
+
+Every table has a Source column holding the input file's basename.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from repeatmasker_records import Interner, add_cache_arguments, map_distinct, read_out_columns
+
+LANDSCAPE_BINS = 'landscape_bins.tsv'
+CLASS_BP = 'class_bp.tsv'
+OUT_FAMILIES = 'out_families.tsv'
+SETTINGS = 'summary_settings.tsv'
+
+BED_COLUMNS = ['Scaffold', 'Start', 'End', 'TE', 'Hit_size', 'Orientation', 'Class', 'Family', 'Divergence', 'RM_ID']
+OUT_FAMILY_COLUMNS = ['perc_div', 'begin', 'end', 'repeat_class']
+
+# Landscape TE types, in plotting order
+TE_TYPES = ['DNA', 'RC', 'LINE', 'SINE', 'LTR', 'Unknown']
+TE_TYPE_CODES = {te_type: code for code, te_type in enumerate(TE_TYPES)}
+
+
+def classify_te_type(te_name, class_col, family_col):
+    """
+    Classify transposable element based on name and class/family information
+    Returns one of: DNA, RC, LINE, SINE, LTR, Unknown
+    """
+    te_name = str(te_name).upper()
+    class_col = str(class_col).upper()
+    family_col = str(family_col).upper()
+
+    # Simple repeats and satellites - exclude from landscape
+    if 'SIMPLE_REPEAT' in class_col or ')N' in te_name or 'SATELLITE' in class_col:
+        return None
+
+    # LTR retrotransposons
+    if 'LTR' in class_col or 'LTR' in te_name:
+        return 'LTR'
+
+    # LINE elements
+    if 'LINE' in class_col or 'NONLTR' in class_col or 'NON-LTR' in class_col:
+        return 'LINE'
+
+    # SINE elements
+    if 'SINE' in class_col:
+        return 'SINE'
+
+    # DNA transposons
+    if 'DNA' in class_col or 'TIR' in te_name:
+        return 'DNA'
+
+    # Rolling circle (RC) transposons
+    if 'RC' in class_col or 'HELITRON' in class_col:
+        return 'RC'
+
+    # Default to Unknown
+    return 'Unknown'
+
+
+def landscape_bins(df, max_divergence, include_small):
+    """
+    Hit bp per landscape TE type and 1% divergence bin of a BED DataFrame,
+    as a DataFrame with TE_type, Bin_Start and Hit_bp columns. Every cell
+    holding at least one hit is listed, in TE_TYPES and bin order.
+    """
+    # Convert divergence to numeric, handling non-numeric values
+    divergence = pd.to_numeric(df['Divergence'], errors='coerce')
+
+    # Filter by divergence (exclude negative values like -1.0 for simple repeats)
+    keep = (divergence >= 0) & (divergence <= max_divergence)
+
+    # Filter by size if needed
+    if not include_small:
+        keep &= df['Hit_size'] >= 100
+    df = df[keep]
+    divergence = divergence[keep]
+
+    # Classify each distinct TE/Class/Family combination once; -1 marks excluded repeats
+    type_codes = map_distinct(
+        lambda te_name, class_col, family_col: TE_TYPE_CODES.get(classify_te_type(te_name, class_col, family_col), -1),
+        df['TE'], df['Class'], df['Family']
+    ).astype(np.int64)
+
+    # Divergence bins (0-1%, 1-2%, etc.) are the integer part of the divergence
+    n_bins = int(max_divergence) + 1
+    bin_starts = np.floor(divergence.to_numpy()).astype(np.int64)
+    typed = type_codes >= 0
+    cells = type_codes[typed] * n_bins + bin_starts[typed]
+
+    # Sum hit sizes per TE type and bin
+    n_cells = len(TE_TYPES) * n_bins
+    hit_sizes = df['Hit_size'].to_numpy()[typed]
+    hit_bp = np.bincount(cells, weights=hit_sizes, minlength=n_cells)
+    if np.issubdtype(hit_sizes.dtype, np.integer):
+        hit_bp = hit_bp.astype(np.int64)
+    used = np.flatnonzero(np.bincount(cells, minlength=n_cells))
+    return pd.DataFrame({
+        'TE_type': [TE_TYPES[cell] for cell in (used // n_bins).tolist()],
+        'Bin_Start': used % n_bins,
+        'Hit_bp': hit_bp[used],
+    })
+
+
+def landscape_proportions(bins, genome_size):
+    """Nested {TE type: {bin start: % of genome}} from a landscape_bins table"""
+    proportions = {}
+    for te_type, bin_start, bp in zip(bins['TE_type'], bins['Bin_Start'].tolist(), bins['Hit_bp'].to_numpy()):
+        proportions.setdefault(te_type, {})[bin_start] = (bp / genome_size) * 100
+    return proportions
+
+
+def class_bp(df, max_divergence, include_small):
+    """Hit bp per class of a BED DataFrame, filtered as the pie charts are"""
+    if max_divergence > 0:
+        df = df[df['Divergence'] <= max_divergence]
+    if not include_small:
+        df = df[df['Hit_size'] >= 100]
+    totals = df.groupby('Class')['Hit_size'].sum()
+    return pd.DataFrame({'Class': totals.index, 'Hit_bp': totals.to_numpy()})
+
+
+def split_class_family(repeat_class):
+    """(class, family) of a .out class/family field; family is 'Unknown' without a '/'"""
+    parts = repeat_class.split('/')
+    return parts[0], parts[1] if len(parts) > 1 else "Unknown"
+
+
+def out_families(hits, min_threshold=0.0, max_threshold=float('inf')):
+    """
+    Per class and family of .out columns (OUT_FAMILY_COLUMNS): hit count,
+    occupancy (end - begin + 1) and the end - begin length of hits with
+    min_threshold <= divergence < max_threshold. Rows follow the first
+    appearance of each class/family in the file.
+    """
+    class_family = map_distinct(split_class_family, hits['repeat_class'])
+    in_range = (hits['perc_div'] >= min_threshold) & (hits['perc_div'] < max_threshold)
+    df = pd.DataFrame({
+        'Class': [pair[0] for pair in class_family],
+        'Family': [pair[1] for pair in class_family],
+        'Count': 1,
+        'Occupancy_bp': hits['end'] - hits['begin'] + 1,
+        'Range_bp': np.where(in_range, hits['end'] - hits['begin'], 0),
+    })
+    return df.groupby(['Class', 'Family'], sort=False).sum().reset_index()
+
+
+def class_family_totals(families, value_column, te_classes):
+    """
+    ({class: total}, {class: {family: total}}) of value_column over the
+    out_families rows whose class is in te_classes, in row order
+    """
+    class_data = {}
+    family_data = {te_class: {} for te_class in te_classes}
+    for te_class, family, value in zip(families['Class'], families['Family'], families[value_column].tolist()):
+        if te_class in family_data:
+            class_data[te_class] = class_data.get(te_class, 0) + value
+            family_data[te_class][family] = family_data[te_class].get(family, 0) + value
+    return class_data, family_data
+
+
+class MatrixBuilder:
+    """
+    Accumulates (row, column, value) cells of a species-by-feature matrix and
+    materializes the DataFrame once. Rows and columns keep their first-added
+    order; missing cells are 0. A column stays integer only if every row has
+    an integer value for it, as with repeated pd.concat(...).fillna(0).
+    """
+    def __init__(self):
+        self.rows = Interner()
+        self.columns = Interner()
+        self.row_codes = []
+        self.column_codes = []
+        self.values = []
+        self.float_columns = set()
+
+    def add(self, row, values):
+        """Add one row from a {column: value} mapping; the row is kept even if it is empty"""
+        row_code = self.rows(row)
+        for column, value in values.items():
+            column_code = self.columns(column)
+            if not isinstance(value, (int, np.integer)):
+                self.float_columns.add(column_code)
+            self.row_codes.append(row_code)
+            self.column_codes.append(column_code)
+            self.values.append(value)
+
+    def add_frame(self, df):
+        """Add every row and column of a previously built matrix"""
+        column_codes = [self.columns(column) for column in df.columns]
+        for column_code, dtype in zip(column_codes, df.dtypes):
+            if not np.issubdtype(dtype, np.integer):
+                self.float_columns.add(column_code)
+        for row, row_values in zip(df.index, df.to_numpy().tolist()):
+            row_code = self.rows(row)
+            self.row_codes.extend([row_code] * len(column_codes))
+            self.column_codes.extend(column_codes)
+            self.values.extend(row_values)
+
+    def build(self):
+        """Return the accumulated cells as a DataFrame"""
+        shape = (len(self.rows), len(self.columns))
+        row_codes = np.asarray(self.row_codes, dtype=np.int64)
+        column_codes = np.asarray(self.column_codes, dtype=np.int64)
+        matrix = np.zeros(shape)
+        np.add.at(matrix, (row_codes, column_codes), np.asarray(self.values, dtype=np.float64))
+        filled = np.zeros(shape, dtype=bool)
+        filled[row_codes, column_codes] = True
+        df = pd.DataFrame(matrix, index=self.rows.values, columns=self.columns.values)
+        int_columns = [column for code, column in enumerate(self.columns.values)
+                       if code not in self.float_columns and filled[:, code].all()]
+        return df.astype({column: np.int64 for column in int_columns})
+
+
+def read_bed(filename):
+    """Read an RM2bed BED file with the 10 BED_COLUMNS"""
+    df = pd.read_csv(filename, sep='\t', header=None)
+    if len(df.columns) != len(BED_COLUMNS):
+        raise ValueError(f"expected {len(BED_COLUMNS)} columns, found {len(df.columns)}")
+    df.columns = BED_COLUMNS
+    return df
+
+
+def summarize_bed(filename, max_divergence, include_small):
+    """Landscape bins and class bp of one BED file, or None if it cannot be read"""
+    print(f"Summarizing {filename}...")
+    try:
+        df = read_bed(filename)
+    except (OSError, ValueError, pd.errors.ParserError) as e:
+        print(f"Warning: Skipping {filename}: {e}", file=sys.stderr)
+        return None
+    source = os.path.basename(filename)
+    bins = landscape_bins(df, max_divergence, include_small)
+    try:
+        classes = class_bp(df, max_divergence, include_small)
+    except TypeError as e:
+        # The pie charts compare divergence without coercion and skip such files
+        print(f"Warning: No class totals for {filename}: {e}", file=sys.stderr)
+        classes = pd.DataFrame({'Class': [], 'Hit_bp': []})
+    bins.insert(0, 'Source', source)
+    classes.insert(0, 'Source', source)
+    return bins, classes
+
+
+def summarize_out(filename, min_threshold, max_threshold, cache=True, rebuild_cache=False):
+    """Class/family totals of one .out or .out.gz file"""
+    print(f"Summarizing {filename}...")
+    hits = read_out_columns(filename, OUT_FAMILY_COLUMNS, cache, rebuild_cache)
+    families = out_families(hits, min_threshold, max_threshold)
+    families.insert(0, 'Source', os.path.basename(filename))
+    return families
+
+
+def setting_value(value):
+    """Normalized string form of a setting, so 50 and 50.0 compare equal"""
+    if isinstance(value, bool):
+        return str(value)
+    return repr(float(value))
+
+
+def load_summary(summary_dir, table, **expected):
+    """
+    Read one aggregate table from summary_dir. Exits with an error if it
+    was built with different values for any of the given settings.
+    """
+    settings_path = os.path.join(summary_dir, SETTINGS)
+    table_path = os.path.join(summary_dir, table)
+    try:
+        settings = pd.read_csv(settings_path, sep='\t', dtype=str)
+        settings = dict(zip(settings['Setting'], settings['Value']))
+        df = pd.read_csv(table_path, sep='\t', keep_default_na=False, na_values=[''])
+    except (OSError, KeyError) as e:
+        sys.exit(f"Error: Could not read summary table {table_path}: {e}")
+    for name, value in expected.items():
+        if settings.get(name) != setting_value(value):
+            sys.exit(f"Error: {summary_dir} was built with {name}={settings.get(name)}, "
+                     f"but this run uses {value}; rerun summarize_annotations.py")
+    return df
+
+
+def summary_rows(df, source):
+    """Rows of an aggregate table for one input file"""
+    return df[df['Source'] == source].reset_index(drop=True)
+
+
+def run_tasks(calls, num_procs):
+    """Run (func, args) calls, on a process pool if num_procs > 1, and return results in order"""
+    if num_procs <= 1:
+        return [func(*args) for func, args in calls]
+    with ProcessPoolExecutor(max_workers=min(num_procs, len(calls))) as executor:
+        futures = [executor.submit(func, *args) for func, args in calls]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Summarize RM2bed BED and RepeatMasker .out.gz files in one pass for the '
+                    'landscape, pie, proportion and PCA scripts.')
+    parser.add_argument('-b', '--bed_dir', help='Directory containing <ID>_rm.bed files')
+    parser.add_argument('-i', '--out_dir', help='Directory containing .out.gz files')
+    parser.add_argument('-o', '--output_dir', required=True, help='Directory for the summary tables')
+    parser.add_argument('-d', '--divergence', type=float, default=50.0,
+                        help='Maximum divergence for the landscape and pie tables (default: 50)')
+    parser.add_argument('-m', '--minimum100bp', action='store_true',
+                        help='Include BED hits under 100bp (default: exclude them)')
+    parser.add_argument('-t', '--min_threshold', type=float, default=0.0,
+                        help='Minimum divergence for the .out Range_bp column (default: 0)')
+    parser.add_argument('-T', '--threshold', type=float, default=float('inf'),
+                        help='Maximum divergence (exclusive) for the .out Range_bp column (default: none)')
+    parser.add_argument('-p', '--num_procs', type=int, default=1, help='Worker processes (default: 1)')
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.bed_dir and not args.out_dir:
+        parser.error('at least one of --bed_dir and --out_dir is required')
+
+    start_time = time.perf_counter()
+    bed_files = sorted(os.path.join(args.bed_dir, f) for f in os.listdir(args.bed_dir)
+                       if f.endswith('_rm.bed')) if args.bed_dir else []
+    out_files = sorted(os.path.join(args.out_dir, f) for f in os.listdir(args.out_dir)
+                       if f.endswith('.out.gz')) if args.out_dir else []
+    print(f"Found {len(bed_files)} BED files and {len(out_files)} .out.gz files")
+
+    calls = [(summarize_bed, (f, args.divergence, args.minimum100bp)) for f in bed_files]
+    calls += [(summarize_out, (f, args.min_threshold, args.threshold, args.cache, args.rebuild_cache))
+              for f in out_files]
+    results = run_tasks(calls, args.num_procs) if calls else []
+    bed_results = [result for result in results[:len(bed_files)] if result is not None]
+    out_results = results[len(bed_files):]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    tables = {}
+    if args.bed_dir:
+        tables[LANDSCAPE_BINS] = pd.concat([bins for bins, _ in bed_results] or
+                                           [pd.DataFrame(columns=['Source', 'TE_type', 'Bin_Start', 'Hit_bp'])])
+        tables[CLASS_BP] = pd.concat([classes for _, classes in bed_results] or
+                                     [pd.DataFrame(columns=['Source', 'Class', 'Hit_bp'])])
+    if args.out_dir:
+        tables[OUT_FAMILIES] = pd.concat(out_results or [pd.DataFrame(
+            columns=['Source', 'Class', 'Family', 'Count', 'Occupancy_bp', 'Range_bp'])])
+    for name, df in tables.items():
+        df.to_csv(os.path.join(args.output_dir, name), sep='\t', index=False)
+        print(f"Wrote {len(df)} rows to {os.path.join(args.output_dir, name)}")
+
+    settings = pd.DataFrame({
+        'Setting': ['divergence', 'minimum100bp', 'min_threshold', 'threshold'],
+        'Value': [setting_value(args.divergence), setting_value(args.minimum100bp),
+                  setting_value(args.min_threshold), setting_value(args.threshold)],
+    })
+    settings.to_csv(os.path.join(args.output_dir, SETTINGS), sep='\t', index=False)
+    print(f"Summarized {len(bed_results)} BED and {len(out_results)} .out.gz files "
+          f"in {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
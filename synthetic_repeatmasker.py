@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Seeded generator of synthetic RepeatMasker .out and .align files.
+
+The resolvers and plotting scripts are tested and benchmarked on generated
+annotations, since real assemblies cannot be shared. SyntheticConfig sets
+the scale and shape of the data: number and length of scaffolds, hits per
+Mb, the fraction of hits overlapping the previous hit, the Simple_repeat
+fraction, how often the lower-scoring hit of an overlapping pair carries
+RepeatMasker's '*' flag, how many hits are ID-linked fragments of the
+previous TE insertion, and how many concatenated RepeatMasker batches the
+file is made of (IDs restart at 1 in each batch, as RM2bed_hubley.py
+detects).
+
+Output is a pure function of the configuration: every scaffold is drawn
+from its own generator seeded with (seed, scaffold number), so the same
+configuration writes byte-identical files on any machine, and hits are
+generated and written one scaffold (or block) at a time so 50M-line files
+do not need 50M lines of memory.
+
+.out lines use the fixed-width RepeatMasker layout (15 fields, plus '*');
+.align records are the summary line with the 'm_b#s#i#' stage column and
+ID, an ungapped alignment, and the Matrix/Kimura/transition lines, without
+a Kimura line for Simple_repeat hits. With align_body=False only the
+summary and statistics lines are written, which is all the divergence
+readers use. Paths ending in .gz are written gzip-compressed.
+
+Usage:
+    synthetic_repeatmasker.py -o test.fa.out -a test.fa.align -n 100000
+    synthetic_repeatmasker.py -o big.fa.out.gz -n 50000000 --scaffolds 500 --batches 40
+"""
+
+import argparse
+import sys
+from typing import Dict, Iterator, List, NamedTuple, TextIO, Tuple
+
+import numpy as np
+
+from repeatmasker_records import open_gzip
+
+OUT_HEADER = ("   SW   perc perc perc  query          position in query              matching"
+              "           repeat                  position in repeat\n"
+              "score   div. del. ins.  sequence       begin       end        (left)   repeat    "
+              "         class/family          begin   end  (left)      ID\n\n")
+TE_CLASSES = ('LINE/L1', 'LINE/L2', 'LINE/CR1', 'SINE/Alu', 'SINE/MIR', 'SINE/tRNA',
+              'LTR/ERVL', 'LTR/ERV1', 'LTR/Gypsy', 'DNA/hAT-Charlie', 'DNA/TcMar-Tigger',
+              'RC/Helitron', 'Unknown')
+TE_CLASS_WEIGHTS = (0.16, 0.08, 0.05, 0.12, 0.07, 0.04, 0.08, 0.07, 0.06, 0.09, 0.07, 0.03, 0.08)
+SIMPLE_UNITS = ('A', 'T', 'CA', 'TG', 'GA', 'TC', 'AT', 'TTA', 'GAA', 'CCCTAA', 'TTAGGG', 'GAATG')
+ALIGN_MATRIX = '20p41g.matrix'
+ALIGN_WIDTH = 50
+# Hits written per formatting block of a scaffold
+WRITE_BLOCK = 100000
+# Byte translation of 0..3 codes to bases, and of each base to its transition partner
+BASES = b'ACGT'
+TRANSITION = bytes.maketrans(b'ACGT', b'GTAC')
+
+
+class SyntheticConfig(NamedTuple):
+    """Scale and shape of a synthetic annotation; hits=None derives the count from the lengths"""
+    scaffolds: int = 20
+    scaffold_length: int = 5000000
+    hits: int = None
+    hits_per_mb: float = 1800.0
+    overlap_fraction: float = 0.15
+    simple_fraction: float = 0.1
+    star_fraction: float = 0.5
+    joined_fraction: float = 0.1
+    batches: int = 1
+    families: int = 500
+    seed: int = 1
+
+
+class Family(NamedTuple):
+    """Repeat library entry hits are drawn from"""
+    name: str
+    repeat_class: str
+    length: int
+
+
+def make_families(config: SyntheticConfig) -> Tuple[List[Family], List[Family]]:
+    """(TE families, simple repeats) of the configuration's library"""
+    rng = np.random.default_rng([config.seed, 0])
+    classes = rng.choice(len(TE_CLASSES), size=config.families,
+                         p=np.array(TE_CLASS_WEIGHTS) / sum(TE_CLASS_WEIGHTS))
+    lengths = np.clip(rng.lognormal(7.0, 0.9, config.families), 80, 12000).astype(np.int64)
+    families = [Family(f"rnd-{i % 7 + 1}_family-{i + 1}", TE_CLASSES[c], int(n))
+                for i, (c, n) in enumerate(zip(classes.tolist(), lengths.tolist()))]
+    simple = [Family(f"({unit})n", 'Simple_repeat', len(unit)) for unit in SIMPLE_UNITS]
+    return families, simple
+
+
+def scaffold_sizes(config: SyntheticConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """(target lengths, hit counts) of the scaffolds"""
+    rng = np.random.default_rng([config.seed, 1])
+    weights = rng.lognormal(0.0, 0.5, config.scaffolds)
+    weights /= weights.sum()
+    if config.hits is None:
+        lengths = np.maximum(np.round(weights * config.scaffold_length * config.scaffolds), 1000)
+        counts = np.maximum(rng.poisson(lengths * config.hits_per_mb / 1e6), 1)
+    else:
+        # split exactly config.hits hits, largest remainders first
+        share = weights * config.hits
+        counts = np.floor(share).astype(np.int64)
+        counts[np.argsort(counts - share)[:config.hits - counts.sum()]] += 1
+        lengths = np.round(counts * 1e6 / config.hits_per_mb)
+    return lengths.astype(np.int64), counts.astype(np.int64)
+
+
+def scaffold_hits(config: SyntheticConfig, number: int, count: int, length: int,
+                  families: List[Family], simple: List[Family]) -> Dict[str, np.ndarray]:
+    """
+    Columns of the hits on scaffold `number` (1-based), in start order.
+    'joined' marks fragments of the previous insertion; iter_scaffolds
+    turns it into RepeatMasker IDs.
+    """
+    rng = np.random.default_rng([config.seed, 2, number])
+    is_simple = rng.random(count) < config.simple_fraction
+    joined = (rng.random(count) < config.joined_fraction) & ~is_simple
+    joined[0] = False
+
+    family = rng.integers(0, len(families), count)
+    simple_unit = rng.integers(0, len(simple), count)
+    consensus = np.array([f.length for f in families], dtype=np.int64)[family]
+    hit_len = np.where(is_simple, rng.integers(20, 250, count),
+                       np.minimum(np.clip(rng.lognormal(5.4, 0.8, count), 30, None).astype(np.int64),
+                                  consensus))
+    strand_c = (rng.random(count) < 0.5) & ~is_simple
+    div = np.where(is_simple, rng.uniform(0, 25, count), np.clip(rng.gamma(4.0, 4.0, count), 0, 45))
+    dele = np.clip(rng.gamma(1.0, 0.8, count), 0, 15)
+    ins = np.clip(rng.gamma(1.0, 0.8, count), 0, 15)
+
+    # A joined fragment continues the insertion of the nearest preceding
+    # new hit; fragments whose insertion is a simple repeat start their own
+    owner = np.maximum.accumulate(np.where(joined, 0, np.arange(count)))
+    joined &= ~is_simple[owner]
+    owner = np.maximum.accumulate(np.where(joined, 0, np.arange(count)))
+    family = family[owner]
+    consensus = consensus[owner]
+    strand_c = strand_c[owner]
+    # simple repeats are copies of a short unit, so their consensus spans the hit
+    consensus = np.where(is_simple, hit_len, consensus)
+    hit_len = np.minimum(hit_len, consensus)
+
+    # Starts: each hit begins inside the previous hit (overlap) or after a gap,
+    # which is sized so the scaffold keeps its target density
+    overlap = rng.random(count) < config.overlap_fraction
+    overlap[0] = False
+    mean_len = float(hit_len.mean())
+    span = length / count
+    p = config.overlap_fraction
+    mean_gap = max(1.0, (span - p * mean_len / 2) / max(1e-9, 1 - p) - mean_len)
+    prev_len = np.concatenate(([0], hit_len[:-1]))
+    step = np.where(overlap, np.floor(rng.random(count) * np.maximum(prev_len - 1, 1)).astype(np.int64) + 1,
+                    prev_len + rng.geometric(1 / mean_gap, count))
+    start = np.cumsum(step)
+    end = start + hit_len - 1
+    scaffold_len = max(length, int(end.max()) + int(mean_gap))
+
+    # Repeat coordinates: a window of the consensus about as long as the hit
+    rep_len = np.clip(np.round(hit_len * (1 + (dele - ins) / 100)).astype(np.int64), 1, consensus)
+    rep_begin = np.where(is_simple, 1, rng.integers(0, consensus - rep_len + 1) + 1)
+    rep_end = rep_begin + rep_len - 1
+
+    ident = 1 - div / 100
+    score = np.maximum(np.round(hit_len * (ident * 9 - 3.5) * rng.uniform(0.85, 1.15, count)), 12)
+    score = np.where(is_simple, score, np.maximum(score, 225)).astype(np.int64)
+
+    hits = {
+        'score': score, 'div': np.round(div, 1), 'del': np.round(dele, 1), 'ins': np.round(ins, 1),
+        'start': start, 'end': end, 'left': scaffold_len - end, 'strand_c': strand_c,
+        'simple': is_simple, 'family': np.where(is_simple, simple_unit, family),
+        'rep_begin': rep_begin, 'rep_end': rep_end, 'rep_left': consensus - rep_end,
+        'joined': joined, 'kimura': np.where(is_simple, 0.0, div * 1.08 + 0.2),
+    }
+
+    # '*' on the lower-scoring hit of a pair overlapping its predecessor
+    star = np.zeros(count, dtype=bool)
+    pairs = np.flatnonzero((hits['start'][1:] <= hits['end'][:-1])
+                           & (rng.random(count - 1) < config.star_fraction)) + 1
+    star[np.where(hits['score'][pairs] < hits['score'][pairs - 1], pairs, pairs - 1)] = True
+    hits['star'] = star
+    return hits
+
+
+def iter_scaffolds(config: SyntheticConfig) -> Iterator[Tuple[str, Dict[str, np.ndarray]]]:
+    """(scaffold name, hit columns with 'id' and 'batch' set) of each scaffold in order"""
+    families, simple = make_families(config)
+    lengths, counts = scaffold_sizes(config)
+    total = int(counts.sum())
+    batch_size = -(-total // max(1, config.batches))
+    seen = 0
+    next_id = 1
+    for number, (length, count) in enumerate(zip(lengths.tolist(), counts.tolist()), 1):
+        if count == 0:
+            continue
+        hits = scaffold_hits(config, number, count, length, families, simple)
+        # Batch boundaries fall at fixed hit numbers of the whole file; IDs restart there
+        position = seen + np.arange(count)
+        batch = position // batch_size + 1
+        restart = np.flatnonzero(position % batch_size == 0)
+        hits['joined'][restart] = False
+        ids = np.cumsum(~hits['joined'])
+        bounds = sorted(set([0, count] + restart.tolist()))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if position[lo] % batch_size == 0:
+                next_id = 1
+            ids[lo:hi] += next_id - ids[lo]
+            next_id = int(ids[hi - 1]) + 1
+        hits['id'] = ids
+        hits['batch'] = batch
+        seen += count
+        yield f"scaffold_{number}", hits
+
+
+def out_lines(seqname: str, hits: Dict[str, np.ndarray], families: List[Family],
+              simple: List[Family]) -> Iterator[str]:
+    """.out lines of one scaffold's hits"""
+    columns = [hits[name].tolist() for name in
+               ('score', 'div', 'del', 'ins', 'start', 'end', 'left', 'strand_c', 'simple',
+                'family', 'rep_begin', 'rep_end', 'rep_left', 'id', 'star')]
+    for (score, div, dele, ins, start, end, left, strand_c, is_simple, fam,
+         rep_begin, rep_end, rep_left, hit_id, star) in zip(*columns):
+        family = simple[fam] if is_simple else families[fam]
+        if strand_c:
+            repeat = f"{f'({rep_left})':>7} {rep_end:>5} {rep_begin:>6}"
+        else:
+            repeat = f"{rep_begin:>7} {rep_end:>5} {f'({rep_left})':>6}"
+        yield (f"{score:>5d} {div:>6.1f} {dele:>4.1f} {ins:>4.1f}  {seqname:<12} {start:>10d} {end:>9d} "
+               f"{f'({left})':>13} {'C' if strand_c else '+'}  {family.name:<18} "
+               f"{family.repeat_class:<19} {repeat} {hit_id:>7d}{' *' if star else ''}")
+
+
+def write_out(handle: TextIO, config: SyntheticConfig) -> int:
+    """Write a whole .out file; returns the number of hits"""
+    families, simple = make_families(config)
+    handle.write(OUT_HEADER)
+    total = 0
+    for seqname, hits in iter_scaffolds(config):
+        for block in _blocks(hits):
+            handle.write('\n'.join(out_lines(seqname, block, families, simple)) + '\n')
+        total += len(hits['start'])
+    return total
+
+
+def _blocks(hits: Dict[str, np.ndarray]) -> Iterator[Dict[str, np.ndarray]]:
+    count = len(hits['start'])
+    for i in range(0, count, WRITE_BLOCK):
+        yield {name: values[i:i + WRITE_BLOCK] for name, values in hits.items()}
+
+
+def alignment_body(rng: np.random.Generator, seqname: str, subject: str, start: int,
+                   rep_begin: int, rep_end: int, strand_c: bool, length: int,
+                   div: float, unit: str = None) -> Tuple[str, int, int]:
+    """
+    Ungapped alignment block of a hit, in RepeatMasker's 50-column layout,
+    with (transitions, transversions) counts. The consensus is random, or
+    the repeated unit of a simple repeat, and the query carries div%
+    substitutions.
+    """
+    bases = np.frombuffer(BASES, dtype=np.uint8)
+    if unit:
+        consensus = np.frombuffer((unit * (length // len(unit) + 1))[:length].encode(), dtype=np.uint8)
+    else:
+        consensus = bases[rng.integers(0, 4, length)]
+    mutated = rng.random(length) < div / 100
+    transition = mutated & (rng.random(length) < 0.67)
+    transversion = mutated & ~transition
+    query = np.where(transition, np.frombuffer(consensus.tobytes().translate(TRANSITION), dtype=np.uint8),
+                     consensus)
+    query[transversion] = bases[(np.searchsorted(bases, consensus[transversion])
+                                 + rng.choice((1, 3), int(transversion.sum()))) % 4]
+    marks = np.full(length, ord(' '), dtype=np.uint8)
+    marks[transition] = ord('i')
+    marks[transversion] = ord('v')
+    query, consensus, marks = query.tobytes().decode(), consensus.tobytes().decode(), marks.tobytes().decode()
+
+    label = f"C {subject}" if strand_c else f"  {subject}"
+    width = max(len(seqname) + 2, len(label)) + 1
+    lines = []
+    rep_pos = rep_end if strand_c else rep_begin
+    for i in range(0, length, ALIGN_WIDTH):
+        n = min(ALIGN_WIDTH, length - i)
+        rep_step = -n if strand_c else n
+        lines.append(f"{'  ' + seqname:<{width}}{start + i:>10} {query[i:i + n]} {start + i + n - 1}")
+        lines.append(f"{'':<{width + 11}}{marks[i:i + n]}")
+        rep_last = rep_pos + rep_step + (1 if strand_c else -1)
+        lines.append(f"{label:<{width}}{rep_pos:>10} {consensus[i:i + n]} {rep_last}")
+        lines.append('')
+        rep_pos = rep_last + (-1 if strand_c else 1)
+    return '\n'.join(lines) + '\n', int(transition.sum()), int(transversion.sum())
+
+
+def write_align(handle: TextIO, config: SyntheticConfig, align_body: bool = True) -> int:
+    """Write a whole .align file describing the same hits as write_out; returns the number of hits"""
+    families, simple = make_families(config)
+    total = 0
+    for number, (seqname, hits) in enumerate(iter_scaffolds(config), 1):
+        rng = np.random.default_rng([config.seed, 3, number])
+        columns = [hits[name].tolist() for name in
+                   ('score', 'div', 'del', 'ins', 'start', 'end', 'left', 'strand_c', 'simple', 'family',
+                    'rep_begin', 'rep_end', 'rep_left', 'id', 'batch', 'kimura')]
+        chunk = []
+        for i, (score, div, dele, ins, start, end, left, strand_c, is_simple, fam, rep_begin, rep_end,
+                rep_left, hit_id, batch, kimura) in enumerate(zip(*columns)):
+            family = simple[fam] if is_simple else families[fam]
+            subject = f"{family.name}#{family.repeat_class}"
+            if strand_c:
+                repeat = f"C {subject} ({rep_left}) {rep_end} {rep_begin}"
+            else:
+                repeat = f"{subject} {rep_begin} {rep_end} ({rep_left})"
+            chunk.append(f"{score} {div:.2f} {dele:.2f} {ins:.2f} {seqname} {start} {end} ({left}) "
+                         f"{repeat} m_b{batch}s{number:03d}i{i} {hit_id}\n\n")
+            length = end - start + 1
+            if align_body:
+                body, transitions, transversions = alignment_body(
+                    rng, seqname, subject, start, rep_begin, rep_end, strand_c, length, div,
+                    family.name[1:-2] if is_simple else None)
+                chunk.append(body)
+            else:
+                transitions = round(length * div / 100 * 0.67)
+                transversions = round(length * div / 100) - transitions
+            chunk.append(f"Matrix = {'Unknown' if is_simple else ALIGN_MATRIX}\n")
+            if not is_simple:
+                chunk.append(f"Kimura (with divCpGMod) = {kimura:.2f}\n")
+            ratio = transitions / transversions if transversions else 0.0
+            chunk.append(f"Transitions / transversions = {ratio:.2f} ({transitions}/{transversions})\n\n")
+            if len(chunk) >= WRITE_BLOCK:
+                handle.write(''.join(chunk))
+                chunk = []
+        handle.write(''.join(chunk))
+        total += len(hits['start'])
+    return total
+
+
+def open_output(path: str):
+    """Open an output file for writing, gzip-compressed for .gz paths and stdout for '-'"""
+    if path == '-':
+        return sys.stdout
+    return open_gzip(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+
+
+def main():
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description='Write synthetic RepeatMasker .out/.align files')
+    parser.add_argument('-o', '--out', required=True, help='Output .out file (.gz to compress, - for stdout)')
+    parser.add_argument('-a', '--align', help='Also write an .align file describing the same hits')
+    parser.add_argument('-n', '--hits', type=int, default=None,
+                        help='Total number of hits (default: derived from scaffold length and hits per Mb)')
+    parser.add_argument('-s', '--scaffolds', type=int, default=defaults.scaffolds,
+                        help=f'Number of scaffolds (default: {defaults.scaffolds})')
+    parser.add_argument('-l', '--scaffold-length', type=int, default=defaults.scaffold_length,
+                        help=f'Mean scaffold length in bp, ignored with --hits '
+                             f'(default: {defaults.scaffold_length})')
+    parser.add_argument('--hits-per-mb', type=float, default=defaults.hits_per_mb,
+                        help=f'Hit density (default: {defaults.hits_per_mb})')
+    parser.add_argument('--overlap', type=float, default=defaults.overlap_fraction,
+                        help=f'Fraction of hits starting inside the previous hit '
+                             f'(default: {defaults.overlap_fraction})')
+    parser.add_argument('--simple', type=float, default=defaults.simple_fraction,
+                        help=f'Fraction of Simple_repeat hits (default: {defaults.simple_fraction})')
+    parser.add_argument('--star', type=float, default=defaults.star_fraction,
+                        help=f"Fraction of overlapping pairs whose lower-scoring hit is flagged '*' "
+                             f"(default: {defaults.star_fraction})")
+    parser.add_argument('--joined', type=float, default=defaults.joined_fraction,
+                        help=f'Fraction of TE hits sharing the ID of the previous insertion '
+                             f'(default: {defaults.joined_fraction})')
+    parser.add_argument('--batches', type=int, default=defaults.batches,
+                        help='Number of concatenated RepeatMasker batches; IDs restart in each (default: 1)')
+    parser.add_argument('--families', type=int, default=defaults.families,
+                        help=f'Number of TE families in the library (default: {defaults.families})')
+    parser.add_argument('--no-align-body', action='store_true',
+                        help='Write only summary and statistics lines to the .align file')
+    parser.add_argument('--seed', type=int, default=defaults.seed,
+                        help=f'Random seed (default: {defaults.seed})')
+    args = parser.parse_args()
+
+    for name in ('overlap', 'simple', 'star', 'joined'):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name} must be between 0 and 1")
+    if args.scaffolds < 1 or args.batches < 1 or args.families < 1:
+        parser.error("--scaffolds, --batches and --families must be at least 1")
+    if args.hits is not None and args.hits < args.scaffolds:
+        parser.error("--hits must be at least the number of scaffolds")
+
+    config = SyntheticConfig(scaffolds=args.scaffolds, scaffold_length=args.scaffold_length,
+                             hits=args.hits, hits_per_mb=args.hits_per_mb,
+                             overlap_fraction=args.overlap, simple_fraction=args.simple,
+                             star_fraction=args.star, joined_fraction=args.joined,
+                             batches=args.batches, families=args.families, seed=args.seed)
+    out = open_output(args.out)
+    try:
+        total = write_out(out, config)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Wrote {total} hits to {args.out}", file=sys.stderr)
+    if args.align:
+        out = open_output(args.align)
+        try:
+            write_align(out, config, align_body=not args.no_align_body)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Wrote {total} alignments to {args.align}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
-Change this script to add an argument on where to find the .bed files. 
-
 import argparse
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 import sys
-from collections import defaultdict
+import time
+
+from summarize_annotations import (BED_COLUMNS, LANDSCAPE_BINS, landscape_bins, landscape_proportions,
+                                   load_summary, run_tasks, summary_rows)
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -29,6 +32,21 @@ def parse_arguments():
         action='store_true',
         help='Include hits under 100bp (default: exclude them)'
     )
+    parser.add_argument(
+        '-b', '--bed_dir',
+        default='.',
+        help='Directory containing the <ID>_rm.bed files (default: current directory)'
+    )
+    parser.add_argument(
+        '-s', '--summary_dir',
+        help='Read landscape bins from summarize_annotations.py output instead of the BED files'
+    )
+    parser.add_argument(
+        '-p', '--num_procs',
+        type=int,
+        default=1,
+        help='Worker processes for parsing and for rendering (default: 1)'
+    )
     
     return parser.parse_args()
 
@@ -60,42 +78,6 @@ def read_genome_sizes(filename):
     
     return genomes
 
-def classify_te_type(te_name, class_col, family_col):
-    """
-    Classify transposable element based on name and class/family information
-    Returns one of: DNA, RC, LINE, SINE, LTR, Unknown
-    """
-    te_name = str(te_name).upper()
-    class_col = str(class_col).upper()
-    family_col = str(family_col).upper()
-    
-    # Simple repeats and satellites - exclude from landscape
-    if 'SIMPLE_REPEAT' in class_col or ')N' in te_name or 'SATELLITE' in class_col:
-        return None
-    
-    # LTR retrotransposons
-    if 'LTR' in class_col or 'LTR' in te_name:
-        return 'LTR'
-    
-    # LINE elements
-    if 'LINE' in class_col or 'NONLTR' in class_col or 'NON-LTR' in class_col:
-        return 'LINE'
-    
-    # SINE elements
-    if 'SINE' in class_col:
-        return 'SINE'
-    
-    # DNA transposons
-    if 'DNA' in class_col or 'TIR' in te_name:
-        return 'DNA'
-    
-    # Rolling circle (RC) transposons
-    if 'RC' in class_col or 'HELITRON' in class_col:
-        return 'RC'
-    
-    # Default to Unknown
-    return 'Unknown'
-
 def process_bed_file(filename, genome_id, genome_size, max_divergence, include_small):
     """Process a single BED file and return TE landscape data"""
     
@@ -108,45 +90,11 @@ def process_bed_file(filename, genome_id, genome_size, max_divergence, include_s
             print(f"Warning: {filename} has fewer than 10 columns. Skipping.")
             return None
             
-        df.columns = ['Scaffold', 'Start', 'End', 'TE', 'Hit_size', 'Orientation', 'Class', 'Family', 'Divergence', 'RM_ID']
-        
-        # Convert divergence to numeric, handling non-numeric values
-        df['Divergence'] = pd.to_numeric(df['Divergence'], errors='coerce')
-        
-        # Filter by divergence (exclude negative values like -1.0 for simple repeats)
-        df = df[(df['Divergence'] >= 0) & (df['Divergence'] <= max_divergence)]
+        df.columns = BED_COLUMNS
         
-        # Filter by size if needed
-        if not include_small:
-            df = df[df['Hit_size'] >= 100]
-        
-        # Create divergence bins (0-1%, 1-2%, etc.)
-        max_bin = int(max_divergence) + 1
-        bins = list(range(0, max_bin + 1))
-        df['Divergence_Bin'] = pd.cut(df['Divergence'], bins=bins, right=False, include_lowest=True)
-        
-        # Initialize landscape data structure
-        landscape_data = defaultdict(lambda: defaultdict(int))
-        
-        # Process each row
-        for _, row in df.iterrows():
-            te_type = classify_te_type(row['TE'], row['Class'], row['Family'])
-            
-            if te_type:  # Only process if it's a valid TE type
-                bin_label = row['Divergence_Bin']
-                if pd.notna(bin_label):
-                    bin_start = int(bin_label.left)
-                    landscape_data[te_type][bin_start] += row['Hit_size']
-        
-        # Convert to proportions
-        landscape_proportions = {}
-        for te_type in landscape_data:
-            landscape_proportions[te_type] = {}
-            for bin_start in landscape_data[te_type]:
-                proportion = (landscape_data[te_type][bin_start] / genome_size) * 100
-                landscape_proportions[te_type][bin_start] = proportion
-        
-        return landscape_proportions
+        # Bin hit sizes per TE type and 1% divergence bin, then convert to proportions
+        bins = landscape_bins(df, max_divergence, include_small)
+        return landscape_proportions(bins, genome_size)
         
     except FileNotFoundError:
         print(f"Warning: BED file '{filename}' not found for genome {genome_id}")
@@ -155,6 +103,26 @@ def process_bed_file(filename, genome_id, genome_size, max_divergence, include_s
         print(f"Error processing {filename}: {e}")
         return None
 
+def summary_landscape(landscape_table, genome_id, genome_size):
+    """TE landscape data of one genome from a summarize_annotations.py landscape table"""
+    bins = summary_rows(landscape_table, f"{genome_id}_rm.bed")
+    if bins.empty:
+        print(f"Warning: No summarized landscape bins for genome {genome_id}")
+        return None
+    return landscape_proportions(bins, genome_size)
+
+def process_genome(genome_id, genome_info, bed_dir, max_divergence, include_small):
+    """Parse and bin one genome's BED file; runs in a worker process"""
+    bed_filename = os.path.join(bed_dir, f"{genome_id}_rm.bed")
+    print(f"Processing {genome_id} ({bed_filename})...")
+    return process_bed_file(
+        bed_filename,
+        genome_id,
+        genome_info['size'],
+        max_divergence,
+        include_small
+    )
+
 def create_landscape_plot(landscape_data, genome_id, ax, max_divergence):
     """Create a landscape line plot for a single genome"""
     
@@ -381,45 +349,44 @@ def main():
     print(f"Maximum divergence: {args.divergence}")
     print(f"Include hits <100bp: {args.minimum100bp}")
     
-    # Process each genome
-    all_results = {}
-    all_plot_data = {}
-    successful_genomes = []
-    
     output_prefix = "te_landscape"
-    
-    for genome_id, genome_info in genomes.items():
-        bed_filename = f"{genome_id}_rm.bed"
-        print(f"Processing {genome_id} ({bed_filename})...")
-        
-        result = process_bed_file(
-            bed_filename, 
-            genome_id, 
-            genome_info['size'], 
-            args.divergence, 
-            args.minimum100bp
-        )
-        
-        if result:
-            all_results[genome_id] = result
-            successful_genomes.append(genome_id)
-            
-            # Create individual landscape plot
-            print(f"  Creating individual landscape plot for {genome_id}...")
-            plot_data = create_individual_landscape(result, genome_id, output_prefix, args.divergence)
-            all_plot_data[genome_id] = plot_data
+    timings = []
+    
+    # Parse and bin every genome
+    stage_start = time.perf_counter()
+    if args.summary_dir:
+        landscape_table = load_summary(args.summary_dir, LANDSCAPE_BINS,
+                                       divergence=args.divergence, minimum100bp=args.minimum100bp)
+        results = [summary_landscape(landscape_table, genome_id, genome_info['size'])
+                   for genome_id, genome_info in genomes.items()]
+    else:
+        calls = [(process_genome, (genome_id, genome_info, args.bed_dir, args.divergence, args.minimum100bp))
+                 for genome_id, genome_info in genomes.items()]
+        results = run_tasks(calls, args.num_procs)
+    all_results = {genome_id: result for genome_id, result in zip(genomes, results) if result}
+    successful_genomes = list(all_results)
+    timings.append(('Parse and bin', time.perf_counter() - stage_start))
     
     if not all_results:
         print("No data processed successfully.")
         sys.exit(1)
     
-    # Create multipanel landscape plot
-    print(f"\nCreating combined landscape plot with {len(all_results)} samples...")
-    create_combined_landscapes(all_results, output_prefix, args.divergence)
+    # Render the multipanel plot (the slowest, so it starts first) and the individual plots
+    stage_start = time.perf_counter()
+    print(f"\nCreating combined landscape plot with {len(all_results)} samples "
+          f"and {len(all_results)} individual landscape plots...")
+    calls = [(create_combined_landscapes, (all_results, output_prefix, args.divergence))]
+    calls += [(create_individual_landscape, (result, genome_id, output_prefix, args.divergence))
+              for genome_id, result in all_results.items()]
+    rendered = run_tasks(calls, args.num_procs)
+    all_plot_data = dict(zip(successful_genomes, rendered[1:]))
+    timings.append(('Render', time.perf_counter() - stage_start))
     
     # Save landscape tables
+    stage_start = time.perf_counter()
     print("Saving landscape data tables...")
     save_landscape_tables(all_plot_data, output_prefix, args.divergence)
+    timings.append(('Tables', time.perf_counter() - stage_start))
     
     print(f"\nOutput files created:")
     print("- te_landscape_te_landscapes.pdf")
@@ -430,6 +397,10 @@ def main():
     print("- Individual and combined CSV tables")
     
     print(f"\nAnalysis complete! Processed {len(all_results)} samples.")
+    print("\nStage timings:")
+    for stage, seconds in timings:
+        print(f"  {stage:<15}{seconds:8.1f}s")
+    print(f"  {'Total':<15}{sum(seconds for _, seconds in timings):8.1f}s")
 
 if __name__ == "__main__":
     main()
@@ -7,6 +7,8 @@ import numpy as np
 import os
 import sys
 
+from summarize_annotations import CLASS_BP, load_summary, summary_rows
+
 def get_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -20,10 +22,14 @@ def get_args():
     )
     parser.add_argument(
         "-b", "--beddir",
-        required=True,
         type=str,
         help="Directory containing BED files (e.g., /path/to/bed/files/)"
     )
+    parser.add_argument(
+        "-s", "--summary_dir",
+        type=str,
+        help="Read class totals from summarize_annotations.py output instead of the BED files"
+    )
     parser.add_argument(
         "-d", "--divergence", 
         type=int, 
@@ -36,7 +42,10 @@ def get_args():
         help="If entered, count hits under 100 bp. Default is to omit them."
     )
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.beddir and not args.summary_dir:
+        parser.error("one of -b/--beddir and -s/--summary_dir is required")
+    return args
 
 def resolve_label_overlaps(external_labels, min_distance=0.3, max_radius=1.6):
     """
@@ -153,6 +162,13 @@ def process_bed_file(bed_file, genome_size, min_size_bp, max_divergence):
         print(f"  Error processing {bed_file}: {e}")
         return {}
 
+def summary_proportions(class_table, sample_id, genome_size):
+    """Class proportions of one sample from a summarize_annotations.py class table."""
+    classes = summary_rows(class_table, f"{sample_id}_rm.bed")
+    if classes.empty:
+        print(f"  Warning: No summarized classes for {sample_id}. Skipping.")
+    return dict(zip(classes['Class'], (classes['Hit_bp'] / genome_size).tolist()))
+
 def create_pie_chart(proportions_dict, sample_id, output_prefix):
     """Create pie chart for a single sample."""
     
@@ -405,9 +421,13 @@ def main():
     """Main function."""
     args = get_args()
     
-    # Validate BED directory
+    # Validate BED directory, or load the summarized class totals in its place
     bed_dir = args.beddir
-    if not os.path.isdir(bed_dir):
+    class_table = None
+    if args.summary_dir:
+        class_table = load_summary(args.summary_dir, CLASS_BP,
+                                   divergence=args.divergence, minimum100bp=args.minimum100bp)
+    elif not os.path.isdir(bed_dir):
         print(f"Error: BED directory {bed_dir} does not exist")
         sys.exit(1)
     
@@ -418,7 +438,7 @@ def main():
     all_results = {}
     output_prefix = "repeat_analysis"
     
-    print(f"\nBED directory: {bed_dir}")
+    print(f"\nBED directory: {bed_dir}" if class_table is None else f"\nSummary directory: {args.summary_dir}")
     print(f"Processing {len(genome_data)} samples...")
     print(f"Divergence threshold: {args.divergence}")
     print(f"Include hits < 100bp: {args.minimum100bp}\n")
@@ -427,16 +447,19 @@ def main():
         sample_id = row['ID']
         genome_size = row['genome_size']
         
-        # Construct BED file path using the specified directory
-        bed_file = os.path.join(bed_dir, f"{sample_id}_rm.bed")
-        
-        # Process BED file
-        proportions = process_bed_file(
-            bed_file, 
-            genome_size, 
-            args.minimum100bp, 
-            args.divergence
-        )
+        if class_table is not None:
+            proportions = summary_proportions(class_table, sample_id, genome_size)
+        else:
+            # Construct BED file path using the specified directory
+            bed_file = os.path.join(bed_dir, f"{sample_id}_rm.bed")
+            
+            # Process BED file
+            proportions = process_bed_file(
+                bed_file, 
+                genome_size, 
+                args.minimum100bp, 
+                args.divergence
+            )
         
         if proportions:  # Only process if we got data
             # Create individual pie chart
@@ -7,20 +7,16 @@ import gzip
 import re
 import multiprocessing as mp
 
+from repeatmasker_records import add_cache_arguments, read_out_table
+
 class_colors = {
     'DNA': '#1f77b4', 'DIRS': '#ff7f0e', 'LINE': '#2ca02c', 'LTR': '#d62728', 
     'RC': '#9467bd', 'SINE': '#8c564b', 'NonLTR': '#e377c2', 'Satellite': '#7f7f7f', 
     'Unknown': '#bcbd22', 'Other': '#17becf', 'Non-TE': '#000000'
 }
 
-def parse_repeatmasker_outfile(out_file):
-    columns = ['SW_score', 'perc_div', 'perc_del', 'perc_ins', 'query_sequence', 'begin', 'end', 'left', 
-               'strand', 'matching_repeat', 'repeat_class', 'repeat_pos_begin', 'repeat_pos_end', 'repeat_left', 'ID']
-    if out_file.endswith('.gz'):
-        with gzip.open(out_file, 'rt') as f:
-            df = pd.read_csv(f, delim_whitespace=True, skiprows=3, names=columns, engine='python')
-    else:
-        df = pd.read_csv(out_file, delim_whitespace=True, skiprows=3, names=columns, engine='python')
+def parse_repeatmasker_outfile(out_file, cache=True, rebuild_cache=False):
+    df = read_out_table(out_file, ['perc_div', 'begin', 'end', 'repeat_class'], cache, rebuild_cache)
 
     df['TE_class'] = df['repeat_class'].apply(lambda x: x.split('/')[0] if isinstance(x, str) and '/' in x else x)
     df['TE_class'] = df['TE_class'].apply(lambda x: 'Satellite' if x == 'Simple_repeat' else x)
@@ -110,12 +106,13 @@ def main():
     parser.add_argument('--mutation_rate', type=float, help='Mutation rate for calculating time')
     parser.add_argument('--classes', default='all', help='Comma-separated list of TE classes to include (default: all)')
     parser.add_argument('-proc', '--num_procs', type=int, default=1, help='Number of processors to use')
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     selected_classes = args.classes.split(',') if args.classes != 'all' else list(class_colors.keys())
     genome_size = extract_genome_size(args.summary)
     
-    df_out = parse_repeatmasker_outfile(args.repeatmasker)
+    df_out = parse_repeatmasker_outfile(args.repeatmasker, args.cache, args.rebuild_cache)
     process_and_plot(df_out, genome_size, f"{args.output}_out", args.bin_size, args.max_divergence, args.mutation_rate, selected_classes, args.num_procs)
     
     df_bed = parse_bed_file(args.bed)
@@ -8,6 +8,8 @@ import gzip
 import re
 import multiprocessing as mp
 
+from repeatmasker_records import add_cache_arguments, map_distinct, read_out_table
+
 # Define color dictionary for TE classes
 class_colors = {
     'DNA': '#1f77b4', 'DIRS': '#ff7f0e', 'LINE': '#2ca02c', 'LTR': '#d62728', 
@@ -15,20 +17,23 @@ class_colors = {
     'Unknown': '#bcbd22', 'Other': '#17becf', 'Non-TE': '#000000'
 }
 
+# Map a BED class to its plotted TE class
+def bed_te_class(te_class):
+    if not isinstance(te_class, str):
+        return 'Unknown'
+    return 'Satellite' if te_class == 'Simple_repeat' else te_class
+
+# Map a .out class/family to its plotted TE class
+def out_te_class(repeat_class):
+    if isinstance(repeat_class, str) and '/' in repeat_class:
+        repeat_class = repeat_class.split('/')[0]
+    return bed_te_class(repeat_class)
+
 # Function to parse the .out file (supporting .gz)
-def parse_repeatmasker_outfile(out_file):
-    columns = ['SW_score', 'perc_div', 'perc_del', 'perc_ins', 'query_sequence', 'begin', 'end', 'left', 
-               'strand', 'matching_repeat', 'repeat_class', 'repeat_pos_begin', 'repeat_pos_end', 'repeat_left', 'ID']
-    
-    if out_file.endswith('.gz'):
-        with gzip.open(out_file, 'rt') as f:
-            df = pd.read_csv(f, delim_whitespace=True, skiprows=3, names=columns, engine='python')
-    else:
-        df = pd.read_csv(out_file, delim_whitespace=True, skiprows=3, names=columns, engine='python')
+def parse_repeatmasker_outfile(out_file, cache=True, rebuild_cache=False):
+    df = read_out_table(out_file, ['perc_div', 'begin', 'end', 'repeat_class'], cache, rebuild_cache)
 
-    df['TE_class'] = df['repeat_class'].apply(lambda x: x.split('/')[0] if isinstance(x, str) and '/' in x else x)
-    df['TE_class'] = df['TE_class'].apply(lambda x: 'Satellite' if x == 'Simple_repeat' else x)
-    df['TE_class'] = df['TE_class'].apply(lambda x: 'Unknown' if not isinstance(x, str) else x)
+    df['TE_class'] = map_distinct(out_te_class, df['repeat_class'])
     df['insertion_length'] = df['end'] - df['begin']
     
     return df
@@ -39,8 +44,7 @@ def parse_bed_file(bed_file):
     df = pd.read_csv(bed_file, delim_whitespace=True, names=columns)
 
     df['insertion_length'] = df['length']
-    df['TE_class'] = df['TE_class'].apply(lambda x: 'Satellite' if x == 'Simple_repeat' else x)
-    df['TE_class'] = df['TE_class'].apply(lambda x: 'Unknown' if not isinstance(x, str) else x)
+    df['TE_class'] = map_distinct(bed_te_class, df['TE_class'])
     
     return df
 
@@ -95,7 +99,7 @@ def calculate_te_proportions(df, genome_size, bin_size, selected_classes, mutati
         else:
             return 'Other'
 
-    df['TE_class'] = df['TE_class'].apply(categorize_te_class)
+    df['TE_class'] = map_distinct(categorize_te_class, df['TE_class'])
     df = df[df['TE_class'].isin(selected_classes)]
         
     grouped = df.groupby(['binned_div', 'TE_class'])
@@ -166,6 +170,7 @@ def main():
     parser.add_argument('--classes', default='all', help='Comma-separated list of TE classes to include (default: all)')
     #Example alternative to all: --classes DNA,DIRS,LINE,LTR,RC,SINE,NonLTR,Unknown,Other
     parser.add_argument('-proc', '--num_procs', type=int, default=1, help='Number of processors to use')
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     selected_classes = args.classes.split(',') if args.classes != 'all' else list(class_colors.keys())
@@ -173,7 +178,7 @@ def main():
     genome_size = extract_genome_size(args.summary)
     
     # Process .out file
-    df_out = parse_repeatmasker_outfile(args.repeatmasker)
+    df_out = parse_repeatmasker_outfile(args.repeatmasker, args.cache, args.rebuild_cache)
     process_and_plot(df_out, genome_size, f"{args.output}_out", args.bin_size, args.max_divergence, args.spacing, args.mutation_rate, selected_classes, args.num_procs, args.plot_type)
     
     # Process .bed file
@@ -8,6 +8,8 @@ import gzip
 import re
 import multiprocessing as mp
 
+from repeatmasker_records import add_cache_arguments, read_out_table
+
 # Define color dictionary for TE classes
 class_colors = {
     'DNA': '#1f77b4', 'DIRS': '#ff7f0e', 'LINE': '#2ca02c', 'LTR': '#d62728', 
@@ -16,15 +18,8 @@ class_colors = {
 }
 
 # Function to parse the .out file (supporting .gz)
-def parse_repeatmasker_outfile(out_file):
-    columns = ['SW_score', 'perc_div', 'perc_del', 'perc_ins', 'query_sequence', 'begin', 'end', 'left', 
-               'strand', 'matching_repeat', 'repeat_class', 'repeat_pos_begin', 'repeat_pos_end', 'repeat_left', 'ID']
-    
-    if out_file.endswith('.gz'):
-        with gzip.open(out_file, 'rt') as f:
-            df = pd.read_csv(f, delim_whitespace=True, skiprows=3, names=columns, engine='python')
-    else:
-        df = pd.read_csv(out_file, delim_whitespace=True, skiprows=3, names=columns, engine='python')
+def parse_repeatmasker_outfile(out_file, cache=True, rebuild_cache=False):
+    df = read_out_table(out_file, ['perc_div', 'begin', 'end', 'repeat_class'], cache, rebuild_cache)
 
     df['TE_class'] = df['repeat_class'].apply(lambda x: x.split('/')[0] if isinstance(x, str) and '/' in x else x)
     df['TE_class'] = df['TE_class'].apply(lambda x: 'Satellite' if x == 'Simple_repeat' else x)
@@ -61,9 +56,9 @@ def extract_genome_size(summary_file):
     raise ValueError("Genome size (Total Length) not found in the summary file.")
 
 # Function to process either file type (RepeatMasker .out.gz or .bed file)
-def process_file(file_type, input_file):
+def process_file(file_type, input_file, cache=True, rebuild_cache=False):
     if file_type == 'out':
-        return parse_repeatmasker_outfile(input_file)
+        return parse_repeatmasker_outfile(input_file, cache, rebuild_cache)
     elif file_type == 'bed':
         return parse_bed_file(input_file)
     else:
@@ -140,8 +135,8 @@ def plot_te_pie_chart(df, genome_size, output_file):
     plt.savefig(output_file)
 
 # Function to process and plot results based on file type
-def process_and_plot(file_type, input_file, genome_size, output_file_prefix, bin_size, max_divergence, spacing, mutation_rate, selected_classes, num_procs, plot_type):
-    df = process_file(file_type, input_file)
+def process_and_plot(file_type, input_file, genome_size, output_file_prefix, bin_size, max_divergence, spacing, mutation_rate, selected_classes, num_procs, plot_type, cache=True, rebuild_cache=False):
+    df = process_file(file_type, input_file, cache, rebuild_cache)
     
     if plot_type in ['bar', 'both']:
         te_proportions = calculate_te_proportions(df, genome_size, bin_size, selected_classes, mutation_rate, num_procs)
@@ -165,6 +160,7 @@ def main():
     parser.add_argument('-c', '--selected_classes', nargs='+', default=['DNA', 'LINE', 'SINE', 'LTR', 'RC', 'Satellite', 'Unknown'], help='List of TE classes to include in the plot')
     #Example alternative to default: --selected_classes DNA,DIRS,LINE,LTR,RC,SINE,NonLTR,Unknown,Other
     parser.add_argument('--num_procs', type=int, default=1, help='Number of processors for parallel processing')
+    add_cache_arguments(parser)
 
     args = parser.parse_args()
 
@@ -180,7 +176,9 @@ def main():
         mutation_rate=args.mutation_rate,
         selected_classes=args.selected_classes,
         num_procs=args.num_procs,
-        plot_type=args.plot_type
+        plot_type=args.plot_type,
+        cache=args.cache,
+        rebuild_cache=args.rebuild_cache
     )
 
 if __name__ == '__main__':
@@ -7,6 +7,8 @@ from collections import defaultdict
 import numpy as np
 import concurrent.futures
 
+from repeatmasker_records import open_gzip
+
 # Define default TE classes and colors
 TE_CLASSES = ["LINE", "SINE", "LTR", "DIRS", "DNA", "RC", "Unknown", "Satellite", "Simple_repeat", "Other", "NonLTR"]
 COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22", "#17becf", "#aec7e8"]
@@ -31,7 +33,7 @@ def get_genome_size(summary_file):
 
 def read_out_file(out_file, selected_classes):
     data = []
-    with gzip.open(out_file, 'rt') as f:
+    with open_gzip(out_file, 'rt') as f:
         for line in f.readlines()[3:]:  # Skip header lines
             fields = line.strip().split()
             div, start, end, te_class = float(fields[1]), int(fields[5]), int(fields[6]), fields[10].split('/')[0]
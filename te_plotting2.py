@@ -6,6 +6,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 from multiprocessing import Pool
 
+from repeatmasker_records import open_gzip
+
 # Define TE classes and colors
 TE_CLASSES = ["LINE", "SINE", "LTR", "DIRS", "DNA", "RC", "Unknown", "Satellite", "Other", "NonLTR", "Unmasked"]
 COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f", "#bcbd22",
@@ -20,7 +22,7 @@ def parse_summary_file(summary_file):
 
 def parse_repeatmasker_out(rm_file, genome_size, bin_size, classes):
     """Parse the RepeatMasker .out.gz file and calculate TE class proportions."""
-    with gzip.open(rm_file, 'rt') as f:
+    with open_gzip(rm_file, 'rt') as f:
         lines = f.readlines()[3:]  # Skip header
     data = []
     for line in lines:
@@ -2,6 +2,8 @@ import gzip
 import argparse
 import os
 
+from repeatmasker_records import open_gzip
+
 def get_genome_size(summary_file):
     with gzip.open(summary_file, 'rt') as f:
         for line in f:
@@ -14,7 +16,7 @@ def get_genome_size(summary_file):
 
 def parse_repeatmasker(out_file, threshold):
     te_bp = {"LINE": 0, "SINE": 0, "LTR": 0, "DNA": 0, "RC": 0}
-    with gzip.open(out_file, 'rt') as f:
+    with open_gzip(out_file, 'rt') as f:
         for line in f:
             if line.startswith("#") or not line.strip():
                 continue  # Skip headers and empty lines
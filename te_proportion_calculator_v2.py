@@ -2,6 +2,9 @@ import gzip
 import argparse
 import os
 
+from repeatmasker_records import add_cache_arguments, read_out_columns
+from summarize_annotations import OUT_FAMILIES, load_summary, summary_rows
+
 def get_genome_size(summary_file):
     with gzip.open(summary_file, 'rt') as f:
         for line in f:
@@ -12,26 +15,28 @@ def get_genome_size(summary_file):
                         return int(part)
     return 0
 
-def parse_repeatmasker(out_file, min_threshold, max_threshold):
+def parse_repeatmasker(out_file, min_threshold, max_threshold, cache=True, rebuild_cache=False):
     te_bp = {"LINE": 0, "SINE": 0, "LTR": 0, "DNA": 0, "RC": 0}
-    with gzip.open(out_file, 'rt') as f:
-        for line in f:
-            if line.startswith("#") or not line.strip():
-                continue  # Skip headers and empty lines
-            fields = line.split()
-            if len(fields) < 15:
-                continue  # Ensure correct format
-            try:
-                divergence = float(fields[1])
-                te_class = fields[10].split('/')[0]  # Extract TE class
-                te_length = int(fields[6]) - int(fields[5])  # Calculate bp occupied
-                if min_threshold <= divergence < max_threshold and te_class in te_bp:
-                    te_bp[te_class] += te_length  # Add bp occupied to TE class
-            except ValueError:
-                continue  # Skip lines with unexpected formats
+    hits = read_out_columns(out_file, ['perc_div', 'begin', 'end', 'repeat_class'], cache, rebuild_cache)
+    lengths = (hits['end'] - hits['begin']).tolist()  # bp occupied
+    for divergence, repeat_class, te_length in zip(hits['perc_div'].tolist(), hits['repeat_class'], lengths):
+        te_class = repeat_class.split('/')[0]  # Extract TE class
+        if min_threshold <= divergence < max_threshold and te_class in te_bp:
+            te_bp[te_class] += te_length  # Add bp occupied to TE class
+    return te_bp
+
+def summary_repeatmasker(families, out_file):
+    te_bp = {"LINE": 0, "SINE": 0, "LTR": 0, "DNA": 0, "RC": 0}
+    rows = summary_rows(families, os.path.basename(out_file))
+    if rows.empty:
+        return None
+    for te_class, te_length in zip(rows['Class'], rows['Range_bp'].tolist()):
+        if te_class in te_bp:
+            te_bp[te_class] += te_length  # in-range bp summarized per class/family
     return te_bp
 
-def process_files(directory, mapping_file, min_threshold, max_threshold, output_file):
+def process_files(directory, mapping_file, min_threshold, max_threshold, output_file, cache=True, rebuild_cache=False,
+                  summary_dir=None):
     basename = os.path.splitext(output_file)[0]
     output_file_extended = basename + "_extended.tsv" 
     mapping = {}
@@ -41,6 +46,10 @@ def process_files(directory, mapping_file, min_threshold, max_threshold, output_
             fields = line.strip().split('\t')
             mapping[fields[2]] = fields[1]  # Species_ID to Binomial_Species_Name
     
+    families = None
+    if summary_dir:
+        families = load_summary(summary_dir, OUT_FAMILIES, min_threshold=min_threshold, threshold=max_threshold)
+    
     results = []
     extended_results = []
     for species_id in mapping:
@@ -48,7 +57,7 @@ def process_files(directory, mapping_file, min_threshold, max_threshold, output_
         summary_file = os.path.join(directory, f"{species_id}.summary.gz")
         print('Processing:', species_id)
         
-        if not os.path.exists(out_file):
+        if families is None and not os.path.exists(out_file):
             print(out_file, "does not exist")
             continue
         if not os.path.exists(summary_file):
@@ -60,7 +69,13 @@ def process_files(directory, mapping_file, min_threshold, max_threshold, output_
             print("Could not determine genome size for", species_id)
             continue
         
-        te_totals = parse_repeatmasker(out_file, min_threshold, max_threshold)
+        if families is not None:
+            te_totals = summary_repeatmasker(families, out_file)
+            if te_totals is None:
+                print(out_file, "is not in", summary_dir)
+                continue
+        else:
+            te_totals = parse_repeatmasker(out_file, min_threshold, max_threshold, cache, rebuild_cache)
         for te_class, total_bp in te_totals.items():
             proportion = total_bp / genome_size if genome_size > 0 else 0
             results.append([mapping[species_id], te_class, proportion])
@@ -83,9 +98,12 @@ def main():
     parser.add_argument("-T", "--threshold", type=float, required=True, help="Maximum divergence threshold")
     parser.add_argument("-t", "--min_threshold", type=float, default=0.0, help="Minimum divergence threshold (default: 0)")
     parser.add_argument("-o", "--output_file", required=True, help="Output TSV file")
+    parser.add_argument("-s", "--summary_dir", help="Read class totals from summarize_annotations.py output instead of the .out.gz files")
+    add_cache_arguments(parser)
     args = parser.parse_args()
     
-    process_files(args.directory, args.mapping_file, args.min_threshold, args.threshold, args.output_file)
+    process_files(args.directory, args.mapping_file, args.min_threshold, args.threshold, args.output_file,
+                  args.cache, args.rebuild_cache, args.summary_dir)
 
 if __name__ == "__main__":
     main()
@@ -8,9 +8,8 @@ based on classification information provided in a TSV file and a key mapping fil
 
 import argparse
 import sys
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+
+from fasta_index import FastaIndex, write_fasta
 
 def parse_arguments():
     """Parse command line arguments"""
@@ -146,9 +145,11 @@ def modify_header(original_header, te_class, key_mapping):
 def process_sequences(input_fasta, classifications, key_mapping):
     """
     Process all sequences and determine which headers need modification.
+    Only headers are read here; each sequence is a (header, entry) pair
+    whose sequence stays in the indexed FASTA file.
     
     Returns:
-        tuple: (modified_sequences, unmodified_sequences, all_sequences)
+        tuple: (fasta_index, modified_sequences, unmodified_sequences, all_sequences)
     """
     modified_sequences = []
     unmodified_sequences = []
@@ -158,9 +159,10 @@ def process_sequences(input_fasta, classifications, key_mapping):
     unmodified_count = 0
     
     try:
-        for record in SeqIO.parse(input_fasta, "fasta"):
-            original_header = record.description
-            original_id = record.id
+        fasta = FastaIndex(input_fasta, persist=False)
+        for entry in fasta.entries:
+            original_header = entry.description
+            record = (original_header, entry)
             
             # Check if this sequence needs modification
             if original_header in classifications:
@@ -169,12 +171,8 @@ def process_sequences(input_fasta, classifications, key_mapping):
                 # Modify the header
                 new_header = modify_header(original_header, te_class, key_mapping)
                 
-                # Create new record with modified header
-                new_record = SeqRecord(
-                    record.seq,
-                    id=new_header.split()[0],
-                    description=new_header
-                )
+                # Same sequence under the modified header
+                new_record = (new_header, entry)
                 
                 modified_sequences.append(new_record)
                 all_sequences.append(new_record)
@@ -193,7 +191,7 @@ def process_sequences(input_fasta, classifications, key_mapping):
         print(f"  Unmodified sequences: {unmodified_count}")
         print(f"  Total sequences: {modified_count + unmodified_count}")
         
-        return modified_sequences, unmodified_sequences, all_sequences
+        return fasta, modified_sequences, unmodified_sequences, all_sequences
         
     except FileNotFoundError:
         print(f"Error: Input FASTA file '{input_fasta}' not found.")
@@ -202,11 +200,13 @@ def process_sequences(input_fasta, classifications, key_mapping):
         print(f"Error processing sequences: {e}")
         sys.exit(1)
 
-def write_fasta_file(sequences, output_file, description=""):
-    """Write sequences to a FASTA file"""
+def write_fasta_file(fasta, sequences, output_file, description=""):
+    """Write (header, entry) sequences to a FASTA file, reading each sequence from the index"""
     try:
         if sequences:
-            SeqIO.write(sequences, output_file, "fasta")
+            with open(output_file, 'w', buffering=1 << 20) as handle:
+                for header, entry in sequences:
+                    write_fasta(handle, header, fasta.sequence(entry))
             print(f"Wrote {len(sequences)} sequences to {output_file}")
         else:
             print(f"Warning: No sequences to write to {output_file}")
@@ -235,7 +235,7 @@ def main():
     
     # Process sequences
     print("\nStep 3: Processing sequences...")
-    modified_seqs, unmodified_seqs, all_seqs = process_sequences(
+    fasta, modified_seqs, unmodified_seqs, all_seqs = process_sequences(
         args.input_fasta, 
         classifications, 
         key_mapping
@@ -243,9 +243,10 @@ def main():
     
     # Write output files
     print("\nStep 4: Writing output files...")
-    write_fasta_file(modified_seqs, args.modified_fasta, "modified sequences")
-    write_fasta_file(unmodified_seqs, args.unmodified_fasta, "unmodified sequences")
-    write_fasta_file(all_seqs, args.all_fasta, "all sequences")
+    with fasta:
+        write_fasta_file(fasta, modified_seqs, args.modified_fasta, "modified sequences")
+        write_fasta_file(fasta, unmodified_seqs, args.unmodified_fasta, "unmodified sequences")
+        write_fasta_file(fasta, all_seqs, args.all_fasta, "all sequences")
     
     print("\n" + "=" * 60)
     print("Processing complete!")
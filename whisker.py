@@ -6,14 +6,12 @@ import argparse
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def parse_repeatmasker_file(file):
+from repeatmasker_records import add_cache_arguments, read_out_table
+
+def parse_repeatmasker_file(file, cache=True, rebuild_cache=False):
     """Parse a RepeatMasker .out.gz file and extract relevant information."""
-    with gzip.open(file, 'rt') as f:
-        # Read the file into a DataFrame, skipping the initial header lines.
-        df = pd.read_csv(f, sep=r'\s+', header=None, skiprows=3,
-                         names=['score', 'div.', 'del.', 'ins.', 'sequence', 'begin', 'end', 'left', 
-                                'strand', 'matching', 'class/family', 'begin_R', 'end_R', 'left_R', 'ID'])
-    return df
+    df = read_out_table(file, ['SW_score', 'perc_div', 'repeat_class'], cache, rebuild_cache)
+    return df.rename(columns={'SW_score': 'score', 'perc_div': 'div.', 'repeat_class': 'class/family'})
 
 def parse_summary_file(file):
     """Extract total length from a RepeatMasker summary file."""
@@ -29,13 +27,14 @@ def load_mapping_file(mapping_file):
     mapping_df = pd.read_csv(mapping_file, sep='\t')
     return dict(zip(mapping_df['Species_ID'], mapping_df['Taxonomic_Family']))
 
-def process_repeatmasker_files(directory, species_to_family, total_length, output_prefix):
+def process_repeatmasker_files(directory, species_to_family, total_length, output_prefix,
+                               cache=True, rebuild_cache=False):
     """Process all RepeatMasker .out.gz files in a given directory and generate plots for each species."""
     all_files = glob.glob(os.path.join(directory, "*.out.gz"))
 
     for file in all_files:
         print(f"Processing {file}...")
-        df = parse_repeatmasker_file(file)
+        df = parse_repeatmasker_file(file, cache, rebuild_cache)
 
         # Extract species ID from filename and map to taxonomic family.
         species_id = os.path.basename(file).split('.')[0].lstrip('m')[:6]
@@ -110,6 +109,7 @@ def main():
     parser.add_argument("-m", "--mapping", required=True, help="Mapping file of species to taxonomic families.")
     parser.add_argument("-d", "--directory", required=True, help="Directory containing RepeatMasker .out.gz files.")
     parser.add_argument("-o", "--output", required=True, help="Output prefix for the plots.")
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     # Load species to family mapping.
@@ -127,7 +127,8 @@ def main():
         return
 
     # Pass args.output to the processing function
-    process_repeatmasker_files(args.directory, species_to_family, total_length, args.output)
+    process_repeatmasker_files(args.directory, species_to_family, total_length, args.output,
+                               args.cache, args.rebuild_cache)
 
 if __name__ == "__main__":
     main()